@@ -1,9 +1,25 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime, timedelta
+import hashlib
+import math
+import os
+
+from forecast_core import (
+    PRESETS, add_operating_profit, ai_monthly_table, annual_elasticity_matrix, annual_totals, build_forecast,
+    clean_dataframe, compute_economics, elasticity_cube, elasticity_pairs, fit_response_curves, forecast_dates, forecast_uncertainty, generate_demo_data, grid_values,
+    historical_growth, memory_footprint, optimize_budget, optimize_dtypes, score_months, seasonal_table,
+    simulate_forecast, suggest_saturation, sweep_scenarios, weekly_elasticity, yoy_growth
+)
+from forecast_charts import (
+    DEFAULT_MAX_POINTS, channel_chart_png, elasticity_heatmap_png, forecast_chart_png, optimizer_chart_png, returns_chart_png,
+    saturation_curve_png, saturation_scatter_png, sweep_heatmap_png
+)
+from forecast_cache import file_content_hash, load_cleaned
+from forecast_shared import cache_stats, get_aggregate, get_dataset
+from forecast_profiling import (
+    cprofile_dump, cprofile_text, finish_profile, lap, profile_csv, profile_json, start_profile, stop_profile
+)
 
 # 1. CONFIGURAZIONE PAGINA
 st.set_page_config(page_title="Forecasting Strategico Pro - DEMO", layout="wide")
@@ -37,135 +53,156 @@ if 'meta_scale' not in st.session_state: st.session_state.meta_scale = 1.0
 if 'sat_val' not in st.session_state: st.session_state.sat_val = 0.85
 if 'is_demo_loaded' not in st.session_state: st.session_state.is_demo_loaded = False
 if 'last_uploaded_file' not in st.session_state: st.session_state.last_uploaded_file = None
-
-# --- FUNZIONI DI UTILITÀ ---
-
-def clean_currency_us(column):
-    if column is None: return 0
-    s = column.astype(str)
-    s = s.str.replace('€', '', regex=False).str.strip()
-    s = s.str.replace(',', '', regex=False) 
-    return pd.to_numeric(s, errors='coerce').fillna(0)
-
-def parse_iso_week(week_str):
-    try:
-        week_str = str(week_str).strip()
-        if len(week_str) < 6: return pd.NaT
-        year = int(week_str[:4])
-        week = int(week_str[4:])
-        return datetime.fromisocalendar(year, week, 1) 
-    except:
-        return pd.NaT
-
-def get_week_range_label_with_year(date):
-    if pd.isna(date): return ""
-    start = date
-    end = date + timedelta(days=6)
-    return f"{start.strftime('%d %b')} - {end.strftime('%d %b %Y')}"
-
-def clean_percentage(val):
-    if pd.isna(val): return 0.0
-    s = str(val).replace('%', '').strip()
-    try: return float(s)
-    except: return 0.0
-
-def generate_demo_data():
-    """Genera dati casuali ma realistici per la demo (2020-2026)."""
-    # Impostiamo date fisse dal 2020 al 2026
-    start_date = datetime(2020, 1, 1)
-    end_date = datetime(2026, 5, 31)
-    dates = pd.date_range(start=start_date, end=end_date, freq='W-MON')
-    
-    data = []
-    
-    # 1. Stagionalità Settimanale (Week 1-53) - Clonato dal CSV reale
-    # Notiamo: Q1 basso, Picco estivo (Week 26-28), Picco enorme Q4 (Black Friday Week 47-48)
-    seasonal_profile = {
-        1: 0.8, 2: 0.7, 3: 0.6, 4: 0.6, 5: 0.5, 6: 0.5, 7: 0.5, 8: 0.55, 9: 0.6, 10: 0.6,
-        11: 0.65, 12: 0.7, 13: 0.75, 14: 0.8, 15: 0.8, 16: 0.8, 17: 0.85, 18: 0.9, 19: 0.9, 20: 0.95,
-        21: 1.0, 22: 1.05, 23: 1.1, 24: 1.15, 25: 1.2, 26: 1.3, 27: 1.4, 28: 1.3, 29: 1.1, 30: 1.0,
-        31: 0.9, 32: 0.8, 33: 0.7, 34: 0.7, 35: 0.8, 36: 0.9, 37: 0.95, 38: 1.0, 39: 1.0, 40: 1.05,
-        41: 1.1, 42: 1.15, 43: 1.2, 44: 1.4, 45: 1.8, 46: 2.5, 47: 4.5, 48: 3.8, 49: 3.2, 50: 2.5,
-        51: 1.5, 52: 1.0, 53: 0.9
-    }
-
-    # 2. Trend Annuale Non-Lineare (Fattore moltiplicativo base)
-    yearly_trend = {
-        2020: 1.0,
-        2021: 1.4,  # Boom post-2020
-        2022: 1.3,  # Assestamento/Calo
-        2023: 1.5,  # Ripresa
-        2024: 1.7,  # Crescita solida
-        2025: 1.9,  # Crescita continua
-        2026: 2.1   # Proiezione
-    }
-
-    base_sales = 5000.0 # Valore base settimanale
-    
-    for d in dates:
-        year = d.year
-        week = d.isocalendar().week
-        
-        s_fact = seasonal_profile.get(week, 1.0)
-        y_fact = yearly_trend.get(year, 1.0)
-        
-        # Randomicità controllata
-        noise = np.random.uniform(0.9, 1.1)
-        
-        # Calcolo Vendite Totali
-        total_sales = base_sales * s_fact * y_fact * noise
-        
-        # Spesa Ads (Segue le vendite ma con efficienza variabile)
-        # Quando il fatturato esplode (Black Friday), il ROAS sale ma il CPM costa di più
-        marketing_pressure = 0.20 # 20% del fatturato va in ads di media
-        if s_fact > 2.0: marketing_pressure = 0.15 # Efficienza sale nei picchi
-        
-        total_spend = total_sales * marketing_pressure * np.random.uniform(0.95, 1.05)
-        
-        # Split Google/Meta (Google prende più brand search nei picchi)
-        google_share = 0.40
-        if s_fact > 1.5: google_share = 0.50
-        
-        g_cost = total_spend * google_share
-        m_cost = total_spend * (1 - google_share)
-        
-        # KPI Derivati
-        aov = 120.0 + np.random.uniform(-10, 10)
-        orders = int(total_sales / aov)
-        
-        # Resi (più alti dopo i picchi)
-        return_rate = 0.12
-        if week in [1, 2, 3, 4, 5]: return_rate = 0.25 # Gennaio resi alti
-        returns = - (total_sales * return_rate * np.random.uniform(0.8, 1.2))
-        
-        discounts = - (total_sales * 0.05) if s_fact < 2 else - (total_sales * 0.15) # Più sconti nei picchi
-        
-        # ROAS Simulato
-        roas_g = (total_sales * 0.6) / g_cost if g_cost > 0 else 0
-        roas_m = (total_sales * 0.5) / m_cost if m_cost > 0 else 0
-        
-        data.append({
-            'Year Week': f"{year}{week:02d}",
-            'Cost': g_cost,
-            'Amount Spent': m_cost,
-            'Total sales': total_sales,
-            'Returns': returns,
-            'Discounts': discounts,
-            'Average order value': aov,
-            'Orders': orders,
-            'Returning customer rate': f"{np.random.randint(12, 28)}%",
-            'Conversions Value': g_cost * roas_g,
-            'Website Purchases Conversion Value': m_cost * roas_m,
-            'Avg. CPC': 0.85,
-            'CPC (All)': 0.65,
-            'CPM (Cost per 1,000 Impressions)': 12.50,
-            'Impressions': int(m_cost / 12.50 * 1000),
-            'Frequency': 1.2,
-            'Items': int(orders * 1.5),
-            'Gross sales': total_sales - discounts
-        })
-        
-    return pd.DataFrame(data)
+if 'profiling' not in st.session_state: st.session_state.profiling = os.environ.get('FORECAST_PROFILE', '0') not in ('', '0')
+if 'profiling_cprofile' not in st.session_state: st.session_state.profiling_cprofile = False
+
+# Profilazione per fase (opzionale): ogni lap() chiude la fase precedente, il pannello è in fondo alla sidebar
+stop_profile(st.session_state.get('open_profile'))  # rerun precedente interrotto prima di finish_profile
+prof = st.session_state.open_profile = start_profile(st.session_state.profiling, st.session_state.profiling_cprofile)
+
+# --- CARICAMENTO IN CACHE (la logica di calcolo è in forecast_core.py) ---
+
+def load_and_clean(data_key, file_hash, source, compact=True, stream=False):
+    """Lettura + pulizia del CSV, condivisa tra le sessioni per hash del contenuto (forecast_shared.py).
+
+    Il server tiene una sola copia della tabella pulita per file, anche con più persone sullo stesso export;
+    ogni sessione ne riceve una copia superficiale. Sotto c'è la cache su disco (forecast_cache.py):
+    dopo un riavvio riaprire lo stesso export salta parsing e pulizia. Con `compact` la tabella ha tipi
+    compatti (optimize_dtypes); con `stream` il file è letto a blocchi e ridotto subito a settimane
+    (forecast_stream.py), con una barra di avanzamento.
+    """
+    def load():
+        if stream:
+            bar = st.progress(0.0, text="Lettura a blocchi...")
+            progress = lambda frac, rows: bar.progress(frac, text=f"Lettura a blocchi: {rows:,} righe ({frac:.0%})")
+            df, cols, _ = load_cleaned(source, file_hash=file_hash, stream=True, progress=progress)
+            bar.empty()
+        else:
+            with st.spinner("Caricamento e pulizia dati..."):
+                df, cols, _ = load_cleaned(source, file_hash=file_hash)
+        return (optimize_dtypes(df) if compact else df), cols
+    return get_dataset(data_key, load)
+
+def load_demo_data(data_key, seed, freq='W', compact=True):
+    """Dati DEMO già puliti: stesso seed, stessi dati (e nessuna rigenerazione a ogni rerun).
+
+    Con `freq='D'` i dati sono giornalieri e passano dall'aggregazione settimanale della pulizia.
+    """
+    def load():
+        df, cols = clean_dataframe(generate_demo_data(seed=seed, freq=freq))
+        return (optimize_dtypes(df) if compact else df), cols
+    return get_dataset(data_key, load)
+
+# --- AGGREGATI CONDIVISI: dipendono solo dallo storico (non dalla sidebar), uno per dataset nel processo ---
+
+def history_stats(data_key, df):
+    """Totali annui, saturazione suggerita e trend YoY."""
+    def compute():
+        df_annual = annual_totals(df)
+        return df_annual, float(suggest_saturation(df_annual)), yoy_growth(df)
+    return get_aggregate(data_key, 'history_stats', compute)
+
+def elasticity_tables(data_key, df):
+    """Cubo anno x settimana ISO, riepilogo annuale e matrice di tutte le coppie."""
+    def compute():
+        cube = elasticity_cube(df)
+        return cube, elasticity_pairs(cube), annual_elasticity_matrix(cube)
+    return get_aggregate(data_key, 'elasticity', compute)
+
+def apply_preset(name, suggested_saturation):
+    """Copia nello session_state i valori di uno scenario di forecast_core.PRESETS.
+
+    Va chiamata prima che gli slider vengano creati nel rerun corrente: come callback `on_click` dei
+    pulsanti o, al primo caricamento, prima della sidebar. Così non serve un secondo st.rerun().
+    """
+    preset = PRESETS[name]
+    st.session_state.trend_val = preset['trend_val']
+    st.session_state.google_scale = preset['google_scale']
+    st.session_state.meta_scale = preset['meta_scale']
+    st.session_state.sat_val = float(suggested_saturation if preset['sat_val'] is None else preset['sat_val'])
+
+# --- GRAFICI IN CACHE (disegnati in forecast_charts.py) ---
+# Le immagini PNG sono memorizzate per input: i grafici dello storico dipendono solo dai dati puliti,
+# identificati da `data_key` (hash del file o seed DEMO); il DataFrame con prefisso `_` non viene ri-hashato.
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_saturation_curve(sat_factor):
+    return saturation_curve_png(sat_factor)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_history_chart(data_key, kind, _df, cols, max_points):
+    """Grafici che dipendono solo dallo storico: 'google', 'meta' o 'resi'."""
+    dates = _df['Data_Interna']
+    if kind == 'google':
+        return channel_chart_png(dates, _df[cols['google']], _df[cols['g_val']], 'Spesa Google', 'Valore Conversione', max_points)
+    if kind == 'meta':
+        return channel_chart_png(dates, _df[cols['meta']], _df[cols['m_val']], 'Spesa Meta', 'Website Purch. Value', max_points)
+    return returns_chart_png(dates, _df['Spesa_Ads_Totale'], _df['Tasso_Resi'], max_points)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_forecast_chart(data_key, _df, cols, df_prev, df_bands, max_points):
+    return forecast_chart_png(_df['Data_Interna'], _df['Fatturato_Netto'], _df[cols['google']], _df[cols['meta']],
+                              df_prev, df_bands, max_points)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_saturation_scatter(df_view):
+    return saturation_scatter_png(df_view['Delta Spesa %'], df_view['Delta Ricavi %'], df_view['Elasticità'])
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_elasticity_heatmap(data_key, _matrix):
+    return elasticity_heatmap_png(_matrix)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_sweep_heatmap(heat):
+    return sweep_heatmap_png(heat)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_optimizer_chart(df_opt):
+    return optimizer_chart_png(df_opt)
+
+# --- TABELLE PAGINATE ---
+# Al posto di st.dataframe(df.style.format(...)) sull'intero storico (lo Styler genera HTML per ogni cella a ogni
+# rerun): si formatta solo la pagina visibile e le pagine formattate restano in cache per contenuto + pagina.
+
+def format_page(page, formats, precision=None):
+    """Celle della pagina come testo: `formats` è colonna -> formato ('€ {:,.2f}'); con `precision` gli altri
+    float usano quel numero di decimali (come Styler.format(precision=...)). Valori mancanti -> ''."""
+    out = {}
+    for c in page.columns:
+        fmt = formats.get(c)
+        if fmt is None and precision is not None and pd.api.types.is_float_dtype(page[c]):
+            fmt = f"{{:.{precision}f}}"
+        out[c] = [fmt.format(v) if pd.notna(v) else '' for v in page[c]] if fmt else page[c]
+    return pd.DataFrame(out, index=page.index)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_table_page(content_key, _df, formats, page, page_size, reverse, precision):
+    """Una pagina già formattata; `content_key` identifica il contenuto di `_df` (non ri-hashato)."""
+    rows = _df.iloc[::-1] if reverse else _df
+    return format_page(rows.iloc[page * page_size:(page + 1) * page_size], formats, precision)
+
+def paged_table(df, formats, key, content_key=None, reverse=False, precision=None):
+    """Tabella paginata lato server: il tempo di rendering dipende dalla pagina, non dalla lunghezza dello storico.
+
+    `content_key` (es. hash del file) evita di ri-hashare tabelle grandi; se manca si usa l'hash del contenuto,
+    adatto solo a tabelle piccole come la previsione. `reverse` mostra prima le righe più recenti.
+    """
+    if content_key is None:
+        content_key = int(pd.util.hash_pandas_object(df).sum())
+    size_key, page_key = f"{key}_page_size", f"{key}_page"
+    if size_key not in st.session_state: st.session_state[size_key] = 50
+    n_rows, page_size = len(df), st.session_state[size_key]
+    n_pages = max(1, math.ceil(n_rows / page_size))
+    if st.session_state.get(page_key, 1) > n_pages: st.session_state[page_key] = n_pages
+    if page_key not in st.session_state: st.session_state[page_key] = 1
+
+    page = 0
+    if n_rows > 25:
+        c1, c2, c3 = st.columns([1, 1, 3])
+        page = c1.number_input("Pagina", 1, n_pages, key=page_key) - 1
+        c2.selectbox("Righe per pagina", [25, 50, 100, 250], key=size_key)
+        c3.caption(f"Righe {page * page_size + 1:,}–{min((page + 1) * page_size, n_rows):,} di {n_rows:,} ({n_pages} pagine)")
+    st.dataframe(cached_table_page((content_key, key), df, formats, page, page_size, reverse, precision))
 
 # --- HEADER ---
 st.title("📈 Simulatore Business & Forecasting")
@@ -229,20 +266,12 @@ with st.sidebar.expander("1. Input Metriche", expanded=True):
     )
 
     # --- CALCOLI (BACKEND - INSERITO PER EVITARE NAME ERROR) ---
-    # 1. AOV Netto
-    aov_post_tax_returns = (be_aov * (1 - be_returns/100)) / (1 + be_vat/100)
-
-    # 2. Profit per Order
-    profit_order = (aov_post_tax_returns * (be_margin_prod/100)) - be_fulfillment
-
-    # 3. Profit per Customer
-    profit_per_customer = profit_order + (profit_order * (be_returning_perc/100) * be_repeat_rate)
-
-    # 4. Break Even CPA
-    be_cpa = profit_per_customer
-
-    # 5. Break Even ROAS
-    be_roas_val = be_aov / be_cpa if be_cpa > 0 else 99.9
+    economics = compute_economics(be_aov, be_vat, be_returns, be_margin_prod, be_fulfillment, be_returning_perc, be_repeat_rate)
+    aov_post_tax_returns = economics['aov_post_tax_returns']
+    profit_order = economics['profit_order']
+    profit_per_customer = economics['profit_per_customer']
+    be_cpa = economics['be_cpa']
+    be_roas_val = economics['be_roas_val']
 
 with st.sidebar.expander("2. Output Calcolati (Live)", expanded=True):
     st.markdown("---")
@@ -279,6 +308,15 @@ demo_mode = st.sidebar.toggle("🚀 Usa Modalità DEMO (Dati Casuali)", value=Fa
 uploaded_file = None
 if not demo_mode:
     uploaded_file = st.sidebar.file_uploader("Carica il file .csv", type="csv")
+else:
+    demo_seed = st.sidebar.number_input("Seed DEMO", value=42, step=1, help="Stesso seed = stessi dati DEMO.")
+    demo_daily = st.sidebar.checkbox("DEMO giornaliera", value=False, help="Genera un export giornaliero, aggregato per settimana al caricamento.")
+compact_types = st.sidebar.checkbox("Tipi compatti (meno memoria)", value=True,
+                                    help="float32, interi ridotti e testi ripetuti come categorie: circa metà memoria per sessione, previsioni entro 1e-4 dal calcolo in float64.")
+stream_upload = not demo_mode and st.sidebar.checkbox(
+    "Lettura a blocchi (file molto grandi)", value=False,
+    help="Per export giornalieri / per SKU da centinaia di MB: il file è letto a blocchi e ridotto subito a una riga per negozio e settimana, "
+         "quindi la memoria dipende dalle settimane e non dalle righe. Restano solo le colonne note.")
 
 # --- GUIDA FORMATO CSV ---
 with st.expander("📋 Guida: Come formattare il CSV per la versione completa"):
@@ -292,137 +330,69 @@ with st.expander("📋 Guida: Come formattare il CSV per la versione completa"):
     | `Total sales` | Fatturato netto Shopify |
     | `Returns` | Valore dei resi |
     | `Orders` | Numero totale ordini |
+    
+    In alternativa a `Year Week` si può caricare un export **giornaliero** con una colonna `Day` / `Date` / `Giorno` / `Data`
+    (es. 2025-01-31 o 31/01/2025): i giorni vengono aggregati per settimana ISO (e per `Store`, se presente) al caricamento.
     """)
 
+lap(prof, 'Interfaccia e input sidebar')
+
 # --- LOGICA CARICAMENTO E PULIZIA (UNIFICATA) ---
 df = None
 
-# 1. Recupero DataFrame (Demo o File)
-if demo_mode:
-    df = generate_demo_data()
-    st.success("✅ Dati DEMO generati (Pattern Non-Lineare)!")
-elif uploaded_file is not None:
-    try:
-        df = pd.read_csv(uploaded_file, sep=None, engine='python')
-        df = df.dropna(how='all')
-    except Exception as e:
-        st.error(f"Errore: {e}")
+# 1. Recupero DataFrame pulito (Demo o File). La pulizia del file è in cache per contenuto:
+#    slider e pulsanti non rileggono né ripuliscono il CSV.
+try:
+    if demo_mode:
+        demo_freq = 'D' if demo_daily else 'W'
+        data_key = f"demo-{int(demo_seed)}-{demo_freq}" + ("-compact" if compact_types else "")
+        df, cols = load_demo_data(data_key, int(demo_seed), demo_freq, compact_types)
+        st.success("✅ Dati DEMO generati (Pattern Non-Lineare)!")
+    elif uploaded_file is not None:
+        if stream_upload:
+            # Niente copia in memoria dell'intero file: hash e lettura direttamente dal buffer dell'upload
+            file_hash, source = file_content_hash(uploaded_file), uploaded_file
+        else:
+            source = uploaded_file.getvalue()
+            file_hash = hashlib.sha256(source).hexdigest()
+        data_key = file_hash + ("-stream" if stream_upload else "") + ("-compact" if compact_types else "")
+        df, cols = load_and_clean(data_key, file_hash, source, compact_types, stream_upload)
+except Exception as e:
+    df = None
+    st.error(f"Errore: {e}")
+lap(prof, 'Caricamento e pulizia', rows=len(df) if df is not None else None)
 
 # 2. Elaborazione Completa (Se df esiste)
 if df is not None:
     try:
-        df.columns = df.columns.str.strip()
-
-        col_date = next((c for c in df.columns if 'Year Week' in c or 'Settimana' in c), None)
-        col_google = next((c for c in df.columns if 'Cost' in c), 'Cost')
-        col_meta = next((c for c in df.columns if 'Amount Spent' in c), 'Amount Spent')
-        col_sales = next((c for c in df.columns if 'Total sales' in c), 'Total sales')
-        col_returns = next((c for c in df.columns if 'Returns' in c), 'Returns')
-        col_orders = next((c for c in df.columns if 'Orders' in c), 'Orders')
-        col_aov = next((c for c in df.columns if 'Average order value' in c), 'Average order value')
-        
-        col_g_val = 'Conversions Value'
-        col_m_val = 'Website Purchases Conversion Value'
-        col_g_cpc = 'Avg. CPC'
-        col_m_cpc = 'CPC (All)'
-        col_m_cpm = 'CPM (Cost per 1,000 Impressions)'
-        col_g_imps = 'Impressions'
-        col_m_freq = 'Frequency'
+        col_date, col_google, col_meta = cols['date'], cols['google'], cols['meta']
+        col_sales, col_returns, col_orders, col_aov = cols['sales'], cols['returns'], cols['orders'], cols['aov']
         
-        col_items = 'Items'
-        col_ret_rate = 'Returning customer rate'
-        col_discounts = 'Discounts'
-
-        if not col_date:
-            st.error("Errore: Manca colonna data.")
-            st.stop()
-
-        df['Data_Interna'] = df[col_date].apply(parse_iso_week)
-        df = df.dropna(subset=['Data_Interna']).sort_values('Data_Interna')
-        df['Periodo'] = df['Data_Interna'].apply(get_week_range_label_with_year)
-
-        # === CREAZIONE COLONNE GLOBALI PER TAB 4 ===
-        df['Year'] = df['Data_Interna'].dt.year
-        df['Week'] = df['Data_Interna'].dt.isocalendar().week
-        # ==========================================================
-
-        money_cols = [col_google, col_meta, col_sales, col_returns, col_aov, 'Gross sales', col_discounts, 
-                      col_g_val, col_m_val, col_g_cpc, col_m_cpc, col_m_cpm]
-        for c in money_cols:
-            if c in df.columns: df[c] = clean_currency_us(df[c])
-
-        if col_g_imps in df.columns: df[col_g_imps] = pd.to_numeric(df[col_g_imps], errors='coerce').fillna(0)
-        if col_m_freq in df.columns: df[col_m_freq] = pd.to_numeric(df[col_m_freq], errors='coerce').fillna(0)
+        col_g_val, col_m_val = cols['g_val'], cols['m_val']
+        col_g_cpc, col_m_cpc, col_m_cpm = cols['g_cpc'], cols['m_cpc'], cols['m_cpm']
+        col_g_imps, col_m_freq = cols['g_imps'], cols['m_freq']
         
-        # Pulizia specifica per l'AI
-        if col_ret_rate in df.columns: df[col_ret_rate] = df[col_ret_rate].apply(clean_percentage)
-        if col_items in df.columns: df[col_items] = pd.to_numeric(df[col_items], errors='coerce').fillna(0)
-
-        df = df.fillna(0)
+        col_items, col_ret_rate, col_discounts = cols['items'], cols['ret_rate'], cols['discounts']
 
-        df['Fatturato_Netto'] = df[col_sales].clip(lower=0)
-        df['Spesa_Ads_Totale'] = df[col_google] + df[col_meta]
-        df['Tasso_Resi'] = (df[col_returns].abs() / df[col_sales].replace(0, np.nan)) * 100
-        df['Tasso_Resi'] = df['Tasso_Resi'].fillna(0)
-        
-        # Calcolo CoS Storico
-        df['CoS'] = (df['Spesa_Ads_Totale'] / df['Fatturato_Netto'].replace(0, np.nan)) * 100
-        df['CoS'] = df['CoS'].fillna(0)
-        
         # --- CALCOLO PROFITTO NETTO STIMATO NEL DF ---
-        num_orders = df[col_orders] if col_orders in df.columns else (df['Fatturato_Netto'] / be_aov)
-        
-        # Profitto Operativo = (Numero Ordini * Profitto per Ordine) - Spesa Ads
-        # FIX: Uso la variabile corretta profit_order definita nella sidebar
-        df['Profitto_Operativo'] = (num_orders * profit_order) - df['Spesa_Ads_Totale']
-
-        # Inizializzazione sicura ROAS
-        df['ROAS_Google'] = 0.0
-        df['ROAS_Meta'] = 0.0
-        if col_g_val in df.columns: df['ROAS_Google'] = df[col_g_val] / df[col_google].replace(0, np.nan).fillna(0)
-        if col_m_val in df.columns: df['ROAS_Meta'] = df[col_m_val] / df[col_meta].replace(0, np.nan).fillna(0)
-
-        # --- AUTO-CALCOLO ELASTICITÀ ---
-        df_annual = df.groupby('Year').agg({'Spesa_Ads_Totale': 'sum', 'Fatturato_Netto': 'sum'}).sort_index()
-        suggested_saturation = 0.85 
-        if len(df_annual) >= 2:
-            last_year = df_annual.index[-1]
-            prev_year = df_annual.index[-2]
-            d_spend = (df_annual.loc[last_year, 'Spesa_Ads_Totale'] - df_annual.loc[prev_year, 'Spesa_Ads_Totale']) / df_annual.loc[prev_year, 'Spesa_Ads_Totale']
-            d_rev = (df_annual.loc[last_year, 'Fatturato_Netto'] - df_annual.loc[prev_year, 'Fatturato_Netto']) / df_annual.loc[prev_year, 'Fatturato_Netto']
-            if d_spend > 0.05:
-                raw_elasticity = d_rev / d_spend
-                suggested_saturation = np.clip(raw_elasticity, 0.60, 1.0)
-
-        # --- CALCOLO TREND YoY ---
+        add_operating_profit(df, cols, profit_order, be_aov)
+        lap(prof, 'Profitto operativo', rows=len(df))
+
+        # --- AUTO-CALCOLO ELASTICITÀ E TREND YoY (condivisi per dataset) ---
+        df_annual, suggested_saturation, growth_rate = history_stats(data_key, df)
         last_date = df['Data_Interna'].max()
-        start_last_year = last_date - pd.Timedelta(weeks=52)
-        start_prev_year = start_last_year - pd.Timedelta(weeks=52)
-        sales_ly = df[(df['Data_Interna'] > start_last_year) & (df['Data_Interna'] <= last_date)]['Fatturato_Netto'].sum()
-        sales_py = df[(df['Data_Interna'] > start_prev_year) & (df['Data_Interna'] <= start_last_year)]['Fatturato_Netto'].sum()
-        growth_rate = (sales_ly - sales_py) / sales_py if sales_py > 0 else 0.0
 
         # Storico Annuale
-        historical_growth_data = []
-        years_avail = sorted(df['Year'].unique(), reverse=True)
-        for i in range(len(years_avail) - 1):
-            curr_y = years_avail[i]
-            prev_y = years_avail[i+1]
-            val_curr = df_annual.loc[curr_y, 'Fatturato_Netto']
-            val_prev = df_annual.loc[prev_y, 'Fatturato_Netto']
-            g_y = (val_curr - val_prev) / val_prev if val_prev > 0 else 0
-            historical_growth_data.append(f"📅 {curr_y} vs {prev_y}: **{g_y:+.1%}**")
+        historical_growth_data = [f"📅 {curr_y} vs {prev_y}: **{g_y:+.1%}**" for curr_y, prev_y, g_y in historical_growth(df_annual)]
+        lap(prof, 'Elasticità e trend YoY', rows=len(df))
 
         # === 🚀 AUTO-SETTING AL PRIMO CARICAMENTO (O AVVIO DEMO) ===
+        # Gli slider non sono ancora stati creati in questo rerun: i valori impostati qui valgono subito.
         current_source_name = "DEMO" if demo_mode else (uploaded_file.name if uploaded_file else None)
         
         if st.session_state.last_uploaded_file != current_source_name:
-            st.session_state.trend_val = 0.0
-            st.session_state.google_scale = 1.2
-            st.session_state.meta_scale = 1.2
-            st.session_state.sat_val = float(suggested_saturation)
+            apply_preset('Auto-Calibra', suggested_saturation)
             st.session_state.last_uploaded_file = current_source_name
-            st.rerun()
         # =============================================
 
         # --- SIDEBAR: AZIONI RAPIDE ---
@@ -436,12 +406,10 @@ if df is not None:
             """)
 
         col_b1, col_b2 = st.sidebar.columns(2)
-        if col_b1.button("🛡️ Prudente"):
-            st.session_state.trend_val = 0.0; st.session_state.google_scale = 1.0; st.session_state.meta_scale = 1.0; st.session_state.sat_val = 0.80; st.rerun()
-        if col_b2.button("🚀 Aggressivo"):
-            st.session_state.trend_val = 0.15; st.session_state.google_scale = 1.5; st.session_state.meta_scale = 1.5; st.session_state.sat_val = 0.90; st.rerun()
-        if st.sidebar.button(f"🎯 Auto-Calibra (Sat: {suggested_saturation:.2f})"):
-            st.session_state.trend_val = 0.0; st.session_state.google_scale = 1.2; st.session_state.meta_scale = 1.2; st.session_state.sat_val = float(suggested_saturation); st.rerun()
+        col_b1.button("🛡️ Prudente", on_click=apply_preset, args=('Prudente', suggested_saturation))
+        col_b2.button("🚀 Aggressivo", on_click=apply_preset, args=('Aggressivo', suggested_saturation))
+        st.sidebar.button(f"🎯 Auto-Calibra (Sat: {suggested_saturation:.2f})", on_click=apply_preset,
+                          args=('Auto-Calibra', suggested_saturation))
 
         st.sidebar.divider()
 
@@ -473,22 +441,20 @@ if df is not None:
         sat_factor = st.sidebar.slider("Saturazione", 0.5, 1.0, key="sat_val")
         
         # Grafico Saturazione con Assi
-        x_sat = np.linspace(1, 4, 20)
-        y_sat = x_sat ** sat_factor
-        fig_sat, ax_sat = plt.subplots(figsize=(4, 2))
-        ax_sat.plot(x_sat, x_sat, linestyle='--', color='gray', alpha=0.5, label='Ideale')
-        ax_sat.plot(x_sat, y_sat, color='#e74c3c', linewidth=2, label=f'Reale')
-        ax_sat.set_title("Curva Rendimenti", fontsize=9)
-        ax_sat.set_xlabel("Moltiplicatore Spesa", fontsize=7)
-        ax_sat.set_ylabel("Moltiplicatore Ricavi", fontsize=7)
-        ax_sat.tick_params(labelsize=6)
-        ax_sat.legend(fontsize=6, frameon=False)
-        ax_sat.spines['top'].set_visible(False)
-        ax_sat.spines['right'].set_visible(False)
-        st.sidebar.pyplot(fig_sat)
+        st.sidebar.image(cached_saturation_curve(sat_factor), width='stretch')
 
         mesi_prev = st.sidebar.number_input("Mesi di Previsione", 1, 24, 6)
 
+        with st.sidebar.expander("📊 Opzioni Grafici"):
+            max_points = st.select_slider(
+                "Punti massimi per grafico", options=[250, 500, 1000, 2000, 5000, 0], value=DEFAULT_MAX_POINTS,
+                format_func=lambda v: "Tutti" if v == 0 else f"{v:,}",
+                help="Gli storici più lunghi vengono ridotti prima del disegno: LTTB per le linee, media per blocchi per le barre."
+            )
+        memory_box = st.sidebar.expander("🧠 Memoria Sessione")
+
+        lap(prof, 'Controlli sidebar')
+
         # --- 4. DASHBOARD KPI (Ultime 4 Settimane) ---
         st.divider()
         last_4 = df.tail(4)
@@ -505,79 +471,59 @@ if df is not None:
         c4.metric("CoS (Spesa/Fatt.)", f"{cos:.1f}%")
         c5.metric("Profitto Stimato", f"€ {profit:,.0f}", help="Profitto Operativo dopo Merce, Tasse, Logistica e Ads.")
 
+        lap(prof, 'KPI ultime 4 settimane')
+
         # --- 5. CALCOLO PREVISIONALE ---
-        df['Week_Num'] = df['Data_Interna'].dt.isocalendar().week
-        seasonal = df.groupby('Week_Num').agg({
-            'Fatturato_Netto': 'mean', col_google: 'mean', col_meta: 'mean', col_orders: 'mean'
-        }).reset_index()
+        seasonal = get_aggregate(data_key, 'seasonal', lambda: seasonal_table(df, cols))
+        lap(prof, 'Stagionalità', rows=len(df))
 
         avg_hist_sales = df['Fatturato_Netto'].mean()
         
-        future_dates = pd.date_range(start=last_date + pd.Timedelta(weeks=1), periods=int(mesi_prev*4.34), freq='W-MON')
+        future_dates = forecast_dates(last_date, mesi_prev)
 
-        rows = []
-        for d in future_dates:
-            w = d.isocalendar().week
-            base = seasonal[seasonal['Week_Num'] == w]
-            if base.empty: base = seasonal.mean().to_frame().T
-            
-            # Trend applicato (Base storica + Slider)
-            base_trend = (1 + growth_rate) * (1 + manual_trend)
-            
-            proj_sales_base = base['Fatturato_Netto'].values[0] * base_trend
-            proj_google_base = base[col_google].values[0] * base_trend
-            proj_meta_base = base[col_meta].values[0] * base_trend
-            
-            new_g, new_m = proj_google_base * m_google, proj_meta_base * m_meta
-            ratio = (new_g + new_m) / (proj_google_base + proj_meta_base) if (proj_google_base + proj_meta_base) > 0 else 1.0
-            f_sales = proj_sales_base * (ratio ** sat_factor)
-            
-            f_orders = f_sales / be_aov
-            
-            rows.append({
-                'Data': d, 
-                'Periodo': get_week_range_label_with_year(d),
-                'Google Previsto': new_g, 
-                'Meta Previsto': new_m, 
-                'Fatturato Previsto': f_sales, 
-                'Ordini Previsti': f_orders
-            })
-        
-        df_prev = pd.DataFrame(rows)
-        df_prev['Spesa Totale'] = df_prev['Google Previsto'] + df_prev['Meta Previsto']
-        df_prev['MER Previsto'] = df_prev['Fatturato Previsto'] / df_prev['Spesa Totale']
-        # Calcolo CoS Previsto
-        df_prev['CoS Previsto'] = (df_prev['Spesa Totale'] / df_prev['Fatturato Previsto'].replace(0, np.nan)) * 100
-        df_prev['CoS Previsto'] = df_prev['CoS Previsto'].fillna(0)
+        df_prev = build_forecast(seasonal, future_dates, growth_rate, manual_trend, m_google, m_meta, sat_factor,
+                                 be_aov, col_google, col_meta)
+        lap(prof, 'Previsione', rows=len(df_prev))
         
         # --- 6. VISUALIZZAZIONE TABS ---
-        tabs = st.tabs([
+        # Selettore al posto di st.tabs: st.tabs esegue (e disegna) tutte le schede a ogni rerun,
+        # così invece viene calcolata solo la sezione attiva.
+        TAB_NAMES = [
             "📉 Grafico Previsionale", "📋 Dettaglio Previsione", "🔵 Analisi Google Ads", 
             "🔵 Analisi Meta Ads", "🧪 Analisi Saturazione Storica", "📊 Analisi Resi", 
-            "🗂️ Dati CSV", "🧠 Insight AI"
-        ])
-        
-        # COLORI
-        DARKEST_BLUE = '#000080'  
-        META_COLOR = '#3b5998'    
-        GREEN_COLOR = '#2ecc71'   
-        ORANGE_COLOR = '#e67e22'  
+            "🗂️ Dati CSV", "🧠 Insight AI", "🧮 Sweep Scenari", "🎯 Ottimizzatore Budget"
+        ]
+        active_tab = st.radio("Sezione", TAB_NAMES, horizontal=True, key="active_tab", label_visibility="collapsed")
         
-        with tabs[0]:
+        if active_tab == TAB_NAMES[0]:
             st.caption("Questo grafico confronta l'andamento storico del fatturato (Verde) con la proiezione futura (Arancione).")
-            fig, ax1 = plt.subplots(figsize=(12, 6))
-            ax1.plot(df['Data_Interna'], df['Fatturato_Netto'], color=GREEN_COLOR, label='Storico', linewidth=1)
-            ax1.plot(df_prev['Data'], df_prev['Fatturato Previsto'], color=ORANGE_COLOR, linestyle='--', label='Previsione', linewidth=2)
-            ax1.set_ylabel("Fatturato (€)")
-            ax2 = ax1.twinx()
-            ax2.stackplot(pd.concat([df['Data_Interna'], df_prev['Data']]),
-                          np.concatenate([df[col_google], df_prev['Google Previsto']]),
-                          np.concatenate([df[col_meta], df_prev['Meta Previsto']]),
-                          colors=[DARKEST_BLUE, META_COLOR], alpha=0.3, labels=['Google Ads', 'Meta Ads'])
-            ax1.legend(loc='upper left')
-            st.pyplot(fig)
-
-        with tabs[1]:
+            mc1, mc2 = st.columns([2, 1])
+            show_bands = mc1.toggle("Modalità probabilistica (Monte Carlo)", value=False,
+                                    help="Ricampiona i residui YoY per settimana e l'incertezza su crescita e saturazione.")
+            n_paths = mc2.select_slider("Percorsi simulati", options=[1000, 5000, 10000, 20000], value=10000, disabled=not show_bands)
+            df_bands = None
+            if show_bands:
+                uncertainty = forecast_uncertainty(df, df_annual)
+                df_bands, mc_totals = simulate_forecast(seasonal, future_dates, growth_rate, manual_trend, m_google, m_meta, sat_factor,
+                                                        economics, col_google, col_meta, uncertainty, n_paths=n_paths)
+                lap(prof, 'Monte Carlo', rows=n_paths)
+            st.image(cached_forecast_chart(data_key, df, cols, df_prev, df_bands, max_points), width='stretch')
+            lap(prof, 'Grafico previsionale', rows=len(df))
+            
+            if show_bands:
+                st.write(f"**Totali sull'orizzonte ({n_paths:,} percorsi)**")
+                b1, b2, b3, b4 = st.columns(4)
+                for col_box, name in zip([b1, b2, b3, b4], ['Fatturato', 'Spesa', 'Profitto', 'MER']):
+                    q = mc_totals[name]
+                    fmt = (lambda v: f"{v:.2f}") if name == 'MER' else (lambda v: f"€ {v:,.0f}")
+                    col_box.metric(f"{name} P50", fmt(q['P50']))
+                    col_box.caption(f"P10 {fmt(q['P10'])} · P90 {fmt(q['P90'])}")
+                st.caption(f"Incertezza stimata: crescita ± {uncertainty['growth_sd']:.1%}, saturazione ± {uncertainty['sat_sd']:.2f} (deviazione standard).")
+                with st.expander("Bande settimanali"):
+                    st.dataframe(df_bands.drop(columns=['Data']).style.format(
+                        {c: ('{:.2f}' if c.startswith('MER') else '€ {:,.0f}') for c in df_bands.columns if ' P' in c}))
+
+        if active_tab == TAB_NAMES[1]:
             st.caption("Tabelle dettagliate con i numeri mese per mese e settimana per settimana.")
             st.subheader("📅 Riepilogo Mensile")
             df_prev['Mese'] = df_prev['Data'].dt.strftime('%B %Y')
@@ -585,170 +531,108 @@ if df is not None:
             df_monthly['MER Previsto'] = df_monthly['Fatturato Previsto'] / df_monthly['Spesa Totale']
             df_monthly['CoS Previsto'] = (df_monthly['Spesa Totale'] / df_monthly['Fatturato Previsto'].replace(0, np.nan)) * 100
             
-            st.dataframe(df_monthly.style.format({'Spesa Totale': '€ {:,.0f}', 'Fatturato Previsto': '€ {:,.0f}', 'MER Previsto': '{:.2f}', 'CoS Previsto': '{:.1f}%'}))
+            paged_table(df_monthly, {'Spesa Totale': '€ {:,.0f}', 'Fatturato Previsto': '€ {:,.0f}', 'MER Previsto': '{:.2f}', 'CoS Previsto': '{:.1f}%'}, key='tbl_prev_monthly')
             
             st.write("**Dettaglio Settimanale**")
-            st.dataframe(df_prev[['Periodo', 'Spesa Totale', 'Fatturato Previsto', 'MER Previsto', 'CoS Previsto']].style.format({'Spesa Totale': '€ {:,.0f}', 'Fatturato Previsto': '€ {:,.0f}', 'MER Previsto': '{:.2f}', 'CoS Previsto': '{:.1f}%'}))
+            paged_table(df_prev[['Periodo', 'Spesa Totale', 'Fatturato Previsto', 'MER Previsto', 'CoS Previsto']],
+                        {'Spesa Totale': '€ {:,.0f}', 'Fatturato Previsto': '€ {:,.0f}', 'MER Previsto': '{:.2f}', 'CoS Previsto': '{:.1f}%'}, key='tbl_prev_weekly')
 
-        with tabs[2]:
+        if active_tab == TAB_NAMES[2]:
             st.caption("Focus sulle performance storiche di Google Ads.")
             st.subheader("🔵 Performance Google Ads")
             if col_g_val in df.columns:
                 g_metrics = df.tail(4)[[col_google, col_g_val, 'ROAS_Google', col_g_cpc, col_g_imps]].sum()
                 st.columns(5)[0].metric("Spesa (4w)", f"€ {g_metrics[col_google]:,.0f}")
                 
-                fig_g, ax_g1 = plt.subplots(figsize=(12, 5))
-                ax_g1.bar(df['Data_Interna'], df[col_google], color=DARKEST_BLUE, alpha=0.7, label='Spesa Google')
-                ax_g2 = ax_g1.twinx()
-                ax_g2.plot(df['Data_Interna'], df[col_g_val], color=GREEN_COLOR, linewidth=2, label='Valore Conversione')
-                st.pyplot(fig_g)
-                st.dataframe(df[['Periodo', col_google, col_g_val, 'ROAS_Google', col_g_cpc]].iloc[::-1].style.format({col_google: '€ {:,.2f}', col_g_val: '€ {:,.2f}', 'ROAS_Google': '{:.2f}', col_g_cpc: '€ {:,.2f}'}))
-
-        with tabs[3]:
+                st.image(cached_history_chart(data_key, 'google', df, cols, max_points), width='stretch')
+                lap(prof, 'Grafico Google', rows=len(df))
+                paged_table(df[['Periodo', col_google, col_g_val, 'ROAS_Google', col_g_cpc]],
+                            {col_google: '€ {:,.2f}', col_g_val: '€ {:,.2f}', 'ROAS_Google': '{:.2f}', col_g_cpc: '€ {:,.2f}'},
+                            key='tbl_google', content_key=data_key, reverse=True)
+
+        if active_tab == TAB_NAMES[3]:
             st.caption("Focus sulle performance storiche di Meta Ads.")
             st.subheader("🔵 Performance Meta Ads")
             if col_m_val in df.columns:
                 m_metrics = df.tail(4)[[col_meta, col_m_val, 'ROAS_Meta', col_m_cpc, col_m_cpm, col_m_freq]].sum()
                 st.columns(6)[0].metric("Spesa (4w)", f"€ {m_metrics[col_meta]:,.0f}")
                 
-                fig_m, ax_m1 = plt.subplots(figsize=(12, 5))
-                ax_m1.bar(df['Data_Interna'], df[col_meta], color=DARKEST_BLUE, alpha=0.7, label='Spesa Meta')
-                ax_m2 = ax_m1.twinx()
-                ax_m2.plot(df['Data_Interna'], df[col_m_val], color=GREEN_COLOR, linewidth=2, label='Website Purch. Value')
-                st.pyplot(fig_m)
-                st.dataframe(df[['Periodo', col_meta, col_m_val, 'ROAS_Meta', col_m_cpc, col_m_cpm, col_m_freq]].iloc[::-1].style.format({col_meta: '€ {:,.2f}', col_m_val: '€ {:,.2f}', 'ROAS_Meta': '{:.2f}', col_m_cpc: '€ {:,.2f}', col_m_cpm: '€ {:,.2f}', col_m_freq: '{:.2f}'}))
-
-        with tabs[4]:
+                st.image(cached_history_chart(data_key, 'meta', df, cols, max_points), width='stretch')
+                lap(prof, 'Grafico Meta', rows=len(df))
+                paged_table(df[['Periodo', col_meta, col_m_val, 'ROAS_Meta', col_m_cpc, col_m_cpm, col_m_freq]],
+                            {col_meta: '€ {:,.2f}', col_m_val: '€ {:,.2f}', 'ROAS_Meta': '{:.2f}', col_m_cpc: '€ {:,.2f}', col_m_cpm: '€ {:,.2f}', col_m_freq: '{:.2f}'},
+                            key='tbl_meta', content_key=data_key, reverse=True)
+
+        if active_tab == TAB_NAMES[4]:
             st.caption("Analisi dell'elasticità: misura quanto il fatturato reagisce alle variazioni di spesa pubblicitaria.")
             st.header("🧪 Analisi Saturazione e Scalabilità")
             st.subheader("1. Riepilogo Annuale Completo")
             
-            annual_agg = df.groupby('Year').agg({'Spesa_Ads_Totale': 'sum', 'Fatturato_Netto': 'sum'}).sort_index(ascending=False)
-            annual_rows = []
-            years_list = annual_agg.index.tolist()
+            # Tutti i confronti derivano dal cubo anno x settimana in cache: cambiare coppia è un lookup
+            cube, df_pairs, elasticity_matrix = elasticity_tables(data_key, df)
+            lap(prof, 'Cubo elasticità', rows=len(df))
+            elasticity_styles = dict(subset=['Elasticità'], cmap='RdYlGn', vmin=0.5, vmax=1.5)
             
-            for i in range(len(years_list) - 1):
-                curr_y, prev_y = years_list[i], years_list[i+1]
-                s_curr, s_prev = annual_agg.loc[curr_y, 'Spesa_Ads_Totale'], annual_agg.loc[prev_y, 'Spesa_Ads_Totale']
-                r_curr, r_prev = annual_agg.loc[curr_y, 'Fatturato_Netto'], annual_agg.loc[prev_y, 'Fatturato_Netto']
-                
-                d_spend = ((s_curr - s_prev) / s_prev * 100) if s_prev > 0 else 0
-                d_rev = ((r_curr - r_prev) / r_prev * 100) if r_prev > 0 else 0
-                elasticity = d_rev / d_spend if d_spend != 0 else 0
-                
-                annual_rows.append({'Confronto': f"{curr_y} vs {prev_y}", 'Delta Spesa %': d_spend, 'Delta Fatturato %': d_rev, 'Elasticità': elasticity})
-            
-            if annual_rows:
-                st.dataframe(pd.DataFrame(annual_rows).style.format({'Delta Spesa %': '{:+.1f}%', 'Delta Fatturato %': '{:+.1f}%', 'Elasticità': '{:.2f}'}).background_gradient(subset=['Elasticità'], cmap='RdYlGn', vmin=0.5, vmax=1.5))
+            if not df_pairs.empty:
+                st.dataframe(df_pairs.style.format({'Delta Spesa %': '{:+.1f}%', 'Delta Fatturato %': '{:+.1f}%', 'Elasticità': '{:.2f}'}).background_gradient(**elasticity_styles))
+                with st.expander("🗺️ Elasticità tra tutte le coppie di anni"):
+                    st.caption("Riga: anno analizzato; colonna: anno di confronto. Verde = il fatturato cresce più della spesa.")
+                    st.image(cached_elasticity_heatmap(data_key, elasticity_matrix), width='stretch')
 
             st.divider()
             st.subheader("2. Dettaglio Settimanale")
             
-            if not annual_rows:
+            if df_pairs.empty:
                 st.warning("Dati insufficienti.")
             else:
-                comp_options = [row['Confronto'] for row in annual_rows]
+                years_desc = [int(y) for y in cube['years'][::-1]]
+                # Prima le coppie consecutive (dal più recente), poi tutte le altre
+                comp_options = list(df_pairs['Confronto']) + [f"{c} vs {p}" for i, c in enumerate(years_desc) for p in years_desc[i + 2:]]
                 selected_comp = st.selectbox("Seleziona Anno da Confrontare", comp_options)
-                curr_year_sel = int(selected_comp.split(" vs ")[0])
-                prev_year_sel = int(selected_comp.split(" vs ")[1])
-                
-                all_weeks = pd.DataFrame({'Week': range(1, 54)})
-                df_curr = df[df['Year'] == curr_year_sel][['Week', 'Spesa_Ads_Totale', 'Fatturato_Netto', 'Periodo']]
-                df_prev = df[df['Year'] == prev_year_sel][['Week', 'Spesa_Ads_Totale', 'Fatturato_Netto']]
+                curr_year_sel, prev_year_sel = (int(y) for y in selected_comp.split(" vs "))
                 
-                df_comp = pd.merge(all_weeks, df_curr, on='Week', how='left')
-                df_comp = pd.merge(df_comp, df_prev, on='Week', suffixes=('_Curr', '_Prev'), how='left').fillna(0)
+                df_view = weekly_elasticity(cube, curr_year_sel, prev_year_sel)
                 
-                df_comp['Delta Spesa %'] = np.where(df_comp['Spesa_Ads_Totale_Prev'] > 0, ((df_comp['Spesa_Ads_Totale_Curr'] - df_comp['Spesa_Ads_Totale_Prev']) / df_comp['Spesa_Ads_Totale_Prev']) * 100, 0)
-                df_comp['Delta Ricavi %'] = np.where(df_comp['Fatturato_Netto_Prev'] > 0, ((df_comp['Fatturato_Netto_Curr'] - df_comp['Fatturato_Netto_Prev']) / df_comp['Fatturato_Netto_Prev']) * 100, 0)
-                df_comp['Elasticità'] = np.where(df_comp['Delta Spesa %'] != 0, df_comp['Delta Ricavi %'] / df_comp['Delta Spesa %'], 0)
+                st.dataframe(df_view[['Week', 'Periodo', 'Spesa_Ads_Totale_Curr', 'Spesa_Ads_Totale_Prev', 'Delta Spesa %', 'Delta Ricavi %', 'Elasticità']].style.format({'Spesa_Ads_Totale_Curr': '€ {:,.0f}', 'Spesa_Ads_Totale_Prev': '€ {:,.0f}', 'Delta Spesa %': '{:+.1f}%', 'Delta Ricavi %': '{:+.1f}%', 'Elasticità': '{:.2f}'}).background_gradient(**elasticity_styles))
                 
-                df_view = df_comp[(df_comp['Spesa_Ads_Totale_Curr'] > 0) | (df_comp['Spesa_Ads_Totale_Prev'] > 0)].sort_values('Week', ascending=False)
-                
-                st.dataframe(df_view[['Week', 'Periodo', 'Spesa_Ads_Totale_Curr', 'Spesa_Ads_Totale_Prev', 'Delta Spesa %', 'Delta Ricavi %', 'Elasticità']].style.format({'Spesa_Ads_Totale_Curr': '€ {:,.0f}', 'Spesa_Ads_Totale_Prev': '€ {:,.0f}', 'Delta Spesa %': '{:+.1f}%', 'Delta Ricavi %': '{:+.1f}%', 'Elasticità': '{:.2f}'}).background_gradient(subset=['Elasticità'], cmap='RdYlGn', vmin=0.5, vmax=1.5))
-                
-                fig_sat, ax_sat = plt.subplots(figsize=(10, 5))
-                ax_sat.plot([-100, 500], [-100, 500], ls='--', color='gray', alpha=0.5)
-                scatter = ax_sat.scatter(df_view['Delta Spesa %'], df_view['Delta Ricavi %'], c=df_view['Elasticità'], cmap='RdYlGn', s=80, edgecolor='black', vmin=0.6, vmax=1.4)
-                ax_sat.set_xlabel("Variazione Spesa (%)")
-                ax_sat.set_ylabel("Variazione Fatturato (%)")
-                plt.colorbar(scatter, label='Elasticità')
-                st.pyplot(fig_sat)
-
-        with tabs[5]:
+                st.image(cached_saturation_scatter(df_view[['Delta Spesa %', 'Delta Ricavi %', 'Elasticità']]), width='stretch')
+
+        if active_tab == TAB_NAMES[5]:
             st.caption("Confronto tra spesa e resi.")
             st.subheader("🔍 Spesa Ads vs Tasso Resi")
-            fig2, ax1_2 = plt.subplots(figsize=(12, 6))
-            ax1_2.bar(df['Data_Interna'], df['Spesa_Ads_Totale'], color=DARKEST_BLUE, alpha=0.5)
-            ax2_2 = ax1_2.twinx()
-            ax2_2.plot(df['Data_Interna'], df['Tasso_Resi'].rolling(4).mean(), color='#e74c3c', linewidth=2)
-            st.pyplot(fig2)
+            st.image(cached_history_chart(data_key, 'resi', df, cols, max_points), width='stretch')
+            lap(prof, 'Grafico resi', rows=len(df))
 
-        with tabs[6]:
+        if active_tab == TAB_NAMES[6]:
             st.caption("Il database grezzo importato.")
             st.subheader("🗂️ Database Storico")
             display_cols = [col_date, 'Periodo', 'Total sales', col_google, col_g_val, col_g_cpc, col_g_imps, 
                             col_meta, col_m_val, col_m_cpc, col_m_cpm, col_m_freq, 'CoS', 'Profitto_Operativo']
             valid_cols = [c for c in display_cols if c in df.columns]
-            st.dataframe(df[valid_cols].iloc[::-1].style.format({'CoS': '{:.1f}%', 'Profitto_Operativo': '€ {:,.0f}'}, precision=2))
+            # Profitto_Operativo dipende dagli input economici: entrano nella chiave delle pagine
+            paged_table(df[valid_cols], {'CoS': '{:.1f}%', 'Profitto_Operativo': '€ {:,.0f}'}, key='tbl_csv',
+                        content_key=f"{data_key}-{profit_order:.6f}-{be_aov}", reverse=True, precision=2)
 
         # --- 8. TAB AI AVANZATA ---
-        with tabs[7]:
+        if active_tab == TAB_NAMES[7]:
             st.caption("Analisi automatica che incrocia Profitto, Retention e Performance Canali.")
             st.header("🧠 Insight AI: Analisi Strategica Completa")
             
-            df['Month_Date'] = df['Data_Interna'].dt.to_period('M')
-            ai_agg = {
-                'Spesa_Ads_Totale': 'sum', 'Fatturato_Netto': 'sum', 'Orders': 'sum', 
-                col_returns: 'sum', col_discounts: 'sum', col_google: 'sum', col_meta: 'sum', 
-                col_g_val: 'sum', col_m_val: 'sum', 'Gross sales': 'sum', 'Profitto_Operativo': 'sum'
-            }
-            if col_ret_rate in df.columns: ai_agg[col_ret_rate] = 'mean'
-            if col_m_freq in df.columns: ai_agg[col_m_freq] = 'mean'
-            if col_m_cpm in df.columns: ai_agg[col_m_cpm] = 'mean'
-            if col_g_cpc in df.columns: ai_agg[col_g_cpc] = 'mean'
-            if col_m_cpc in df.columns: ai_agg[col_m_cpc] = 'mean'
-
-            ai_df = df.groupby('Month_Date').agg(ai_agg).sort_index(ascending=False)
-            
-            ai_df['MER'] = ai_df['Fatturato_Netto'] / ai_df['Spesa_Ads_Totale'].replace(0, np.nan)
-            ai_df['Discount_Rate'] = (ai_df[col_discounts].abs() / ai_df['Gross sales'].replace(0, np.nan)) * 100
-            ai_df['ROAS_Google'] = ai_df[col_g_val] / ai_df[col_google].replace(0, np.nan)
-            ai_df['ROAS_Meta'] = ai_df[col_m_val] / ai_df[col_meta].replace(0, np.nan)
-            
-            avg_sales = ai_df['Fatturato_Netto'].mean()
-            ai_df['Seasonality'] = ai_df['Fatturato_Netto'] / avg_sales
+            # Aggregato condiviso senza Profitto_Operativo (dipende dalla sidebar): si aggiunge a ogni rerun
+            # sulle somme mensili, così muovere gli slider non crea nuovi aggregati in cache
+            ai_df = get_aggregate(data_key, 'ai_monthly', lambda: ai_monthly_table(df.drop(columns='Profitto_Operativo'), cols))
+            add_operating_profit(ai_df, cols, profit_order, be_aov)
             
             bench_mer = ai_df['MER'].mean()
             bench_ret = ai_df[col_ret_rate].mean() if col_ret_rate in df.columns else 0
+            # Punteggio di tutto lo storico in un colpo solo; le card HTML solo per i mesi mostrati
+            scored = score_months(ai_df, be_roas_val, bench_ret, col_ret_rate if col_ret_rate in df.columns else None)
+            n_cards = st.number_input("Mesi mostrati", 1, len(scored), min(12, len(scored)))
             
-            for m in ai_df.index[:12]:
-                row = ai_df.loc[m]
+            for m, row in scored.head(int(n_cards)).iterrows():
                 m_str = str(m)
-                
-                score = 50
-                tags = []
-                alerts = []
-                
-                if row['MER'] >= be_roas_val: 
-                    score += 20
-                    tags.append(f"Profittevole (> {be_roas_val:.2f})")
-                else: 
-                    score -= 20
-                    alerts.append(f"Sotto Break-Even (MER {row['MER']:.2f})")
-                
-                if col_ret_rate in df.columns:
-                    if row[col_ret_rate] > bench_ret * 1.1: score += 15; tags.append(f"Retention {row[col_ret_rate]:.1f}%")
-                    elif row[col_ret_rate] < bench_ret * 0.8: score -= 10; alerts.append("Crollo Retention")
-                
-                if row['ROAS_Google'] > row['ROAS_Meta']: tags.append("Win: Google")
-                else: tags.append("Win: Meta")
-                
-                seas_txt = "Media"
-                if row['Seasonality'] > 1.2: seas_txt = "Alta Stagionalità 🔥"
-                elif row['Seasonality'] < 0.8: seas_txt = "Bassa Stagionalità ❄️"
-                
-                color_class = "ai-score-high" if score >= 70 else "ai-score-med" if score >= 50 else "ai-score-low"
+                score, tags, alerts = row['Score'], row['Tags'], row['Alerts']
+                seas_txt, color_class = row['Stagionalità'], row['Classe']
                 
                 with st.container():
                     st.markdown(f"""
@@ -768,8 +652,120 @@ if df is not None:
                         {''.join([f'<div class="ai-alert">⚠️ {a}</div>' for a in alerts])}
                     </div>
                     """, unsafe_allow_html=True)
+            
+            with st.expander(f"Storico punteggi ({len(scored)} mesi)"):
+                history = scored[['Score', 'Stagionalità', 'Fatturato_Netto', 'MER', 'Profitto_Operativo']].assign(
+                    Tags=scored['Tags'].str.join(' · '), Alerts=scored['Alerts'].str.join(' · '))
+                paged_table(history.rename(index=str), {'Fatturato_Netto': '€ {:,.0f}', 'MER': '{:.2f}', 'Profitto_Operativo': '€ {:,.0f}'},
+                            key='tbl_ai_scores', content_key=f"{data_key}-{profit_order:.6f}-{be_aov}-{be_roas_val:.6f}")
+
+        # --- 9. SWEEP SCENARI ---
+        if active_tab == TAB_NAMES[8]:
+            st.caption("Valuta in un solo calcolo migliaia di combinazioni di budget, trend e saturazione sull'orizzonte di previsione scelto.")
+            st.subheader("🧮 Sweep Scenari")
+            
+            sw1, sw2, sw3 = st.columns(3)
+            g_range = sw1.slider("Range Scala Google", 0.5, 5.0, (0.5, 5.0))
+            m_range = sw2.slider("Range Scala Meta", 0.5, 5.0, (0.5, 5.0))
+            scale_step = sw3.select_slider("Passo Scala", options=[0.1, 0.25, 0.5], value=0.25)
+            s_range = sw1.slider("Range Saturazione", 0.5, 1.0, (0.5, 1.0))
+            t_range = sw2.slider("Range Trend", -0.5, 2.0, (0.0, 0.2))
+            top_n = sw3.number_input("Top N scenari", 5, 100, 10)
+            
+            df_sweep = sweep_scenarios(
+                seasonal, future_dates, growth_rate, economics, col_google, col_meta,
+                trends=grid_values(t_range[0], t_range[1], 0.05), google_scales=grid_values(g_range[0], g_range[1], scale_step),
+                meta_scales=grid_values(m_range[0], m_range[1], scale_step), saturations=grid_values(s_range[0], s_range[1], 0.05)
+            )
+            st.markdown(f"**{len(df_sweep):,} scenari valutati** su {len(future_dates)} settimane.")
+            
+            agg_label = st.radio("Profitto nella heatmap", ["Medio su saturazione e trend", "Massimo su saturazione e trend"], horizontal=True)
+            heat = df_sweep.pivot_table(index='Scala Google', columns='Scala Meta', values='Profitto',
+                                        aggfunc='mean' if agg_label.startswith("Medio") else 'max')
+            st.image(cached_sweep_heatmap(heat), width='stretch')
+            
+            st.write(f"**Top {top_n} scenari per Profitto Operativo**")
+            st.dataframe(df_sweep.nlargest(int(top_n), 'Profitto').style.format({
+                'Scala Google': '{:.2f}', 'Scala Meta': '{:.2f}', 'Saturazione': '{:.2f}', 'Trend': '{:+.0%}',
+                'Fatturato': '€ {:,.0f}', 'Spesa': '€ {:,.0f}', 'Profitto': '€ {:,.0f}', 'MER': '{:.2f}', 'CoS': '{:.1f}%'}))
+
+        # --- 10. OTTIMIZZATORE BUDGET ---
+        if active_tab == TAB_NAMES[9]:
+            st.caption("Ripartizione settimanale Google / Meta che massimizza il Profitto Operativo, con curve di saturazione per canale stimate dal ROAS storico.")
+            st.subheader("🎯 Ottimizzatore Budget")
+            
+            op1, op2 = st.columns(2)
+            budget_cap = op1.number_input("Tetto Budget Totale Orizzonte (€, 0 = nessuno)", min_value=0.0, value=0.0, step=1000.0)
+            use_min_mer = op2.checkbox("Vincolo MER minimo", value=False)
+            min_mer = op2.number_input("MER minimo", min_value=0.0, value=float(round(be_roas_val, 2)), step=0.1, disabled=not use_min_mer)
+            
+            curves = fit_response_curves(df, cols)
+            df_opt, opt_summary = optimize_budget(
+                seasonal, future_dates, growth_rate, manual_trend, economics, curves, col_google, col_meta,
+                budget_cap=budget_cap or None, min_mer=min_mer if use_min_mer else None, m_google=m_google, m_meta=m_meta
+            )
+            st.caption(f"Curve di risposta (valore = a · spesa^b): Google b = {curves['google']['b']:.2f} "
+                       f"({curves['google']['n']} settimane) | Meta b = {curves['meta']['b']:.2f} ({curves['meta']['n']} settimane). "
+                       "Spesa limitata tra 0.5x e 5x la base storica.")
+            if not opt_summary['vincolo_rispettato']:
+                st.warning("Vincoli non raggiungibili nemmeno con la spesa minima (0.5x la base): mostrata la soluzione più vicina.")
+            
+            o1, o2, o3, o4 = st.columns(4)
+            o1.metric("Spesa Ottimale", f"€ {opt_summary['spesa']:,.0f}", delta=f"€ {opt_summary['spesa'] - opt_summary['spesa_piano']:,.0f}", delta_color="off")
+            o2.metric("Fatturato", f"€ {opt_summary['fatturato']:,.0f}", delta=f"€ {opt_summary['fatturato'] - opt_summary['fatturato_piano']:,.0f}")
+            o3.metric("Profitto Operativo", f"€ {opt_summary['profitto']:,.0f}", delta=f"€ {opt_summary['profitto'] - opt_summary['profitto_piano']:,.0f}")
+            o4.metric("MER / BE", f"{opt_summary['mer']:.2f} / {be_roas_val:.2f}", delta=f"{opt_summary['mer'] - be_roas_val:.2f}")
+            st.caption("Delta rispetto al piano corrente (Scala Google / Meta della sidebar) valutato con le stesse curve.")
+            
+            st.image(cached_optimizer_chart(df_opt), width='stretch')
+            
+            st.dataframe(df_opt.drop(columns=['Data']).style.format({
+                'Google Ottimale': '€ {:,.0f}', 'Meta Ottimale': '€ {:,.0f}', 'Spesa Totale': '€ {:,.0f}',
+                'Fatturato Previsto': '€ {:,.0f}', 'Profitto Operativo': '€ {:,.0f}', 'Spesa Piano': '€ {:,.0f}', 'MER Previsto': '{:.2f}'}))
+
+        lap(prof, f"Scheda {active_tab}")
+
+        # --- MEMORIA DELLA SESSIONE: tabelle di questo rerun + session_state ---
+        session_objects = {k: v for k, v in globals().items() if isinstance(v, (pd.DataFrame, pd.Series)) and not k.startswith('_')}
+        session_objects.update({f"state.{k}": v for k, v in st.session_state.items() if isinstance(v, (pd.DataFrame, pd.Series))})
+        footprint = memory_footprint(session_objects).sort_values(ascending=False)
+        with memory_box:
+            st.metric("Totale", f"{footprint.sum() / 1024 ** 2:,.2f} MB",
+                      help="Memoria (deep) delle tabelle pandas visibili da questa sessione, comprese le colonne condivise con le altre.")
+            st.caption(f"Storico pulito: {footprint.get('df', 0) / 1024 ** 2:,.2f} MB ({'tipi compatti' if compact_types else 'float64'}), "
+                       "condiviso tra le sessioni salvo le colonne aggiunte da questa")
+            st.dataframe((footprint / 1024).round(1).rename('KB').to_frame())
+            shared = cache_stats()
+            st.markdown("**Cache condivisa (server)**")
+            st.caption(f"{shared['entries']} dataset, {shared['aggregates']} aggregati: "
+                       f"{shared['bytes'] / 1024 ** 2:,.1f} / {shared['max_bytes'] / 1024 ** 2:,.0f} MB · "
+                       f"hit {shared['hits']} / miss {shared['misses']} ({shared['hit_rate']:.0%}) · "
+                       f"aggregati hit {shared['aggregate_hits']} / miss {shared['aggregate_misses']} · eliminati {shared['evictions']}")
+        lap(prof, 'Report memoria')
 
     except Exception as e:
         st.error(f"⚠️ Errore: {e}")
 else:
     st.info("👋 Carica il file CSV per iniziare.")
+
+# --- PROFILAZIONE (opzionale, anche con FORECAST_PROFILE=1) ---
+with st.sidebar.expander("⏱️ Profilazione", expanded=st.session_state.profiling):
+    st.toggle("Misura le fasi di ogni rerun", key="profiling",
+              help="Tempo, righe elaborate e memoria (tracemalloc) per fase. Rallenta leggermente l'app: i tempi vanno letti in proporzione.")
+    st.checkbox("Includi cProfile", key="profiling_cprofile", disabled=not st.session_state.profiling)
+    profile_table = finish_profile(prof)
+    if profile_table is not None:
+        st.caption(f"Ultimo rerun: {profile_table['Tempo (ms)'].sum():,.0f} ms. Memoria misurata sull'intero processo: "
+                   "include le altre sessioni attive; senza picco le fasi sovrapposte ad altre profilazioni.")
+        st.dataframe(profile_table.style.format({
+            'Tempo (ms)': '{:,.1f}', 'Quota %': '{:.1f}%', 'Righe/s': '{:,.0f}', 'Memoria Δ (MB)': '{:+,.2f}', 'Picco (MB)': '{:,.2f}'
+        }, na_rep=''), hide_index=True)
+        profile_meta = {'sorgente': st.session_state.last_uploaded_file, 'scheda': st.session_state.get('active_tab'),
+                        'timestamp': pd.Timestamp.now().isoformat(timespec='seconds')}
+        d1, d2 = st.columns(2)
+        d1.download_button("JSON", profile_json(profile_table, **profile_meta), file_name="profilo_fasi.json", mime="application/json")
+        d2.download_button("CSV", profile_csv(profile_table), file_name="profilo_fasi.csv", mime="text/csv")
+        if prof['profiler'] is not None:
+            st.download_button("cProfile (.prof)", cprofile_dump(prof), file_name="profilo.prof", mime="application/octet-stream",
+                               help="Da aprire con `python -m pstats profilo.prof` o snakeviz.")
+            st.code(cprofile_text(prof, limit=15), language=None)
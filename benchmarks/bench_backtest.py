@@ -0,0 +1,68 @@
+"""Backtest walk-forward: aggregati cumulativi vs run_pipeline ripetuta sullo storico troncato a ogni taglio.
+
+Uso:
+    python benchmarks/bench_backtest.py --stores 1 10 --step 1 --workers 1 4
+
+Per ogni dataset DEMO misura il backtest con gli aggregati cumulativi (forecast_backtest.run_backtest, con
+diversi numeri di processi) e la versione ingenua che rifà run_pipeline sullo storico filtrato per ogni
+taglio e preset, e verifica che le previsioni coincidano entro `rtol`. Esce con codice 1 se non coincidono.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_csv_reader import time_it  # noqa: E402
+from forecast_backtest import run_backtest  # noqa: E402
+from forecast_core import PRESETS, clean_dataframe, generate_demo_data, run_pipeline  # noqa: E402
+
+
+def naive_backtest(df, cols, cutoffs, mesi_prev):
+    """Previsione di ogni preset da ogni taglio rifacendo la pipeline completa sullo storico fino al taglio."""
+    frames = []
+    for cutoff in cutoffs:
+        history = df[df['Data_Interna'] <= cutoff]
+        for name, p in PRESETS.items():
+            res = run_pipeline(None, mesi_prev=mesi_prev, manual_trend=p['trend_val'], m_google=p['google_scale'],
+                               m_meta=p['meta_scale'], sat_factor=p['sat_val'], cleaned=(history.copy(), cols))
+            frames.append(res['df_prev'][['Data', 'Fatturato Previsto', 'Spesa Totale']].assign(Preset=name, Cutoff=cutoff))
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stores', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--months', type=int, default=3)
+    parser.add_argument('--step', type=int, default=1)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--rtol', type=float, default=1e-9)
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'negozi':>6} {'righe':>8} {'tagli':>6} {'processi':>8} {'cumulativi':>10} {'ingenuo':>9} {'speedup':>8}  max errore relativo")
+    for n_stores in args.stores:
+        df, cols = clean_dataframe(generate_demo_data(seed=0, n_stores=n_stores))
+        timings = {w: time_it(lambda: run_backtest(df, cols, args.months, args.step, workers=w), 1) for w in args.workers}
+        detail = timings[args.workers[0]][1]
+        cutoffs = detail['Cutoff'].drop_duplicates()
+        t_naive, naive = time_it(lambda: naive_backtest(df, cols, cutoffs, args.months), 1)
+
+        merged = detail.merge(naive, on=['Preset', 'Cutoff', 'Data'], how='left', suffixes=('', ' Pipeline'), validate='one_to_one')
+        got = merged[['Fatturato Previsto', 'Spesa Prevista']].to_numpy(dtype=float)
+        ref = merged[['Fatturato Previsto Pipeline', 'Spesa Totale']].to_numpy(dtype=float)
+        error = float(np.max(np.abs(got - ref) / np.abs(ref))) if len(ref) else 0.0  # NaN se manca una previsione
+        failed |= not error <= args.rtol
+        for w, (seconds, _) in timings.items():
+            print(f"{n_stores:>6} {len(df):>8,} {len(cutoffs):>6} {w:>8} {seconds:>9.3f}s {t_naive:>8.2f}s "
+                  f"{t_naive / seconds:>7.1f}x  {error:.1e}")
+
+    print("OK: stesse previsioni della pipeline completa" if not failed else f"ERRORE: differenze oltre rtol={args.rtol}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
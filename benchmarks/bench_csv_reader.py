@@ -0,0 +1,91 @@
+"""Benchmark: lettura CSV attuale (`sep=None, engine='python'`) vs `read_csv_fast`.
+
+Uso:
+    python benchmarks/bench_csv_reader.py --rows 10000 100000 1000000 --sep ";"
+
+I file sintetici imitano un export settimanale/SKU con le colonne note del tool.
+Con `--skip-python-above N` si evita il motore Python (molto lento) sulle taglie grandi.
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from forecast_io import default_engine, read_csv_fast  # noqa: E402
+
+
+def synthetic_export(n_rows, sep=',', formatted=False, seed=0):
+    """Genera i byte di un export CSV sintetico con `n_rows` righe."""
+    rng = np.random.default_rng(seed)
+    years = rng.integers(2019, 2026, n_rows)
+    weeks = rng.integers(1, 53, n_rows)
+    sales = rng.uniform(1000, 50000, n_rows).round(2)
+    df = pd.DataFrame({
+        'Year Week': [f"{y}{w:02d}" for y, w in zip(years, weeks)],
+        'Cost': (sales * rng.uniform(0.05, 0.1, n_rows)).round(2),
+        'Amount Spent': (sales * rng.uniform(0.05, 0.15, n_rows)).round(2),
+        'Total sales': sales,
+        'Returns': -(sales * rng.uniform(0.05, 0.2, n_rows)).round(2),
+        'Discounts': -(sales * 0.05).round(2),
+        'Average order value': rng.uniform(100, 140, n_rows).round(2),
+        'Orders': rng.integers(10, 400, n_rows),
+        'Returning customer rate': [f"{v}%" for v in rng.integers(10, 30, n_rows)],
+        'Conversions Value': (sales * 0.6).round(2),
+        'Website Purchases Conversion Value': (sales * 0.5).round(2),
+        'Avg. CPC': 0.85,
+        'CPC (All)': 0.65,
+        'CPM (Cost per 1,000 Impressions)': 12.5,
+        'Impressions': rng.integers(1000, 100000, n_rows),
+        'Frequency': 1.2,
+        'Items': rng.integers(10, 600, n_rows),
+        'Gross sales': (sales * 1.05).round(2),
+    })
+    if formatted:
+        df['Total sales'] = [f"€{v:,.2f}" for v in df['Total sales']]
+    return df.to_csv(index=False, sep=sep).encode()
+
+
+def time_it(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--sep', default=',')
+    parser.add_argument('--formatted', action='store_true', help="valori di vendita formattati come '€1,234.00'")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-python-above', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    engines = ['c'] + (['pyarrow'] if default_engine() == 'pyarrow' else [])
+    print(f"{'righe':>10} {'python sep=None':>16} " + ' '.join(f"{'fast/' + e:>14}" for e in engines) + f" {'speedup':>8}")
+    for n in args.rows:
+        data = synthetic_export(n, sep=args.sep, formatted=args.formatted)
+        if args.skip_python_above is not None and n > args.skip_python_above:
+            t_py = float('nan')
+        else:
+            t_py, _ = time_it(lambda: pd.read_csv(io.BytesIO(data), sep=None, engine='python'), 1)
+        t_fast = {}
+        for e in engines:
+            t_fast[e], out = time_it(lambda: read_csv_fast(data, engine=e), args.repeat)
+            assert len(out) == n and out.shape[1] == 18, out.shape
+        best = min(t_fast.values())
+        py_txt = '-' if np.isnan(t_py) else f"{t_py:.3f}s"
+        speedup = '-' if np.isnan(t_py) else f"{t_py / best:.1f}x"
+        print(f"{n:>10} {py_txt:>16} " + ' '.join(f"{t_fast[e]:>13.3f}s" for e in engines) + f" {speedup:>8}")
+
+
+if __name__ == '__main__':
+    main()
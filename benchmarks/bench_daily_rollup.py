@@ -0,0 +1,77 @@
+"""Export giornaliero vs lo stesso export già settimanale: stessa tabella pulita, anche con più negozi.
+
+Uso:
+    python benchmarks/bench_daily_rollup.py --stores 1 3 20
+
+Per ogni dataset DEMO giornaliero costruisce l'export settimanale equivalente con un groupby indipendente
+(somme per negozio e settimana ISO, medie per CPC / CPM / frequenza / tasso clienti di ritorno, AOV come
+fatturato / ordini se ci sono ordini, settimane incomplete scartate) e verifica che clean_dataframe dia la stessa tabella
+(stessi negozi, settimane e valori entro `rtol`) nei due casi. Riporta anche i tempi di pulizia.
+Esce con codice 1 se le tabelle differiscono.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_csv_reader import time_it  # noqa: E402
+from forecast_core import clean_dataframe, detect_columns, generate_demo_data, rollup_value_columns  # noqa: E402
+
+
+def weekly_export(daily):
+    """L'export settimanale (una riga per negozio e settimana) con gli stessi dati dell'export giornaliero."""
+    cols = detect_columns(daily.columns)
+    sum_cols, mean_cols = rollup_value_columns(cols)
+    daily = daily.assign(**{cols['ret_rate']: daily[cols['ret_rate']].str.rstrip('%').astype(float)})
+    keys = [k for k in ['Store', cols['date']] if k in daily.columns]
+    agg = {c: 'sum' for c in sum_cols if c in daily.columns}
+    agg.update({c: 'mean' for c in mean_cols if c in daily.columns})
+    agg[cols['day']] = 'nunique'
+    weekly = daily.groupby(keys, as_index=False).agg(agg)
+    orders = weekly[cols['orders']]
+    weekly[cols['aov']] = (weekly[cols['sales']] / orders.where(orders > 0)).fillna(weekly[cols['aov']])
+    return weekly[weekly.pop(cols['day']) == 7]
+
+
+def compare(a, b):
+    """Massimo errore relativo tra due tabelle pulite, allineate per negozio e settimana (inf se non allineabili)."""
+    keys = [k for k in ['Store', 'Data_Interna'] if k in a.columns]
+    if keys != [k for k in ['Store', 'Data_Interna'] if k in b.columns] or len(a) != len(b):
+        return np.inf
+    a, b = (t.sort_values(keys, kind='stable').reset_index(drop=True) for t in (a, b))
+    if not a[keys].equals(b[keys]):
+        return np.inf
+    common = [c for c in a.select_dtypes('number').columns if c in b.columns and c != 'Giorni']
+    x, y = a[common].to_numpy(dtype=float), b[common].to_numpy(dtype=float)
+    same = (x == y) | (np.isnan(x) & np.isnan(y))  # anche inf (ROAS con spesa zero) e NaN uguali
+    diff, scale = np.abs(np.where(same, 0.0, x - y)), np.maximum(np.abs(x), np.abs(y))
+    return float(np.max(np.divide(diff, scale, out=np.where(same, 0.0, np.inf), where=~same & (scale > 0)), initial=0.0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stores', type=int, nargs='+', default=[1, 3, 20])
+    parser.add_argument('--rtol', type=float, default=1e-9)
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'negozi':>6} {'righe giorn.':>12} {'righe sett.':>11} {'t giorn.':>9} {'t sett.':>8}  max errore relativo")
+    for n_stores in args.stores:
+        daily = generate_demo_data(seed=0, freq='D', n_stores=n_stores)
+        weekly = weekly_export(daily)
+        t_daily, (from_daily, _) = time_it(lambda: clean_dataframe(daily.copy()), 3)
+        t_weekly, (from_weekly, _) = time_it(lambda: clean_dataframe(weekly.copy()), 3)
+        error = compare(from_daily, from_weekly)
+        failed |= not error <= args.rtol
+        print(f"{n_stores:>6} {len(daily):>12,} {len(from_weekly):>11,} {t_daily:>8.3f}s {t_weekly:>7.3f}s  {error:.1e}")
+
+    print("OK: stessa tabella pulita" if not failed else f"ERRORE: tabelle diverse oltre rtol={args.rtol}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""Benchmark: caricamento a freddo (lettura CSV + pulizia) vs a caldo (cache su disco delle tabelle pulite).
+
+Uso:
+    python benchmarks/bench_disk_cache.py --rows 10000 100000 1000000 --formats feather parquet npy
+
+Per ogni taglia misura il primo caricamento (miss: parsing, pulizia e scrittura in cache) e i
+successivi (hit: lettura della tabella pulita, in memory-map per feather e npy).
+"""
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_csv_reader import synthetic_export, time_it  # noqa: E402
+from forecast_cache import cache_key, content_hash, default_format, load_cleaned, _size  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--formats', nargs='+', default=[default_format()], choices=['feather', 'parquet', 'npy'])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'righe':>10} {'formato':>8} {'freddo':>9} {'caldo':>9} {'speedup':>8} {'disco':>9}")
+    for n in args.rows:
+        data = synthetic_export(n)
+        key = cache_key(content_hash(data))
+        for fmt in args.formats:
+            with tempfile.TemporaryDirectory() as directory:
+                t_cold, (_, _, hit) = time_it(lambda: load_cleaned(data, directory, fmt=fmt), 1)
+                assert not hit
+                t_warm, (df, _, hit) = time_it(lambda: load_cleaned(data, directory, fmt=fmt), args.repeat)
+                assert hit and len(df) == n, (hit, len(df))
+                size_mb = _size(os.path.join(directory, key)) / 1024 ** 2
+            print(f"{n:>10} {fmt:>8} {t_cold:>8.3f}s {t_warm:>8.3f}s {t_cold / t_warm:>7.1f}x {size_mb:>7.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Memoria della tabella pulita con tipi compatti (optimize_dtypes) e controllo di tolleranza delle previsioni.
+
+Uso:
+    python benchmarks/bench_memory.py --stores 1 10 --freqs W D --rtol 1e-4
+
+Per ogni dataset DEMO confronta la memoria (deep) della tabella pulita float64 con quella compatta e
+verifica che previsione (df_prev), trend YoY, saturazione suggerita, tabella Insight AI e bande Monte
+Carlo calcolate sulla versione compatta restino entro `rtol` da quelle float64. Esce con codice 1
+se una qualunque differenza supera la tolleranza.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_csv_reader import time_it  # noqa: E402
+from forecast_core import (  # noqa: E402
+    DEFAULT_ECONOMICS, ai_monthly_table, clean_dataframe, compute_economics, forecast_uncertainty,
+    generate_demo_data, memory_footprint, optimize_dtypes, run_pipeline, simulate_forecast
+)
+
+
+def outputs(df, cols, economics):
+    """Risultati confrontati: pipeline con i parametri di default, Insight AI e bande Monte Carlo."""
+    res = run_pipeline(None, economics, mesi_prev=12, manual_trend=0.1, m_google=1.3, m_meta=0.8, cleaned=(df.copy(), cols))
+    uncertainty = forecast_uncertainty(res['df'], res['df_annual'])
+    bands, totals = simulate_forecast(res['seasonal'], pd.DatetimeIndex(res['df_prev']['Data']), res['growth_rate'], 0.1, 1.3, 0.8,
+                                      res['sat_factor'], economics, cols['google'], cols['meta'], uncertainty,
+                                      n_paths=2000, seed=0)
+    return {
+        'df_prev': res['df_prev'].select_dtypes('number').to_numpy(dtype=float),
+        'growth_rate': np.array([res['growth_rate']]),
+        'suggested_saturation': np.array([res['suggested_saturation']]),
+        'ai_df': ai_monthly_table(res['df'], cols).select_dtypes('number').to_numpy(dtype=float),
+        'bands': bands.select_dtypes('number').to_numpy(dtype=float),
+        'totals': pd.DataFrame(totals).to_numpy(dtype=float),
+    }
+
+
+def max_rel_error(a, b):
+    """Massima differenza assoluta in rapporto alla scala della colonna (valori vicini a zero non la falsano)."""
+    a, b = np.atleast_2d(a.T).T, np.atleast_2d(b.T).T
+    scale = np.nanmax(np.abs(a), axis=0)
+    diff = np.nanmax(np.abs(a - b), axis=0)
+    rel = np.divide(diff, scale, out=np.zeros_like(diff), where=scale > 1e-9)
+    return float(rel.max()) if rel.size else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stores', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--freqs', nargs='+', default=['W', 'D'], choices=['W', 'D'])
+    parser.add_argument('--rtol', type=float, default=1e-4)
+    args = parser.parse_args(argv)
+    economics = compute_economics(**DEFAULT_ECONOMICS)
+
+    failed = False
+    print(f"{'negozi':>6} {'freq':>4} {'righe':>9} {'float64':>9} {'compatta':>9} {'riduz.':>7} {'t conv.':>8}  max errore relativo")
+    for n_stores in args.stores:
+        for freq in args.freqs:
+            df, cols = clean_dataframe(generate_demo_data(seed=7, freq=freq, n_stores=n_stores))
+            t_conv, compact = time_it(lambda: optimize_dtypes(df), 3)
+            sizes = memory_footprint({'full': df, 'compact': compact}) / 1024 ** 2
+
+            ref, got = outputs(df, cols, economics), outputs(compact, cols, economics)
+            errors = {k: max_rel_error(ref[k], got[k]) for k in ref}
+            worst = max(errors, key=errors.get)
+            failed |= errors[worst] > args.rtol
+            print(f"{n_stores:>6} {freq:>4} {len(df):>9,} {sizes['full']:>7.2f}MB {sizes['compact']:>7.2f}MB "
+                  f"{1 - sizes['compact'] / sizes['full']:>6.0%} {t_conv:>7.3f}s  {errors[worst]:.1e} ({worst})")
+
+    print("OK: entro la tolleranza" if not failed else f"ERRORE: differenze oltre rtol={args.rtol}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""Benchmark della pipeline di previsione, fase per fase, su dataset sintetici di taglia crescente.
+
+Uso:
+    python benchmarks/bench_pipeline.py -o risultati.json
+    python benchmarks/bench_pipeline.py --profiles 1x-W 100x-D --repeat 5 --compare risultati_prima.json
+
+Fasi misurate (ognuna sull'output della precedente):
+    csv_parse          read_csv_fast sui byte dell'export
+    iso_week_parse     parse_iso_week_series sulla colonna `Year Week`
+    clean              clean_dataframe completa (include il parsing delle settimane e, se giornaliero, rollup_daily)
+    derived_columns    add_operating_profit (colonne che dipendono dalla sidebar)
+    elasticity_growth  annual_totals + suggest_saturation + yoy_growth
+    seasonal_table     media per settimana ISO
+    forecast           forecast_dates + build_forecast (12 mesi)
+    ai_monthly         ai_monthly_table + score_months
+
+Per ogni fase: tempo migliore su `--repeat` esecuzioni, righe in ingresso alla fase (l'export per lettura e
+pulizia, la tabella settimanale pulita per le fasi successive: negozi x settimane), throughput (righe in ingresso
+al secondo) e picco di memoria allocata durante la fase (tracemalloc, misurato in un'esecuzione separata per non falsare i tempi).
+Con `-o` i risultati, con versione del codice e delle librerie, vanno in un file JSON; con `--compare` si confrontano
+con un file precedente e le fasi più lente di oltre `--threshold` vengono segnalate (codice di uscita 1).
+"""
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from forecast_core import (  # noqa: E402
+    DEFAULT_ECONOMICS, add_operating_profit, ai_monthly_table, annual_totals, build_forecast, clean_dataframe,
+    compute_economics, forecast_dates, generate_demo_data, parse_iso_week_series, score_months, seasonal_table,
+    suggest_saturation, yoy_growth
+)
+from forecast_io import read_csv_fast  # noqa: E402
+
+# Dataset sintetici: negozi x frequenza, storico DEMO 2020-2026 (~6 anni)
+PROFILES = {
+    '1x-W': (1, 'W'),
+    '10x-W': (10, 'W'),
+    '100x-W': (100, 'W'),
+    '1x-D': (1, 'D'),
+    '100x-D': (100, 'D'),
+    '1000x-D': (1000, 'D'),
+}
+DEFAULT_PROFILES = ['1x-W', '10x-W', '100x-W', '1x-D', '100x-D']
+
+
+def stages(data, economics):
+    """Fasi della pipeline come (nome, funzione(stato) -> stato), nell'ordine di esecuzione."""
+    def elasticity(st):
+        df_annual = annual_totals(st['df'])
+        return {**st, 'df_annual': df_annual, 'sat': float(suggest_saturation(df_annual)), 'growth': yoy_growth(st['df'])}
+
+    def forecast(st):
+        future = forecast_dates(st['df']['Data_Interna'].max(), 12)
+        cols = st['cols']
+        return {**st, 'df_prev': build_forecast(st['seasonal'], future, st['growth'], 0.0, 1.2, 1.2, st['sat'],
+                                                economics['be_aov'], cols['google'], cols['meta'])}
+
+    def ai_monthly(st):
+        cols = st['cols']
+        ai_df = ai_monthly_table(st['df'], cols)
+        col_ret = cols['ret_rate'] if cols['ret_rate'] in ai_df.columns else None
+        return {**st, 'ai_df': score_months(ai_df, economics['be_roas_val'], col_ret_rate=col_ret)}
+
+    return [
+        ('csv_parse', lambda st: {**st, 'raw': read_csv_fast(data)}),
+        ('iso_week_parse', lambda st: {**st, 'weeks': parse_iso_week_series(st['raw']['Year Week'])}),
+        ('clean', lambda st: dict(zip(['df', 'cols'], clean_dataframe(st['raw'])), raw=st['raw'])),
+        ('derived_columns', lambda st: {**st, 'df': add_operating_profit(st['df'].copy(), st['cols'], economics['profit_order'], economics['be_aov'])}),
+        ('elasticity_growth', elasticity),
+        ('seasonal_table', lambda st: {**st, 'seasonal': seasonal_table(st['df'], st['cols'])}),
+        ('forecast', forecast),
+        ('ai_monthly', ai_monthly),
+    ]
+
+
+def measure(fn, state, repeat):
+    """(tempo migliore in s, picco di memoria allocata in MB, nuovo stato)."""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        out = fn(state)
+        best = min(best, time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    fn(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024 ** 2, out
+
+
+def run_profile(name, repeat, economics):
+    n_stores, freq = PROFILES[name]
+    data = generate_demo_data(seed=0, freq=freq, n_stores=n_stores).to_csv(index=False).encode()
+    export_rows = data.count(b'\n') - 1
+    results, state = [], {}
+    for stage, fn in stages(data, economics):
+        rows = len(state['df']) if 'df' in state else export_rows  # dopo `clean` si lavora sulla tabella settimanale
+        seconds, peak_mb, state = measure(fn, state, repeat)
+        results.append({
+            'profile': name, 'stores': n_stores, 'freq': freq, 'export_rows': export_rows, 'rows': rows, 'stage': stage,
+            'seconds': seconds, 'rows_per_s': rows / seconds if seconds > 0 else None, 'peak_mb': peak_mb,
+        })
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit or None, 'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+        'platform': platform.platform(), 'processor': platform.processor() or platform.machine(),
+    }
+
+
+def compare(results, previous, threshold, min_delta):
+    """Stampa il rapporto tempo attuale / precedente per fase; restituisce le fasi oltre la soglia.
+
+    Le fasi di pochi millisecondi oscillano molto: serve anche un rallentamento assoluto di almeno `min_delta` s.
+    """
+    before = {(r['profile'], r['stage']): r['seconds'] for r in previous['results']}
+    regressions = []
+    print(f"\nConfronto con {previous['environment'].get('commit') or 'file precedente'}:")
+    for r in results:
+        old = before.get((r['profile'], r['stage']))
+        if not old: continue
+        ratio = r['seconds'] / old
+        flag = ''
+        if ratio > 1 + threshold and r['seconds'] - old >= min_delta:
+            flag = '  REGRESSIONE'
+            regressions.append(r)
+        print(f"{r['profile']:>8} {r['stage']:>18} {old:>9.4f}s -> {r['seconds']:>9.4f}s {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=DEFAULT_PROFILES, choices=list(PROFILES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help="file JSON dei risultati (senza, i risultati sono solo stampati)")
+    parser.add_argument('--compare', help="file JSON di un'esecuzione precedente")
+    parser.add_argument('--threshold', type=float, default=0.2, help="rallentamento tollerato nel confronto (0.2 = +20%%)")
+    parser.add_argument('--min-delta', type=float, default=0.005, help="rallentamento assoluto minimo (s) per segnalare una regressione")
+    args = parser.parse_args(argv)
+    economics = compute_economics(**DEFAULT_ECONOMICS)
+
+    results = []
+    print(f"{'profilo':>8} {'righe export':>12} {'fase':>18} {'righe in':>10} {'tempo':>9} {'righe/s':>12} {'picco':>9}")
+    for name in args.profiles:
+        for r in run_profile(name, args.repeat, economics):
+            results.append(r)
+            print(f"{r['profile']:>8} {r['export_rows']:>12,} {r['stage']:>18} {r['rows']:>10,} {r['seconds']:>8.4f}s "
+                  f"{r['rows_per_s'] or 0:>12,.0f} {r['peak_mb']:>7.1f}MB")
+
+    if args.output:
+        report = {'environment': environment(), 'repeat': args.repeat, 'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nRisultati salvati in {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_delta)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Memoria di N sessioni sullo stesso export: copia per sessione (come st.cache_data) vs cache condivisa.
+
+Uso:
+    python benchmarks/bench_shared_cache.py --rows 100000 --sessions 1 5 20
+
+Ogni "sessione" è un thread che carica il dataset, aggiunge Profitto_Operativo (colonna che dipende dalla
+sidebar) e chiede la stagionalità. Con la copia per sessione il valore in cache viene deserializzato a ogni
+accesso (pickle, come fa st.cache_data); con forecast_shared le sessioni ricevono viste della stessa tabella.
+Si misura la memoria allocata e ancora in uso dopo che tutte le sessioni hanno caricato (tracemalloc),
+il numero di pulizie eseguite e i contatori hit / miss della cache condivisa.
+"""
+import argparse
+import pickle
+import sys
+import threading
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_csv_reader import synthetic_export  # noqa: E402
+from forecast_cache import content_hash  # noqa: E402
+from forecast_core import (  # noqa: E402
+    DEFAULT_ECONOMICS, add_operating_profit, clean_dataframe, compute_economics, seasonal_table
+)
+from forecast_io import read_csv_fast  # noqa: E402
+from forecast_shared import cache_stats, clear_cache, get_aggregate, get_dataset  # noqa: E402
+
+
+def run_sessions(n, open_session):
+    """Avvia `n` sessioni concorrenti; restituisce (oggetti tenuti dalle sessioni, MB allocati ancora in uso)."""
+    held = [None] * n
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    threads = [threading.Thread(target=lambda i=i: held.__setitem__(i, open_session())) for i in range(n)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    used = (tracemalloc.get_traced_memory()[0] - base) / 1024 ** 2
+    tracemalloc.stop()
+    return held, used
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 5, 20])
+    args = parser.parse_args(argv)
+    economics = compute_economics(**DEFAULT_ECONOMICS)
+
+    data = synthetic_export(args.rows)
+    key = content_hash(data)
+    cleanings = {'n': 0}
+
+    def load():
+        cleanings['n'] += 1
+        return clean_dataframe(read_csv_fast(data))
+
+    cleaned = pickle.dumps(load())  # valore di st.cache_data: serializzato una volta, deserializzato per sessione
+
+    def per_session_copy():
+        df, cols = pickle.loads(cleaned)
+        add_operating_profit(df, cols, economics['profit_order'], economics['be_aov'])
+        return df, seasonal_table(df, cols)
+
+    def shared():
+        df, cols = get_dataset(key, load)
+        add_operating_profit(df, cols, economics['profit_order'], economics['be_aov'])
+        return df, get_aggregate(key, 'seasonal', lambda: seasonal_table(df, cols))
+
+    print(f"{'sessioni':>8} {'copie (MB)':>11} {'condivisa (MB)':>15} {'pulizie':>8} {'hit':>5} {'miss':>5}")
+    for n in args.sessions:
+        _, used_copy = run_sessions(n, per_session_copy)
+        clear_cache()
+        cleanings['n'] = 0
+        held, used_shared = run_sessions(n, shared)
+        stats = cache_stats()
+        df_shared, _ = get_dataset(key, load)
+        assert 'Profitto_Operativo' not in df_shared.columns, "una sessione ha modificato la tabella condivisa"
+        del held
+        print(f"{n:>8} {used_copy:>11.1f} {used_shared:>15.1f} {cleanings['n']:>8} {stats['hits']:>5} {stats['misses']:>5}")
+
+
+if __name__ == '__main__':
+    main()
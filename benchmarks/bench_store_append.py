@@ -0,0 +1,99 @@
+"""Storico incrementale (forecast_store.append_history) vs ricalcolo completo sullo stesso export.
+
+Uso:
+    python benchmarks/bench_store_append.py --stores 1 3 --batches 2 6
+
+Per ogni dataset DEMO (settimanale e giornaliero) divide l'export in `--batches` caricamenti successivi e li
+aggiunge uno alla volta a uno storico in una cartella temporanea; negli export giornalieri i tagli cadono di
+mercoledì, quindi ogni caricamento spezza una settimana a metà. Poi confronta forecast_from_store con
+run_pipeline sull'export intero: settimane nello storico, previsione, stagionalità, trend YoY e tabella
+mensile dell'Insight AI entro `--rtol`. Esce con codice 1 se qualcosa differisce.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from forecast_core import (  # noqa: E402
+    DEFAULT_ECONOMICS, ai_monthly_table, clean_dataframe, compute_economics, generate_demo_data, run_pipeline
+)
+from forecast_store import append_history, forecast_from_store  # noqa: E402
+
+
+def split_batches(raw, freq, n_batches):
+    """Caricamenti successivi dell'export; per i giornalieri ogni taglio cade di mercoledì (settimana spezzata)."""
+    if freq == 'W':
+        periods = raw['Year Week'].astype(str)
+    else:
+        periods = pd.to_datetime(raw['Day'])
+    values = np.sort(periods.unique())
+    cuts = [values[len(values) * i // n_batches] for i in range(1, n_batches)]
+    if freq != 'W':
+        cuts = [pd.Timestamp(c) - pd.Timedelta(days=pd.Timestamp(c).weekday()) + pd.Timedelta(days=2) for c in cuts]
+    bounds = [None, *cuts, None]
+    return [raw[((periods >= lo) if lo is not None else True) & ((periods < hi) if hi is not None else True)]
+            for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def max_rel_error(a, b):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    if a.shape != b.shape: return np.inf
+    same = (a == b) | (np.isnan(a) & np.isnan(b))
+    scale = np.nanmax(np.abs(a), axis=0, initial=0.0)
+    diff = np.where(same, 0.0, np.abs(a - b))
+    return float(np.max(np.divide(diff, scale, out=np.where(same, 0.0, np.inf), where=~same & (scale > 0)), initial=0.0))
+
+
+def compare(res_store, res_full, ai_full):
+    """Massimo errore relativo per risultato: incrementale vs ricalcolo completo."""
+    ai_store = res_store['ai_df']
+    common = [c for c in ai_full.select_dtypes('number').columns if c in ai_store.columns]
+    return {
+        'df_prev': max_rel_error(res_store['df_prev'].select_dtypes('number'), res_full['df_prev'].select_dtypes('number')),
+        'seasonal': max_rel_error(res_store['seasonal'].select_dtypes('number'), res_full['seasonal'].select_dtypes('number')),
+        'growth_rate': max_rel_error([res_store['growth_rate']], [res_full['growth_rate']]),
+        'ai_df': max_rel_error(ai_store[common], ai_full[common]) if ai_store.index.equals(ai_full.index) else np.inf,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stores', type=int, nargs='+', default=[1, 3])
+    parser.add_argument('--batches', type=int, nargs='+', default=[2, 6])
+    parser.add_argument('--rtol', type=float, default=1e-9)
+    args = parser.parse_args(argv)
+    economics = compute_economics(**DEFAULT_ECONOMICS)
+
+    failed = False
+    print(f"{'negozi':>6} {'freq':>4} {'caric.':>6} {'sett. storico':>13} {'sett. complete':>14} {'t append':>9}  max errore relativo")
+    for n_stores in args.stores:
+        for freq in ['W', 'D']:
+            raw = generate_demo_data(seed=3, freq=freq, n_stores=n_stores)
+            full = run_pipeline(None, economics, mesi_prev=6, cleaned=clean_dataframe(raw.copy()))
+            ai_full = ai_monthly_table(full['df'], full['cols'])
+            for n_batches in args.batches:
+                with tempfile.TemporaryDirectory() as path:
+                    t0 = time.perf_counter()
+                    for batch in split_batches(raw, freq, n_batches):
+                        report = append_history(path, batch.copy())
+                    seconds = time.perf_counter() - t0
+                    res = forecast_from_store(path, economics, mesi_prev=6)
+                errors = compare(res, full, ai_full)
+                worst = max(errors, key=errors.get)
+                ok = report['Righe Totali'] == len(full['df']) and errors[worst] <= args.rtol
+                failed |= not ok
+                print(f"{n_stores:>6} {freq:>4} {n_batches:>6} {report['Righe Totali']:>13,} {len(full['df']):>14,} "
+                      f"{seconds:>8.2f}s  {errors[worst]:.1e} ({worst}){'' if ok else '  DIVERSO'}")
+
+    print("OK: storico incrementale uguale al ricalcolo completo" if not failed else f"ERRORE: differenze oltre rtol={args.rtol}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Picco di memoria e tempo: lettura completa (read_csv_fast + clean_dataframe) vs lettura a blocchi (stream_clean).
+
+Uso:
+    python benchmarks/bench_streaming.py --stores 50 200 --chunksize 200000
+
+Per ogni taglia scrive su disco un export DEMO giornaliero con `--stores` negozi (una riga per giorno e negozio,
+come un export per SKU), poi legge il file in un processo separato per ciascuna modalità e riporta il picco di
+memoria residente (RSS) del processo e il tempo. Verifica anche che le due modalità diano le stesse settimane
+per negozio (fatturato netto e spesa Ads) entro `--rtol`; esce con codice 1 in caso contrario.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def peak_rss_mb():
+    """Picco RSS del processo: VmHWM su Linux (ru_maxrss sopravvive a fork + exec e riporterebbe quello del padre)."""
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM')) / 1024
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, path, chunksize):
+    """Eseguita nel processo figlio: legge `path` e stampa tempo e totali settimanali in JSON."""
+    from forecast_core import clean_dataframe
+    from forecast_io import read_csv_fast
+    from forecast_stream import stream_clean
+
+    base_mb = peak_rss_mb()  # interprete + librerie importate
+    t0 = time.perf_counter()
+    if mode == 'completa':
+        df, _ = clean_dataframe(read_csv_fast(path))
+    else:
+        df, _ = stream_clean(path, chunksize=chunksize)
+    seconds = time.perf_counter() - t0
+    keys = [k for k in ['Store', 'Data_Interna'] if k in df.columns]
+    weekly = df.groupby(keys)[['Fatturato_Netto', 'Spesa_Ads_Totale']].sum()
+    print(json.dumps({'seconds': seconds, 'weeks': len(weekly), 'values': weekly.to_numpy().tolist(),
+                      'peak_mb': peak_rss_mb(), 'base_mb': base_mb}))
+
+
+def measure(mode, path, chunksize):
+    """Risultato di una modalità, letta in un processo nuovo (il picco RSS non risente delle altre)."""
+    out = subprocess.run([sys.executable, __file__, '--run', mode, path, '--chunksize', str(chunksize)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stores', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--rtol', type=float, default=1e-9)
+    parser.add_argument('--run', nargs=2, metavar=('MODO', 'FILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.run:
+        return run_mode(*args.run, args.chunksize)
+
+    from forecast_core import generate_demo_data
+
+    failed = False
+    print(f"{'negozi':>6} {'righe':>10} {'file':>9} {'modalità':>9} {'tempo':>8} {'picco RSS':>10} {'oltre import':>12} {'righe sett.':>11}")
+    for n_stores in args.stores:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.csv')
+            raw = generate_demo_data(seed=0, freq='D', n_stores=n_stores)
+            raw.to_csv(path, index=False)
+            n_rows = len(raw)
+            del raw
+            size_mb = os.path.getsize(path) / 1024 ** 2
+            results = {mode: measure(mode, path, args.chunksize) for mode in ['blocchi', 'completa']}
+
+        ref, got = np.array(results['completa']['values']), np.array(results['blocchi']['values'])
+        ok = ref.shape == got.shape and np.allclose(got, ref, rtol=args.rtol, atol=0)
+        failed |= not ok
+        for mode, res in results.items():
+            print(f"{n_stores:>6} {n_rows:>10,} {size_mb:>7.0f}MB {mode:>9} {res['seconds']:>7.2f}s {res['peak_mb']:>8.0f}MB "
+                  f"{res['peak_mb'] - res['base_mb']:>10.0f}MB {res['weeks']:>11,}{'' if ok else '  DIVERSE'}")
+
+    print("OK: stesse settimane" if not failed else f"ERRORE: settimane diverse oltre rtol={args.rtol}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
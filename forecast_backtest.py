@@ -0,0 +1,192 @@
+"""Backtest walk-forward della previsione: accuratezza storica per orizzonte e per preset.
+
+Da ogni data di taglio (cutoff, es. ogni 4 settimane) si rifà la previsione con la stessa logica di
+run_pipeline usando solo lo storico fino al taglio (media stagionale per settimana ISO x trend YoY x
+`ratio ** sat_factor`, con la saturazione suggerita ricalcolata al taglio per "Auto-Calibra") e la si
+confronta con fatturato netto e spesa Ads reali delle settimane successive.
+
+Lo storico non viene ri-filtrato per ogni taglio: si calcolano una volta gli aggregati cumulativi per data
+(somme per settimana ISO, per anno e fatturato progressivo) e ogni taglio legge la riga corrispondente.
+I tagli sono valutati a blocchi in un pool di processi; gli aggregati arrivano a ogni processo una volta sola.
+
+Con più negozi nello stesso file la previsione è per riga (media tra negozi, come in run_pipeline), quindi
+anche il reale di ogni settimana è la media per riga.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from forecast_core import PRESETS, forecast_dates, project_forecast, suggest_saturation
+
+DETAIL_COLUMNS = [
+    'Preset', 'Cutoff', 'Data', 'Orizzonte', 'Fatturato Previsto', 'Fatturato Reale', 'Spesa Prevista', 'Spesa Reale'
+]
+
+
+def backtest_prefix(df, cols):
+    """Aggregati cumulativi per data dello storico pulito: bastano a ricostruire la previsione a ogni taglio.
+
+    Ogni data (lunedì) ha una sola settimana ISO e un solo anno, quindi le somme per data, cumulate nel tempo,
+    danno per ogni taglio `t` le stesse medie stagionali, totali annui e finestre YoY del DataFrame troncato.
+    """
+    value_cols = ['Fatturato_Netto', cols['google'], cols['meta'], 'Spesa_Ads_Totale']
+    by_date = df.groupby('Data_Interna', sort=True).agg(
+        **{c: (c, 'sum') for c in dict.fromkeys(value_cols)}, _righe=('Fatturato_Netto', 'size'),
+        Week=('Week', 'first'), Year=('Year', 'first'))
+    dates = by_date.index
+    n = len(dates)
+    values = by_date[value_cols[:3]].to_numpy(dtype=float)
+    rows = by_date['_righe'].to_numpy(dtype=float)
+
+    # (date x settimana ISO x [fatturato, Google, Meta, righe]) cumulato nel tempo
+    weeks = by_date['Week'].to_numpy(dtype=int)
+    seasonal = np.zeros((n, 54, 4))
+    seasonal[np.arange(n), weeks, :3] = values
+    seasonal[np.arange(n), weeks, 3] = rows
+
+    # (date x anno x [spesa, fatturato, righe]) cumulato nel tempo
+    years, year_idx = np.unique(by_date['Year'].to_numpy(dtype=int), return_inverse=True)
+    annual = np.zeros((n, len(years), 3))
+    annual[np.arange(n), year_idx, 0] = by_date['Spesa_Ads_Totale'].to_numpy(dtype=float)
+    annual[np.arange(n), year_idx, 1] = values[:, 0]
+    annual[np.arange(n), year_idx, 2] = rows
+
+    return {
+        'cols': cols, 'dates': dates, 'years': years,
+        'seasonal': seasonal.cumsum(axis=0), 'annual': annual.cumsum(axis=0), 'sales': values[:, 0].cumsum(),
+        # reale per settimana, come media per riga
+        'actual_sales': values[:, 0] / rows, 'actual_spend': by_date['Spesa_Ads_Totale'].to_numpy(dtype=float) / rows,
+    }
+
+
+def _prefix_base(prefix, t, future_dates):
+    """Come seasonal_base sullo storico fino alla data `t` (incluse): media per settimana ISO, e media
+    delle medie stagionali per le settimane assenti."""
+    sums = prefix['seasonal'][t]
+    present = sums[:, 3] > 0
+    means = np.divide(sums[:, :3], sums[:, 3:], out=np.zeros((54, 3)), where=present[:, None])
+    lookup = np.where(present[:, None], means, means[present].mean(axis=0))
+    return lookup[future_dates.isocalendar().week.to_numpy(dtype=int)]
+
+
+def _prefix_annual(prefix, t):
+    """Come annual_totals sullo storico fino alla data `t`."""
+    sums = prefix['annual'][t]
+    present = sums[:, 2] > 0
+    return pd.DataFrame({'Spesa_Ads_Totale': sums[present, 0], 'Fatturato_Netto': sums[present, 1]},
+                        index=pd.Index(prefix['years'][present], name='Year'))
+
+
+def _prefix_growth(prefix, t):
+    """Come yoy_growth: ultime 52 settimane vs le 52 precedenti, dal fatturato cumulato."""
+    dates, sales = prefix['dates'], prefix['sales']
+    start_last_year = dates[t] - pd.Timedelta(weeks=52)
+    start_prev_year = start_last_year - pd.Timedelta(weeks=52)
+    cum = lambda d: sales[i] if (i := dates.searchsorted(d, side='right') - 1) >= 0 else 0.0
+    sales_ly = sales[t] - cum(start_last_year)
+    sales_py = cum(start_last_year) - cum(start_prev_year)
+    return (sales_ly - sales_py) / sales_py if sales_py > 0 else 0.0
+
+
+def evaluate_cutoff(prefix, t, mesi_prev, scenarios):
+    """Previsioni di tutti gli `scenarios` dal taglio `t` per le settimane già osservate, con i valori reali."""
+    dates = prefix['dates']
+    future_dates = forecast_dates(dates[t], mesi_prev)
+    pos = dates.searchsorted(future_dates)
+    pos_safe = np.minimum(pos, len(dates) - 1)
+    observed = (pos < len(dates)) & (dates[pos_safe] == future_dates)
+    if not observed.any(): return []
+
+    base = _prefix_base(prefix, t, future_dates[observed])
+    growth_rate = _prefix_growth(prefix, t)
+    suggested_saturation = float(suggest_saturation(_prefix_annual(prefix, t)))
+    horizon, actual = np.flatnonzero(observed) + 1, pos[observed]
+
+    rows = []
+    for name, s in scenarios.items():
+        sat_factor = suggested_saturation if s['sat_val'] is None else s['sat_val']
+        new_g, new_m, f_sales = project_forecast(base, growth_rate, s['trend_val'], s['google_scale'], s['meta_scale'], sat_factor)
+        rows.append((name, t, actual, horizon, f_sales, new_g + new_m))
+    return rows
+
+
+def _detail_table(prefix, rows):
+    """Tabella di dettaglio (una riga per preset, taglio e settimana prevista) dai risultati di evaluate_cutoff."""
+    if not rows: return pd.DataFrame(columns=DETAIL_COLUMNS)
+    dates = prefix['dates']
+    sizes = [len(r[2]) for r in rows]
+    actual = np.concatenate([r[2] for r in rows])
+    return pd.DataFrame({
+        'Preset': np.repeat([r[0] for r in rows], sizes),
+        'Cutoff': dates[np.repeat([r[1] for r in rows], sizes)],
+        'Data': dates[actual],
+        'Orizzonte': np.concatenate([r[3] for r in rows]),
+        'Fatturato Previsto': np.concatenate([r[4] for r in rows]),
+        'Fatturato Reale': prefix['actual_sales'][actual],
+        'Spesa Prevista': np.concatenate([r[5] for r in rows]),
+        'Spesa Reale': prefix['actual_spend'][actual],
+    })
+
+
+def cutoff_positions(prefix, step=4, min_history=104):
+    """Indici delle date di taglio: ogni `step` settimane a ritroso dalla penultima data, con almeno
+    `min_history` settimane di storico (il trend YoY confronta le ultime 52 settimane con le 52 precedenti:
+    con meno di 104 settimane il denominatore è parziale e la crescita esplode)."""
+    dates = prefix['dates']
+    if len(dates) < 2: return []
+    first = dates.searchsorted(dates[0] + pd.Timedelta(weeks=min_history))
+    return list(range(len(dates) - 2, first - 1, -step))[::-1]
+
+
+# Gli aggregati arrivano a ogni processo una volta sola (initializer), non con ogni blocco di tagli
+_WORKER_PREFIX = None
+
+def _init_worker(prefix):
+    global _WORKER_PREFIX
+    _WORKER_PREFIX = prefix
+
+
+def _evaluate_chunk(positions, mesi_prev, scenarios):
+    return [row for t in positions for row in evaluate_cutoff(_WORKER_PREFIX, t, mesi_prev, scenarios)]
+
+
+def run_backtest(df, cols, mesi_prev=3, step=4, min_history=104, presets=None, workers=None):
+    """Backtest walk-forward su uno storico pulito. Restituisce una riga per (preset, taglio, settimana prevista).
+
+    `presets`: nomi di forecast_core.PRESETS (default: tutti). `workers`: processi (default: tutti i core;
+    1 = nel processo corrente).
+    """
+    prefix = backtest_prefix(df, cols)
+    positions = cutoff_positions(prefix, step, min_history)
+    scenarios = {name: PRESETS[name] for name in (presets or PRESETS)}
+    workers = min(workers or os.cpu_count() or 1, max(len(positions), 1))
+
+    if workers == 1:
+        rows = [row for t in positions for row in evaluate_cutoff(prefix, t, mesi_prev, scenarios)]
+    else:
+        chunks = [c for c in np.array_split(positions, workers * 4) if len(c)]
+        evaluate = partial(_evaluate_chunk, mesi_prev=mesi_prev, scenarios=scenarios)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(prefix,)) as pool:
+            rows = [row for chunk in pool.map(evaluate, chunks) for row in chunk]
+    return _detail_table(prefix, rows)
+
+
+def backtest_summary(detail, by=('Preset', 'Orizzonte')):
+    """MAPE e bias (errore % medio con segno) di fatturato e spesa per gruppo.
+
+    Le settimane con valore reale nullo sono escluse dal calcolo dell'errore percentuale.
+    """
+    out = {}
+    for label, pred, actual in [('Fatturato', 'Fatturato Previsto', 'Fatturato Reale'), ('Spesa', 'Spesa Prevista', 'Spesa Reale')]:
+        err = (detail[pred] - detail[actual]) / detail[actual].where(detail[actual] > 0) * 100
+        out[f'MAPE {label} %'] = err.abs()
+        out[f'Bias {label} %'] = err
+    errors = pd.DataFrame(out, index=detail.index)
+    grouped = errors.groupby([detail[c] for c in by])
+    summary = grouped.mean()
+    summary.insert(0, 'Previsioni', grouped.size())
+    summary.insert(1, 'Tagli', detail.groupby(list(by))['Cutoff'].nunique())
+    return summary.reset_index()
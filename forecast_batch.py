@@ -0,0 +1,99 @@
+"""Forecast multi-negozio: una pipeline completa per export, in parallelo su più processi.
+
+Ogni negozio (un file CSV) passa per lettura -> pulizia -> elasticità / trend YoY -> previsione
+in un processo separato; i risultati confluiscono in un'unica tabella con la colonna `Store`.
+Un negozio che fallisce viene riportato nel report senza interrompere il batch.
+"""
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from forecast_cache import load_cleaned
+from forecast_core import DEFAULT_ECONOMICS, compute_economics, run_pipeline
+
+RESULT_COLUMNS = [
+    'Store', 'Data', 'Periodo', 'Google Previsto', 'Meta Previsto', 'Spesa Totale',
+    'Fatturato Previsto', 'MER Previsto', 'CoS Previsto', 'Profitto Previsto'
+]
+
+
+def expand_inputs(inputs):
+    """Espande directory (tutti i *.csv) e pattern glob in una lista ordinata e senza duplicati di file."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(glob.glob(os.path.join(item, '*.csv')))
+        else:
+            paths.extend(glob.glob(item) or [item])
+    return sorted(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+
+def forecast_store(path, economics, scenario, use_cache=True, stream=False):
+    """Pipeline completa per un export. Restituisce (tabella previsione, riga di report).
+
+    La tabella pulita arriva dalla cache su disco quando l'export non è cambiato (`Cache` = 'hit');
+    con `stream` l'export è letto a blocchi (forecast_stream.py).
+    """
+    store = Path(path).stem
+    report = {'Store': store, 'File': str(path), 'Stato': 'ok', 'Errore': '', 'Righe': 0, 'Cache': '',
+              'Lettura (s)': 0.0, 'Calcolo (s)': 0.0, 'Totale (s)': 0.0,
+              'Crescita YoY': None, 'Saturazione Suggerita': None}
+    t0 = time.perf_counter()
+    try:
+        df, cols, hit = load_cleaned(path, use_cache=use_cache, stream=stream)
+        report['Cache'] = 'hit' if hit else ('miss' if use_cache else 'off')
+        t1 = time.perf_counter()
+        result = run_pipeline(None, economics, **scenario, cleaned=(df, cols))
+        t2 = time.perf_counter()
+
+        df_prev = result['df_prev']
+        df_prev['Profitto Previsto'] = df_prev['Ordini Previsti'] * economics['profit_order'] - df_prev['Spesa Totale']
+        df_prev.insert(0, 'Store', store)
+        report.update({'Righe': len(result['df']), 'Lettura (s)': t1 - t0, 'Calcolo (s)': t2 - t1,
+                       'Crescita YoY': result['growth_rate'], 'Saturazione Suggerita': result['suggested_saturation']})
+        out = df_prev[RESULT_COLUMNS]
+    except Exception as e:
+        report.update({'Stato': 'errore', 'Errore': f"{type(e).__name__}: {e}"})
+        out = pd.DataFrame(columns=RESULT_COLUMNS)
+    report['Totale (s)'] = time.perf_counter() - t0
+    return out, report
+
+
+def run_batch(paths, economics=None, scenario=None, workers=None, progress=None, use_cache=True, stream=False):
+    """Esegue forecast_store su tutti i `paths` con un pool di `workers` processi (default: tutti i core).
+
+    `progress(report)` viene chiamata al completamento di ogni negozio. Restituisce
+    (tabella consolidata delle previsioni, report per negozio con tempi ed eventuali errori).
+    """
+    economics = economics or compute_economics(**DEFAULT_ECONOMICS)
+    scenario = scenario or {}
+    workers = workers or os.cpu_count() or 1
+
+    results, reports = [], []
+    if workers == 1:
+        outcomes = (forecast_store(p, economics, scenario, use_cache, stream) for p in paths)
+        for out, report in outcomes:
+            results.append(out); reports.append(report)
+            if progress: progress(report)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(forecast_store, p, economics, scenario, use_cache, stream): p for p in paths}
+            for fut in as_completed(futures):
+                try:
+                    out, report = fut.result()
+                except Exception as e:  # processo worker terminato in modo anomalo
+                    p = futures[fut]
+                    out = pd.DataFrame(columns=RESULT_COLUMNS)
+                    report = {'Store': Path(p).stem, 'File': str(p), 'Stato': 'errore', 'Errore': f"{type(e).__name__}: {e}"}
+                results.append(out); reports.append(report)
+                if progress: progress(report)
+
+    non_empty = [r for r in results if not r.empty]
+    forecast = pd.concat(non_empty, ignore_index=True) if non_empty else pd.DataFrame(columns=RESULT_COLUMNS)
+    forecast = forecast.sort_values(['Store', 'Data'], kind='stable').reset_index(drop=True)
+    report_df = pd.DataFrame(reports).sort_values('Store', kind='stable').reset_index(drop=True)
+    return forecast, report_df
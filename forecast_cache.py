@@ -0,0 +1,216 @@
+"""Cache su disco delle tabelle pulite (output di clean_dataframe).
+
+La chiave è l'hash SHA-256 del file più CLEANING_VERSION: riaprire un negozio o rilanciare un batch
+sullo stesso export salta lettura CSV e pulizia. Formati:
+    feather   Arrow IPC non compresso, letto in memory-map (default se pyarrow è installato)
+    parquet   colonnare compresso, più piccolo su disco ma va decodificato a ogni lettura
+    npy       una cartella con un .npy per colonna, letti con np.load(mmap_mode='r') (nessuna dipendenza)
+
+Accanto a ogni voce c'è un file .json con la mappa delle colonne rilevate, i tipi e la dimensione;
+la data di modifica del .json fa da "ultimo accesso" per l'eliminazione LRU oltre `max_bytes`.
+`Profitto_Operativo` non è in cache: dipende dagli input della sidebar (add_operating_profit).
+"""
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecast_core import CLEANING_VERSION, clean_dataframe
+from forecast_io import read_csv_fast
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'forecasting-tool')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+INDEX_COLUMN = '__index__'
+
+
+def default_format():
+    return 'feather' if importlib.util.find_spec('pyarrow') is not None else 'npy'
+
+
+def cache_dir(path=None):
+    """Cartella della cache: argomento, variabile d'ambiente FORECAST_CACHE_DIR o ~/.cache/forecasting-tool."""
+    return path or os.environ.get('FORECAST_CACHE_DIR') or DEFAULT_CACHE_DIR
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_content_hash(f, block=1024 ** 2):
+    """Come content_hash, leggendo un file-like a blocchi (la posizione torna all'inizio)."""
+    start, digest = f.tell(), hashlib.sha256()
+    while chunk := f.read(block):
+        digest.update(chunk)
+    f.seek(start)
+    return digest.hexdigest()
+
+
+def cache_key(file_hash):
+    return f"{file_hash}-v{CLEANING_VERSION}"
+
+
+def _entry_paths(directory, key):
+    return os.path.join(directory, key), os.path.join(directory, key + '.json')
+
+
+def _size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def _remove(path):
+    if os.path.isdir(path): shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path): os.remove(path)
+
+
+# --- SCRITTURA / LETTURA PER FORMATO ---
+
+def _write(df, path, fmt):
+    frame = df.reset_index(names=INDEX_COLUMN)
+    if fmt == 'feather':
+        frame.to_feather(path, compression='uncompressed')
+    elif fmt == 'parquet':
+        frame.to_parquet(path, index=False)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for i, c in enumerate(frame.columns):
+            col = frame[c]
+            if pd.api.types.is_string_dtype(col) or col.dtype == object:
+                values = col.astype(str).to_numpy(dtype=str)
+            elif isinstance(col.dtype, pd.api.extensions.ExtensionDtype) and hasattr(col.dtype, 'numpy_dtype'):
+                values = col.to_numpy(dtype=col.dtype.numpy_dtype, na_value=0)
+            else:
+                values = col.to_numpy()
+            np.save(os.path.join(path, f"{i}.npy"), values, allow_pickle=False)
+    return {c: str(t) for c, t in frame.dtypes.items()}
+
+
+def _read(path, fmt, columns, dtypes):
+    if fmt == 'feather':
+        import pyarrow.feather as feather
+        frame = feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+    elif fmt == 'parquet':
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.DataFrame({c: np.load(os.path.join(path, f"{i}.npy"), mmap_mode='r') for i, c in enumerate(columns)})
+        frame = frame.astype({c: dtypes[c] for c in columns if str(frame[c].dtype) != dtypes[c]})
+    return frame.set_index(INDEX_COLUMN).rename_axis(None)
+
+
+# --- API ---
+
+def get_cleaned(file_hash, directory=None):
+    """(df, cols) dalla cache su disco, o None se la voce manca o è illeggibile."""
+    directory = cache_dir(directory)
+    data_path, meta_path = _entry_paths(directory, cache_key(file_hash))
+    if not os.path.exists(meta_path): return None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        df = _read(data_path, meta['format'], meta['columns'], meta['dtypes'])
+    except Exception:
+        _remove(data_path); _remove(meta_path)
+        return None
+    os.utime(meta_path)  # ultimo accesso per l'LRU
+    return df, meta['cols']
+
+
+def put_cleaned(file_hash, df, cols, directory=None, fmt=None, max_bytes=None):
+    """Salva la tabella pulita e applica il limite di dimensione della cache."""
+    directory = cache_dir(directory)
+    fmt = fmt or default_format()
+    os.makedirs(directory, exist_ok=True)
+    data_path, meta_path = _entry_paths(directory, cache_key(file_hash))
+    tmp_path = f"{data_path}.tmp{os.getpid()}"
+    dtypes = _write(df, tmp_path, fmt)
+    _remove(data_path)
+    os.replace(tmp_path, data_path)
+    meta = {'format': fmt, 'cols': cols, 'columns': list(dtypes), 'dtypes': dtypes,
+            'bytes': _size(data_path), 'cleaning_version': CLEANING_VERSION, 'created': time.time()}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    evict(directory, max_bytes)
+
+
+def evict(directory=None, max_bytes=None):
+    """Elimina le voci usate meno di recente finché la cache supera `max_bytes`. Restituisce le chiavi eliminate."""
+    directory = cache_dir(directory)
+    if max_bytes is None:
+        max_bytes = int(float(os.environ.get('FORECAST_CACHE_MAX_MB', DEFAULT_MAX_BYTES / 1024 ** 2)) * 1024 ** 2)
+    entries = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if not name.endswith('.json'): continue
+        meta_path = os.path.join(directory, name)
+        data_path = meta_path[:-len('.json')]
+        size = _size(data_path) if os.path.exists(data_path) else 0
+        entries.append((os.path.getmtime(meta_path), size, name[:-len('.json')], data_path, meta_path))
+
+    total, removed = sum(e[1] for e in entries), []
+    for _, size, key, data_path, meta_path in sorted(entries):
+        if total <= max_bytes: break
+        _remove(data_path); _remove(meta_path)
+        total -= size
+        removed.append(key)
+    return removed
+
+
+def load_cleaned(source, directory=None, fmt=None, max_bytes=None, file_hash=None, use_cache=True, stream=False,
+                 progress=None):
+    """read_csv_fast + clean_dataframe con cache su disco. `source` è un percorso, i byte del file o un file-like.
+
+    Con `stream` il file non viene caricato tutto in memoria: è letto a blocchi e ridotto a settimane da
+    forecast_stream.stream_clean (`progress(frazione, righe)` dopo ogni blocco); la voce in cache è distinta
+    da quella della lettura completa. Restituisce (df, cols, hit) dove `hit` indica se la tabella arriva dalla cache.
+    """
+    if stream:
+        return _load_streamed(source, directory, fmt, max_bytes, file_hash, use_cache, progress)
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    elif hasattr(source, 'read'):
+        data = source.read()
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    if not use_cache:
+        return (*clean_dataframe(read_csv_fast(data)), False)
+
+    file_hash = file_hash or content_hash(data)
+    cached = get_cleaned(file_hash, directory)
+    if cached is not None:
+        return (*cached, True)
+    df, cols = clean_dataframe(read_csv_fast(data))
+    try:
+        put_cleaned(file_hash, df, cols, directory, fmt, max_bytes)
+    except OSError:
+        pass  # cache non scrivibile (disco pieno, permessi): si prosegue senza
+    return df, cols, False
+
+
+def _load_streamed(source, directory, fmt, max_bytes, file_hash, use_cache, progress):
+    from forecast_stream import stream_clean
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    f = source if hasattr(source, 'read') else open(source, 'rb')
+    try:
+        if not use_cache:
+            return (*stream_clean(f, progress=progress), False)
+        key = (file_hash or file_content_hash(f)) + '-stream'
+        cached = get_cleaned(key, directory)
+        if cached is not None:
+            return (*cached, True)
+        df, cols = stream_clean(f, progress=progress)
+    finally:
+        if f is not source: f.close()
+    try:
+        put_cleaned(key, df, cols, directory, fmt, max_bytes)
+    except OSError:
+        pass
+    return df, cols, False
@@ -0,0 +1,204 @@
+"""Grafici del tool come immagini PNG, senza Streamlit.
+
+Ogni funzione costruisce una `matplotlib.figure.Figure` (API a oggetti, non registrata in pyplot),
+la salva in PNG e la rilascia: nessuna figura resta aperta tra un rerun e l'altro e i byte
+risultanti si possono memorizzare in cache (vedi app_forecast.py) o scrivere su file (CLI).
+
+Con `max_points` le serie storiche lunghe (es. dati giornalieri) vengono ridotte prima del disegno:
+LTTB (largest-triangle-three-buckets) per le linee, media per blocchi per barre e aree impilate.
+Così il tempo di disegno resta limitato qualunque sia la lunghezza dello storico.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+DARKEST_BLUE = '#000080'
+META_COLOR = '#3b5998'
+GREEN_COLOR = '#2ecc71'
+ORANGE_COLOR = '#e67e22'
+RED_COLOR = '#e74c3c'
+
+DEFAULT_MAX_POINTS = 1000
+
+
+# --- RIDUZIONE PUNTI ---
+
+def lttb_indices(x, y, n_out):
+    """Indici dei punti scelti da LTTB: il primo, l'ultimo e, per ogni blocco intermedio, il punto che forma
+    il triangolo più ampio con il punto scelto prima e la media del blocco successivo."""
+    n = len(x)
+    if n_out is None or n_out < 3 or n <= n_out:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    edges[-1] = n - 1
+    # Medie di ogni blocco in un colpo solo; il blocco dopo l'ultimo è l'ultimo punto
+    sums_x, sums_y = np.add.reduceat(x[:n - 1], edges[:-1]), np.add.reduceat(y[:n - 1], edges[:-1])
+    sizes = np.diff(edges)
+    avg_x = np.append(sums_x / sizes, x[-1])[1:]
+    avg_y = np.append(sums_y / sizes, y[-1])[1:]
+
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1], a = 0, n - 1, 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def downsample_line(dates, values, max_points=DEFAULT_MAX_POINTS):
+    """Linea ridotta a `max_points` punti con LTTB (None o 0 = nessuna riduzione)."""
+    dates, values = pd.DatetimeIndex(dates), np.asarray(values, dtype=float)
+    if not max_points: return dates, values
+    idx = lttb_indices(dates.asi8, values, max_points)
+    return dates[idx], values[idx]
+
+
+def downsample_bars(dates, *series, max_points=DEFAULT_MAX_POINTS):
+    """Serie per barre / aree aggregate in al più `max_points` blocchi consecutivi (media del blocco).
+
+    La media, a differenza della somma, mantiene la scala delle singole righe. Restituisce
+    (data di inizio blocco, lista delle serie aggregate, larghezza delle barre in giorni);
+    senza riduzione la larghezza è quella di default di matplotlib (0.8).
+    """
+    dates = pd.DatetimeIndex(dates)
+    series = [np.asarray(v, dtype=float) for v in series]
+    n = len(dates)
+    if not max_points or n <= max_points:
+        return dates, series, 0.8
+    starts = np.linspace(0, n, max_points + 1).astype(int)[:-1]
+    sizes = np.diff(np.append(starts, n))
+    means = [np.add.reduceat(np.nan_to_num(v), starts) / sizes for v in series]
+    bucket_dates = dates[starts]
+    spans = bucket_dates[1:].append(dates[-1:]) - bucket_dates
+    width = spans.total_seconds().to_numpy() / 86400 * 0.9
+    return bucket_dates, means, np.maximum(width, 0.8)
+
+
+def render_png(fig, dpi=100):
+    """Salva la figura in PNG e ne libera le risorse. Restituisce i byte dell'immagine."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+    fig.clear()
+    return buf.getvalue()
+
+
+def saturation_curve_png(sat_factor):
+    """Curva Rendimenti della sidebar: moltiplicatore ricavi = moltiplicatore spesa ** saturazione."""
+    x_sat = np.linspace(1, 4, 20)
+    fig = Figure(figsize=(4, 2))
+    ax = fig.subplots()
+    ax.plot(x_sat, x_sat, linestyle='--', color='gray', alpha=0.5, label='Ideale')
+    ax.plot(x_sat, x_sat ** sat_factor, color=RED_COLOR, linewidth=2, label='Reale')
+    ax.set_title("Curva Rendimenti", fontsize=9)
+    ax.set_xlabel("Moltiplicatore Spesa", fontsize=7)
+    ax.set_ylabel("Moltiplicatore Ricavi", fontsize=7)
+    ax.tick_params(labelsize=6)
+    ax.legend(fontsize=6, frameon=False)
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    return render_png(fig)
+
+
+def forecast_chart_png(hist_dates, hist_sales, hist_google, hist_meta, df_prev, df_bands=None, max_points=DEFAULT_MAX_POINTS):
+    """Storico (verde) + previsione (arancione) con la spesa Google/Meta impilata sull'asse destro.
+
+    Con `df_bands` (output di simulate_forecast) aggiunge la banda P10-P90 e la mediana P50.
+    """
+    fig = Figure(figsize=(12, 6))
+    ax1 = fig.subplots()
+    ax1.plot(*downsample_line(hist_dates, hist_sales, max_points), color=GREEN_COLOR, label='Storico', linewidth=1)
+    ax1.plot(df_prev['Data'], df_prev['Fatturato Previsto'], color=ORANGE_COLOR, linestyle='--', label='Previsione', linewidth=2)
+    if df_bands is not None:
+        ax1.fill_between(df_bands['Data'], df_bands['Fatturato P10'], df_bands['Fatturato P90'], color=ORANGE_COLOR, alpha=0.2, label='P10 - P90')
+        ax1.plot(df_bands['Data'], df_bands['Fatturato P50'], color=ORANGE_COLOR, linewidth=1, label='P50')
+    ax1.set_ylabel("Fatturato (€)")
+    ax2 = ax1.twinx()
+    spend_dates, (spend_google, spend_meta), _ = downsample_bars(hist_dates, hist_google, hist_meta, max_points=max_points)
+    ax2.stackplot(np.concatenate([spend_dates.to_numpy(), df_prev['Data'].to_numpy()]),
+                  np.concatenate([spend_google, df_prev['Google Previsto']]),
+                  np.concatenate([spend_meta, df_prev['Meta Previsto']]),
+                  colors=[DARKEST_BLUE, META_COLOR], alpha=0.3, labels=['Google Ads', 'Meta Ads'])
+    ax1.legend(loc='upper left')
+    return render_png(fig)
+
+
+def channel_chart_png(dates, spend, value, spend_label, value_label, max_points=DEFAULT_MAX_POINTS):
+    """Spesa settimanale di un canale (barre) e valore conversioni (linea, asse destro)."""
+    fig = Figure(figsize=(12, 5))
+    ax1 = fig.subplots()
+    bar_dates, (bar_spend,), width = downsample_bars(dates, spend, max_points=max_points)
+    ax1.bar(bar_dates, bar_spend, width=width, align='edge' if np.ndim(width) else 'center', color=DARKEST_BLUE, alpha=0.7, label=spend_label)
+    ax2 = ax1.twinx()
+    ax2.plot(*downsample_line(dates, value, max_points), color=GREEN_COLOR, linewidth=2, label=value_label)
+    return render_png(fig)
+
+
+def saturation_scatter_png(delta_spend, delta_rev, elasticity):
+    """Variazione spesa vs variazione fatturato per settimana, colorata per elasticità."""
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.plot([-100, 500], [-100, 500], ls='--', color='gray', alpha=0.5)
+    scatter = ax.scatter(delta_spend, delta_rev, c=elasticity, cmap='RdYlGn', s=80, edgecolor='black', vmin=0.6, vmax=1.4)
+    ax.set_xlabel("Variazione Spesa (%)")
+    ax.set_ylabel("Variazione Fatturato (%)")
+    fig.colorbar(scatter, ax=ax, label='Elasticità')
+    return render_png(fig)
+
+
+def returns_chart_png(dates, spend, returns_rate, max_points=DEFAULT_MAX_POINTS):
+    """Spesa Ads totale (barre) e tasso resi medio a 4 settimane (linea, asse destro)."""
+    fig = Figure(figsize=(12, 6))
+    ax1 = fig.subplots()
+    bar_dates, (bar_spend,), width = downsample_bars(dates, spend, max_points=max_points)
+    ax1.bar(bar_dates, bar_spend, width=width, align='edge' if np.ndim(width) else 'center', color=DARKEST_BLUE, alpha=0.5)
+    ax2 = ax1.twinx()
+    rolling = pd.Series(np.asarray(returns_rate, dtype=float)).rolling(4).mean()
+    ax2.plot(*downsample_line(dates, rolling, max_points), color=RED_COLOR, linewidth=2)
+    return render_png(fig)
+
+
+def sweep_heatmap_png(heat):
+    """Heatmap del profitto per Scala Google (righe) x Scala Meta (colonne)."""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    im = ax.imshow(heat.to_numpy(), origin='lower', aspect='auto', cmap='RdYlGn',
+                   extent=[heat.columns.min(), heat.columns.max(), heat.index.min(), heat.index.max()])
+    ax.set_xlabel("Scala Meta Ads")
+    ax.set_ylabel("Scala Google Ads")
+    fig.colorbar(im, ax=ax, label='Profitto Operativo (€)')
+    return render_png(fig)
+
+
+def optimizer_chart_png(df_opt):
+    """Spesa ottimale Google/Meta impilata per settimana, con la spesa del piano corrente."""
+    fig = Figure(figsize=(12, 5))
+    ax = fig.subplots()
+    ax.bar(df_opt['Data'], df_opt['Google Ottimale'], width=5, color=DARKEST_BLUE, label='Google Ottimale')
+    ax.bar(df_opt['Data'], df_opt['Meta Ottimale'], width=5, bottom=df_opt['Google Ottimale'], color=META_COLOR, label='Meta Ottimale')
+    ax.plot(df_opt['Data'], df_opt['Spesa Piano'], color=ORANGE_COLOR, linestyle='--', linewidth=2, label='Spesa Piano Corrente')
+    ax.set_ylabel("Spesa Settimanale (€)")
+    ax.legend(loc='upper left')
+    return render_png(fig)
+
+
+def elasticity_heatmap_png(matrix):
+    """Elasticità annuale per ogni coppia di anni (annual_elasticity_matrix), stessa scala colori della tabella."""
+    years = matrix.index.to_numpy()
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    im = ax.imshow(matrix.to_numpy(dtype=float), cmap='RdYlGn', vmin=0.5, vmax=1.5)
+    ax.set_xticks(range(len(years)), [str(y) for y in matrix.columns], rotation=45)
+    ax.set_yticks(range(len(years)), [str(y) for y in years])
+    ax.set_xlabel("Anno di confronto")
+    ax.set_ylabel("Anno")
+    if len(years) <= 15:
+        for (i, j), v in np.ndenumerate(matrix.to_numpy(dtype=float)):
+            if np.isfinite(v): ax.text(j, i, f"{v:.2f}", ha='center', va='center', fontsize=8)
+    fig.colorbar(im, ax=ax, label='Elasticità')
+    return render_png(fig)
@@ -0,0 +1,335 @@
+"""Forecast da riga di comando, senza browser né server Streamlit.
+
+Esempi:
+    python forecast_cli.py forecast export.csv -o previsione.csv
+    python forecast_cli.py forecast export.csv --months 12 --preset Aggressivo --plot previsione.png
+    python forecast_cli.py batch exports/ -o previsioni.csv --report report.csv --workers 32
+    python forecast_cli.py sweep export.csv -o scenari.csv --google 0.5 5 0.25 --meta 0.5 5 0.25
+    python forecast_cli.py optimize export.csv -o budget.csv --months 12 --budget-cap 150000 --min-mer 5
+    python forecast_cli.py append negozi/roma settimana_23.csv
+    python forecast_cli.py forecast negozi/roma -o previsione.csv
+    python forecast_cli.py health exports/ -o classifica.csv --months-output mesi.csv
+    python forecast_cli.py backtest export.csv -o accuratezza.csv --months 3 --step 4 --detail-output dettaglio.csv
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from forecast_backtest import backtest_summary, run_backtest
+from forecast_batch import expand_inputs, run_batch
+from forecast_core import (
+    DEFAULT_ECONOMICS, PRESETS, add_operating_profit, ai_monthly_table, compute_economics, fit_response_curves,
+    forecast_dates, grid_values, optimize_budget, rank_health, run_pipeline, score_months, sweep_scenarios
+)
+from forecast_cache import load_cleaned
+from forecast_io import read_csv_fast
+from forecast_store import append_history, forecast_from_store, load_history
+
+
+def add_economics_args(parser):
+    """Input "Business Economics" (stessi default della sidebar)."""
+    group = parser.add_argument_group('business economics')
+    group.add_argument('--aov', dest='be_aov', type=float, default=DEFAULT_ECONOMICS['be_aov'], help="Average Order Value (€)")
+    group.add_argument('--vat', dest='be_vat', type=float, default=DEFAULT_ECONOMICS['be_vat'], help="Tax/VAT (%%)")
+    group.add_argument('--returns', dest='be_returns', type=float, default=DEFAULT_ECONOMICS['be_returns'], help="Return Rate (%%)")
+    group.add_argument('--margin', dest='be_margin_prod', type=float, default=DEFAULT_ECONOMICS['be_margin_prod'], help="Gross Margin (%%)")
+    group.add_argument('--fulfillment', dest='be_fulfillment', type=float, default=DEFAULT_ECONOMICS['be_fulfillment'], help="Fulfillment Cost (€)")
+    group.add_argument('--returning', dest='be_returning_perc', type=float, default=DEFAULT_ECONOMICS['be_returning_perc'], help="Returning Customers (%%)")
+    group.add_argument('--repeat-rate', dest='be_repeat_rate', type=float, default=DEFAULT_ECONOMICS['be_repeat_rate'], help="Repeat Order Rate")
+
+
+def add_scenario_args(parser):
+    """Scenario di previsione: un preset "Azioni Rapide" più eventuali override dei singoli slider."""
+    group = parser.add_argument_group('scenario')
+    group.add_argument('--months', type=int, default=6, help="mesi di previsione (1-24)")
+    group.add_argument('--preset', choices=list(PRESETS), default='Auto-Calibra')
+    group.add_argument('--trend', type=float, default=None, help="aggiusta trend futuro (es. 0.15 = +15%%)")
+    group.add_argument('--google-scale', type=float, default=None)
+    group.add_argument('--meta-scale', type=float, default=None)
+    group.add_argument('--saturation', type=float, default=None, help="default: preset (Auto-Calibra = rilevata dai dati)")
+
+
+def add_cache_args(parser):
+    parser.add_argument('--no-cache', action='store_true',
+                        help="non usare la cache su disco delle tabelle pulite (FORECAST_CACHE_DIR)")
+    parser.add_argument('--stream', action='store_true',
+                        help="export molto grandi: lettura a blocchi ridotta subito a settimane, memoria limitata")
+
+
+def load_input(args):
+    """Tabella pulita dell'export `args.input`, dalla cache su disco se il file non è cambiato."""
+    progress = None
+    if args.stream:
+        progress = lambda frac, rows: print(f"\rLettura {frac:.0%} ({rows:,} righe)", end='', file=sys.stderr, flush=True)
+    df, cols, hit = load_cleaned(args.input, use_cache=not args.no_cache, stream=args.stream, progress=progress)
+    if progress and not hit: print(file=sys.stderr)
+    return df, cols
+
+
+def economics_from_args(args):
+    return compute_economics(**{k: getattr(args, k) for k in DEFAULT_ECONOMICS})
+
+
+def scenario_from_args(args):
+    """Parametri per run_pipeline: override espliciti, altrimenti i valori del preset."""
+    preset = PRESETS[args.preset]
+    pick = lambda value, default: default if value is None else value
+    return {
+        'mesi_prev': args.months,
+        'manual_trend': pick(args.trend, preset['trend_val']),
+        'm_google': pick(args.google_scale, preset['google_scale']),
+        'm_meta': pick(args.meta_scale, preset['meta_scale']),
+        'sat_factor': pick(args.saturation, preset['sat_val']),
+    }
+
+
+def plot_forecast(result, path):
+    """Grafico storico + previsione su file PNG (matplotlib importato solo qui)."""
+    from forecast_charts import forecast_chart_png
+
+    df, cols = result['df'], result['cols']
+    png = forecast_chart_png(df['Data_Interna'], df['Fatturato_Netto'], df[cols['google']], df[cols['meta']], result['df_prev'])
+    with open(path, 'wb') as f:
+        f.write(png)
+
+
+def cmd_forecast(args):
+    if os.path.isdir(args.input):
+        # Storico persistente (vedi `append`): previsione dai soli aggregati, senza rileggere lo storico
+        result = forecast_from_store(args.input, economics_from_args(args), **scenario_from_args(args))
+        if args.plot: result['df'] = load_history(args.input)
+    else:
+        result = run_pipeline(None, economics_from_args(args), **scenario_from_args(args), cleaned=load_input(args))
+    df_prev = result['df_prev']
+    if args.output:
+        df_prev.to_csv(args.output, index=False)
+    else:
+        df_prev.to_csv(sys.stdout, index=False)
+    if args.plot:
+        plot_forecast(result, args.plot)
+
+    tot_rev, tot_spend = df_prev['Fatturato Previsto'].sum(), df_prev['Spesa Totale'].sum()
+    print(f"Crescita YoY: {result['growth_rate']:+.1%} | Saturazione: {result['sat_factor']:.2f} "
+          f"(suggerita {result['suggested_saturation']:.2f}) | Settimane: {len(df_prev)} | "
+          f"Fatturato: € {tot_rev:,.0f} | Spesa: € {tot_spend:,.0f} | "
+          f"MER: {tot_rev / tot_spend if tot_spend > 0 else 0:.2f}", file=sys.stderr)
+    return 0
+
+
+def cmd_batch(args):
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("Nessun file CSV trovato.", file=sys.stderr)
+        return 1
+
+    def progress(report):
+        cached = ' (cache)' if report.get('Cache') == 'hit' else ''
+        status = f"{report.get('Totale (s)', 0):.2f}s{cached}" if report['Stato'] == 'ok' else f"ERRORE {report['Errore']}"
+        print(f"[{report['Store']}] {status}", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    forecast, report = run_batch(paths, economics_from_args(args), scenario_from_args(args), args.workers, progress,
+                                 use_cache=not args.no_cache, stream=args.stream)
+    elapsed = time.perf_counter() - t0
+    forecast.to_csv(args.output, index=False)
+    if args.report:
+        report.to_csv(args.report, index=False)
+
+    n_err = int((report['Stato'] != 'ok').sum())
+    print(f"{len(paths)} negozi in {elapsed:.1f}s ({n_err} errori) -> {args.output}", file=sys.stderr)
+    return 1 if n_err == len(paths) else 0
+
+
+def cmd_sweep(args):
+    economics = economics_from_args(args)
+    result = run_pipeline(None, economics, mesi_prev=args.months, cleaned=load_input(args))
+    cols = result['cols']
+    future_dates = forecast_dates(result['df']['Data_Interna'].max(), args.months)
+
+    t0 = time.perf_counter()
+    scenarios = sweep_scenarios(result['seasonal'], future_dates, result['growth_rate'], economics, cols['google'], cols['meta'],
+                                grid_values(*args.trend), grid_values(*args.google), grid_values(*args.meta), grid_values(*args.saturation))
+    elapsed = time.perf_counter() - t0
+    scenarios = scenarios.sort_values('Profitto', ascending=False)
+    scenarios.to_csv(args.output or sys.stdout, index=False)
+
+    print(f"{len(scenarios):,} scenari in {elapsed * 1000:.0f} ms. Top {args.top} per profitto:", file=sys.stderr)
+    print(scenarios.head(args.top).to_string(index=False), file=sys.stderr)
+    return 0
+
+
+def cmd_optimize(args):
+    economics = economics_from_args(args)
+    scenario = scenario_from_args(args)
+    result = run_pipeline(None, economics, **scenario, cleaned=load_input(args))
+    cols = result['cols']
+    future_dates = forecast_dates(result['df']['Data_Interna'].max(), args.months)
+    curves = fit_response_curves(result['df'], cols)
+
+    df_opt, summary = optimize_budget(result['seasonal'], future_dates, result['growth_rate'], scenario['manual_trend'],
+                                      economics, curves, cols['google'], cols['meta'], budget_cap=args.budget_cap,
+                                      min_mer=args.min_mer, m_google=scenario['m_google'], m_meta=scenario['m_meta'])
+    df_opt.to_csv(args.output or sys.stdout, index=False)
+
+    print(f"Curve: Google b={curves['google']['b']:.2f} | Meta b={curves['meta']['b']:.2f}", file=sys.stderr)
+    if not summary['vincolo_rispettato']:
+        print("Attenzione: vincoli non raggiungibili nemmeno con la spesa minima.", file=sys.stderr)
+    print(f"Ottimo: spesa € {summary['spesa']:,.0f} | fatturato € {summary['fatturato']:,.0f} | "
+          f"profitto € {summary['profitto']:,.0f} | MER {summary['mer']:.2f}", file=sys.stderr)
+    print(f"Piano:  spesa € {summary['spesa_piano']:,.0f} | fatturato € {summary['fatturato_piano']:,.0f} | "
+          f"profitto € {summary['profitto_piano']:,.0f}", file=sys.stderr)
+    return 0
+
+
+def cmd_append(args):
+    for path in args.inputs:
+        report = append_history(args.store, read_csv_fast(path))
+        last = f"{report['Ultima Settimana']:%Y-%m-%d}" if report['Ultima Settimana'] is not None else "-"
+        waiting = f", {report['Righe In Attesa']} settimane incomplete in attesa" if report['Righe In Attesa'] else ""
+        print(f"{path}: +{report['Righe Aggiunte']} righe ({report['Righe Scartate']} scartate{waiting}), "
+              f"storico {report['Righe Totali']} righe fino al {last} in {report['Tempo (s)'] * 1000:.0f} ms", file=sys.stderr)
+    return 0
+
+
+def cmd_health(args):
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("Nessun file CSV trovato.", file=sys.stderr)
+        return 1
+    economics = economics_from_args(args)
+
+    t0 = time.perf_counter()
+    frames, cols = [], None
+    for path in paths:
+        df, file_cols, _ = load_cleaned(path, use_cache=not args.no_cache, stream=args.stream)
+        if cols is None: cols = file_cols
+        # Export diversi possono nominare diversamente le stesse colonne (es. 'Cost' / 'Cost (EUR)'):
+        # ogni file viene riportato ai nomi del primo secondo la propria mappa
+        df = df.rename(columns={file_cols[k]: cols[k] for k in cols
+                                if file_cols[k] and cols[k] and file_cols[k] != cols[k] and file_cols[k] in df.columns})
+        if 'Store' not in df.columns: df['Store'] = Path(path).stem  # un export per negozio
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    t1 = time.perf_counter()
+
+    # Tutti i negozi e tutti i mesi in un solo passaggio
+    add_operating_profit(df, cols, economics['profit_order'], economics['be_aov'])
+    col_ret = cols['ret_rate'] if cols['ret_rate'] in df.columns else None
+    scored = score_months(ai_monthly_table(df, cols, by='Store'), economics['be_roas_val'], col_ret_rate=col_ret, by='Store')
+    ranking = rank_health(scored, by='Store', months=args.months)
+    t2 = time.perf_counter()
+
+    ranking.to_csv(args.output or sys.stdout, index=False)
+    if args.months_output:
+        scored.assign(Tags=scored['Tags'].str.join(' | '), Alerts=scored['Alerts'].str.join(' | ')).to_csv(args.months_output)
+    print(f"{ranking['Store'].nunique()} negozi, {len(scored):,} mesi: lettura {t1 - t0:.1f}s, punteggi {(t2 - t1) * 1000:.0f} ms. "
+          f"Primi {min(args.top, len(ranking))} per salute (ultimi {args.months} mesi):", file=sys.stderr)
+    print(ranking.head(args.top).to_string(index=False), file=sys.stderr)
+    return 0
+
+
+def cmd_backtest(args):
+    df, cols = load_input(args)
+    t0 = time.perf_counter()
+    detail = run_backtest(df, cols, args.months, args.step, args.min_history, args.presets, args.workers)
+    elapsed = time.perf_counter() - t0
+    if detail.empty:
+        print(f"Storico troppo corto: servono almeno {args.min_history} settimane prima del primo taglio.", file=sys.stderr)
+        return 1
+
+    summary = backtest_summary(detail)
+    summary.to_csv(args.output or sys.stdout, index=False)
+    if args.detail_output:
+        detail.to_csv(args.detail_output, index=False)
+    print(f"{detail['Cutoff'].nunique()} tagli ({detail['Cutoff'].min():%Y-%m-%d} - {detail['Cutoff'].max():%Y-%m-%d}), "
+          f"{len(detail):,} previsioni in {elapsed:.2f}s. Accuratezza per preset:", file=sys.stderr)
+    print(backtest_summary(detail, by=['Preset']).round(1).to_string(index=False), file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Forecasting Strategico Pro - riga di comando")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('forecast', help="previsione per un singolo export CSV")
+    p.add_argument('input', help="export CSV (Year Week, Cost, Amount Spent, Total sales, ...) o cartella creata con `append`")
+    p.add_argument('-o', '--output', help="CSV di output (default: stdout)")
+    p.add_argument('--plot', help="salva anche il grafico previsionale (PNG)")
+    add_scenario_args(p)
+    add_economics_args(p)
+    add_cache_args(p)
+    p.set_defaults(func=cmd_forecast)
+
+    p = sub.add_parser('batch', help="previsione multi-negozio in parallelo (un CSV per negozio)")
+    p.add_argument('inputs', nargs='+', help="directory di export e/o pattern glob (es. 'exports/*.csv')")
+    p.add_argument('-o', '--output', required=True, help="CSV consolidato delle previsioni")
+    p.add_argument('--report', help="CSV con tempi ed errori per negozio")
+    p.add_argument('--workers', type=int, default=None, help="processi paralleli (default: tutti i core)")
+    add_scenario_args(p)
+    add_economics_args(p)
+    add_cache_args(p)
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser('sweep', help="valuta una griglia di scenari budget / trend / saturazione")
+    p.add_argument('input')
+    p.add_argument('-o', '--output', help="CSV con tutti gli scenari, ordinati per profitto (default: stdout)")
+    p.add_argument('--months', type=int, default=6)
+    p.add_argument('--google', type=float, nargs=3, default=[0.5, 5.0, 0.25], metavar=('MIN', 'MAX', 'PASSO'))
+    p.add_argument('--meta', type=float, nargs=3, default=[0.5, 5.0, 0.25], metavar=('MIN', 'MAX', 'PASSO'))
+    p.add_argument('--saturation', type=float, nargs=3, default=[0.5, 1.0, 0.05], metavar=('MIN', 'MAX', 'PASSO'))
+    p.add_argument('--trend', type=float, nargs=3, default=[0.0, 0.2, 0.05], metavar=('MIN', 'MAX', 'PASSO'))
+    p.add_argument('--top', type=int, default=10)
+    add_economics_args(p)
+    add_cache_args(p)
+    p.set_defaults(func=cmd_sweep)
+
+    p = sub.add_parser('optimize', help="ripartizione Google / Meta che massimizza il profitto operativo")
+    p.add_argument('input')
+    p.add_argument('-o', '--output', help="CSV con la spesa ottimale settimanale (default: stdout)")
+    p.add_argument('--budget-cap', type=float, default=None, help="tetto di spesa totale sull'orizzonte (€)")
+    p.add_argument('--min-mer', type=float, default=None, help="MER minimo complessivo (es. il BE ROAS)")
+    add_scenario_args(p)
+    add_economics_args(p)
+    add_cache_args(p)
+    p.set_defaults(func=cmd_optimize)
+
+    p = sub.add_parser('append', help="aggiunge le settimane nuove allo storico persistente di un negozio")
+    p.add_argument('store', help="cartella dello storico (creata se non esiste)")
+    p.add_argument('inputs', nargs='+', help="export CSV con le settimane nuove (le settimane già presenti vengono scartate)")
+    p.set_defaults(func=cmd_append)
+
+    p = sub.add_parser('health', help="punteggio Insight AI di tutti i mesi e classifica dei negozi per salute")
+    p.add_argument('inputs', nargs='+', help="export CSV (uno per negozio, o uno con colonna `Store`), directory o pattern glob")
+    p.add_argument('-o', '--output', help="CSV con la classifica dei negozi (default: stdout)")
+    p.add_argument('--months-output', help="CSV con punteggio, tag e alert di ogni mese di ogni negozio")
+    p.add_argument('--months', type=int, default=12, help="mesi recenti su cui mediare il punteggio")
+    p.add_argument('--top', type=int, default=10)
+    add_economics_args(p)
+    add_cache_args(p)
+    p.set_defaults(func=cmd_health)
+
+    p = sub.add_parser('backtest', help="accuratezza storica della previsione (walk-forward) per orizzonte e preset")
+    p.add_argument('input')
+    p.add_argument('-o', '--output', help="CSV con MAPE e bias per preset e orizzonte (default: stdout)")
+    p.add_argument('--detail-output', help="CSV con previsto e reale di ogni settimana di ogni taglio")
+    p.add_argument('--months', type=int, default=3, help="orizzonte di previsione da ogni taglio (mesi)")
+    p.add_argument('--step', type=int, default=4, help="settimane tra due tagli consecutivi")
+    p.add_argument('--min-history', type=int, default=104, help="settimane di storico minime prima del primo taglio")
+    p.add_argument('--presets', nargs='+', choices=list(PRESETS), default=None, help="default: tutti")
+    p.add_argument('--workers', type=int, default=None, help="processi paralleli (default: tutti i core)")
+    add_cache_args(p)
+    p.set_defaults(func=cmd_backtest)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1007 @@
+"""Motore di calcolo del Forecasting Strategico, utilizzabile senza Streamlit.
+
+Contiene business economics, pulizia dei dati, rilevamento di elasticità / trend YoY,
+previsione e scoring "Insight AI" come semplici funzioni. Importa solo pandas e numpy:
+la libreria grafica viene caricata solo da chi disegna (app Streamlit o `forecast_cli.py --plot`).
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# --- BUSINESS ECONOMICS ---
+
+# Valori di default della sidebar "Input Metriche"
+DEFAULT_ECONOMICS = {
+    'be_aov': 122.0, 'be_vat': 22.0, 'be_returns': 13.0, 'be_margin_prod': 30.0,
+    'be_fulfillment': 5.0, 'be_returning_perc': 13.0, 'be_repeat_rate': 1.0,
+}
+
+# Scenari "Azioni Rapide": sat_val None = saturazione suggerita dai dati
+PRESETS = {
+    'Prudente': {'trend_val': 0.0, 'google_scale': 1.0, 'meta_scale': 1.0, 'sat_val': 0.80},
+    'Aggressivo': {'trend_val': 0.15, 'google_scale': 1.5, 'meta_scale': 1.5, 'sat_val': 0.90},
+    'Auto-Calibra': {'trend_val': 0.0, 'google_scale': 1.2, 'meta_scale': 1.2, 'sat_val': None},
+}
+
+def compute_economics(be_aov, be_vat, be_returns, be_margin_prod, be_fulfillment, be_returning_perc, be_repeat_rate):
+    """Break-even e profitti unitari a partire dagli input della sidebar (percentuali espresse 0-100)."""
+    # 1. AOV Netto
+    aov_post_tax_returns = (be_aov * (1 - be_returns/100)) / (1 + be_vat/100)
+
+    # 2. Profit per Order
+    profit_order = (aov_post_tax_returns * (be_margin_prod/100)) - be_fulfillment
+
+    # 3. Profit per Customer
+    profit_per_customer = profit_order + (profit_order * (be_returning_perc/100) * be_repeat_rate)
+
+    # 4. Break Even CPA
+    be_cpa = profit_per_customer
+
+    # 5. Break Even ROAS
+    be_roas_val = be_aov / be_cpa if be_cpa > 0 else 99.9
+
+    return {
+        'be_aov': be_aov, 'aov_post_tax_returns': aov_post_tax_returns, 'profit_order': profit_order,
+        'profit_per_customer': profit_per_customer, 'be_cpa': be_cpa, 'be_roas_val': be_roas_val,
+    }
+
+# --- PULIZIA DATI ---
+
+def clean_currency_us(column):
+    if column is None: return 0
+    s = column.astype(str)
+    s = s.str.replace('€', '', regex=False).str.strip()
+    s = s.str.replace(',', '', regex=False) 
+    return pd.to_numeric(s, errors='coerce').fillna(0)
+
+def parse_iso_week(week_str):
+    try:
+        week_str = str(week_str).strip()
+        if len(week_str) < 6: return pd.NaT
+        year = int(week_str[:4])
+        week = int(week_str[4:])
+        return datetime.fromisocalendar(year, week, 1) 
+    except:
+        return pd.NaT
+
+def get_week_range_label_with_year(date):
+    if pd.isna(date): return ""
+    start = date
+    end = date + timedelta(days=6)
+    return f"{start.strftime('%d %b')} - {end.strftime('%d %b %Y')}"
+
+def clean_percentage(val):
+    if pd.isna(val): return 0.0
+    s = str(val).replace('%', '').strip()
+    try: return float(s)
+    except: return 0.0
+
+# --- VERSIONI VETTORIALI (usate nella pulizia dei file) ---
+
+def clean_currency_series(column):
+    """Come clean_currency_us, ma salta il giro stringa→numero se la colonna è già numerica."""
+    if column is None: return 0
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        return column.fillna(0)
+    return clean_currency_us(column)
+
+def parse_iso_week_series(values):
+    """Equivalente vettoriale di parse_iso_week: 'YYYYWW' -> lunedì della settimana ISO, NaT se malformato.
+
+    Le settimane distinte sono poche anche su export enormi: si parsano solo i valori unici.
+    """
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    s = pd.Series(uniques).astype(str).str.strip()
+    parts = s.str.extract(r'^(\d{4})\s*\+?(\d+)$').where(s.str.len() >= 6)
+    week = pd.to_numeric(parts[1], errors='coerce')
+    iso = parts[0] + week.astype('Int64').astype(str).str.zfill(2) + '1'
+    dates = pd.to_datetime(iso, format='%G%V%u', errors='coerce')
+    # Settimana 53 in un anno da 52 settimane: alcune versioni di pandas sforano nell'anno dopo
+    cal = dates.dt.isocalendar()
+    valid = (cal['week'] == week) & (cal['year'] == pd.to_numeric(parts[0], errors='coerce'))
+    dates = dates.where(valid.fillna(False).astype(bool))
+    # codice -1 (valore mancante) -> NaT
+    return pd.Series(pd.DatetimeIndex(dates).take(codes, allow_fill=True, fill_value=pd.NaT), index=values.index)
+
+def week_range_labels(dates):
+    """Equivalente vettoriale di get_week_range_label_with_year: etichette calcolate una volta per data distinta."""
+    codes, uniques = pd.factorize(pd.DatetimeIndex(dates))
+    ends = uniques + pd.Timedelta(days=6)
+    labels = np.append((uniques.strftime('%d %b') + ' - ' + ends.strftime('%d %b %Y')).to_numpy(dtype=object), "")
+    return labels[codes]  # codice -1 (NaT) -> ultima voce ""
+
+def clean_percentage_series(column):
+    """Equivalente vettoriale di clean_percentage: '12.5%' -> 12.5, valori non validi -> 0.0."""
+    codes, uniques = pd.factorize(column)
+    s = pd.Series(uniques).astype(str).str.replace('%', '', regex=False).str.strip()
+    parsed = pd.to_numeric(s, errors='coerce').fillna(0.0).to_numpy(dtype=float)
+    return pd.Series(np.append(parsed, 0.0)[codes], index=column.index)
+
+# Colonne data degli export giornalieri (confronto senza maiuscole)
+DAY_COLUMNS = ['day', 'date', 'giorno', 'data', 'reporting starts']
+
+def detect_columns(columns):
+    """Individua i nomi effettivi delle colonne (variano tra export Shopify / Google / Meta)."""
+    return {
+        'date': next((c for c in columns if 'Year Week' in c or 'Settimana' in c), None),
+        'day': next((c for c in columns if c.strip().lower() in DAY_COLUMNS), None),
+        'google': next((c for c in columns if 'Cost' in c), 'Cost'),
+        'meta': next((c for c in columns if 'Amount Spent' in c), 'Amount Spent'),
+        'sales': next((c for c in columns if 'Total sales' in c), 'Total sales'),
+        'returns': next((c for c in columns if 'Returns' in c), 'Returns'),
+        'orders': next((c for c in columns if 'Orders' in c), 'Orders'),
+        'aov': next((c for c in columns if 'Average order value' in c), 'Average order value'),
+
+        'g_val': 'Conversions Value',
+        'm_val': 'Website Purchases Conversion Value',
+        'g_cpc': 'Avg. CPC',
+        'm_cpc': 'CPC (All)',
+        'm_cpm': 'CPM (Cost per 1,000 Impressions)',
+        'g_imps': 'Impressions',
+        'm_freq': 'Frequency',
+
+        'items': 'Items',
+        'ret_rate': 'Returning customer rate',
+        'discounts': 'Discounts',
+    }
+
+def parse_day_series(values):
+    """Date giornaliere ('2025-01-31', '31/01/2025', ...) -> datetime64, NaT se non valide. Parsing sui valori unici."""
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.tz_localize(None) if values.dt.tz is not None else values
+    codes, uniques = pd.factorize(values)
+    s = pd.Series(uniques).astype(str).str.strip()
+    dates = pd.to_datetime(s, format='ISO8601', errors='coerce')
+    missing = dates.isna()
+    if missing.any():
+        dates[missing] = pd.to_datetime(s[missing], format='mixed', dayfirst=True, errors='coerce')
+    return pd.Series(pd.DatetimeIndex(dates).take(codes, allow_fill=True, fill_value=pd.NaT), index=values.index)
+
+def is_daily_export(df, cols):
+    """Export giornaliero: c'è una colonna giorno e (se presente anche la settimana) più giorni per settimana."""
+    if not cols['day']: return False
+    if not cols['date']: return True
+    return df[cols['day']].nunique() > df[cols['date']].nunique()
+
+def rollup_value_columns(cols):
+    """(colonne sommate, colonne mediate) nel rollup settimanale; l'AOV è mediato e poi ricalcolato."""
+    sum_cols = [cols[k] for k in ['google', 'meta', 'sales', 'returns', 'orders', 'discounts', 'g_val', 'm_val', 'g_imps', 'items']]
+    sum_cols.append('Gross sales')
+    mean_cols = [cols[k] for k in ['g_cpc', 'm_cpc', 'm_cpm', 'm_freq', 'ret_rate', 'aov']]
+    return list(dict.fromkeys(sum_cols)), [c for c in dict.fromkeys(mean_cols) if c not in sum_cols]
+
+def week_day_mask(keys, days):
+    """Giorni presenti per chiave ([negozio,] lunedì) come bitmask uint8 (bit 0 = lunedì ... bit 6 = domenica).
+
+    Le maschere di blocchi diversi si uniscono con OR: lo stato resta una riga per negozio e settimana.
+    """
+    bits = np.left_shift(1, (days + 3) % 7).astype(np.uint8)  # il giorno 0 (1970-01-01) è un giovedì
+    pairs = pd.DataFrame({**{f'_k{i}': k for i, k in enumerate(keys)}, '_bit': bits}).drop_duplicates()
+    mask = pairs.groupby([f'_k{i}' for i in range(len(keys))], dropna=False)['_bit'].sum().astype(np.uint8)
+    return mask.rename_axis([None] * len(keys))
+
+def mask_days(mask):
+    """Numero di giorni presenti in ogni bitmask di week_day_mask."""
+    return np.unpackbits(np.asarray(mask, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+def rollup_sums(sums, cols, day_mask=None, trim=True):
+    """Da somme per ([negozio,] lunedì) a righe settimanali nel formato dell'export settimanale.
+
+    `sums` ha indice (Store, lunedì) o lunedì (giorni da epoch) e la colonna `_righe` (righe sommate);
+    le colonne mediate diventano somma / righe. Con `day_mask` (week_day_mask con le stesse chiavi di `sums`)
+    l'export è giornaliero: colonna `Giorni`, AOV ricalcolato come fatturato / ordini e settimane
+    incomplete ai bordi dello storico di ogni negozio scartate (con `trim=False` restano, es. per lo storico
+    incrementale di forecast_store.py). Senza `day_mask` l'AOV è ricalcolato solo dove più righe sono state unite.
+    """
+    _, mean_cols = rollup_value_columns(cols)
+    mean_cols = [c for c in mean_cols if c in sums.columns]
+    sums = sums.sort_index()
+    rows = sums.pop('_righe')
+    weekly = sums.copy()
+    weekly[mean_cols] = sums[mean_cols].div(rows, axis=0)
+    by_store = weekly.index.nlevels > 1
+    monday = weekly.index.get_level_values(-1).to_numpy()
+
+    if cols['aov'] in weekly.columns and cols['orders'] in weekly.columns:
+        orders = weekly[cols['orders']]
+        recomputed = (weekly[cols['sales']] / orders.where(orders > 0)).fillna(weekly[cols['aov']])
+        weekly[cols['aov']] = recomputed if day_mask is not None else recomputed.where(rows > 1, weekly[cols['aov']])
+
+    if day_mask is not None:
+        weekly['Giorni'] = mask_days(day_mask.reindex(weekly.index, fill_value=0))
+
+    if day_mask is not None and trim:
+        # Settimane parziali solo ai bordi dello storico, negozio per negozio
+        store = weekly.index.get_level_values(0).to_numpy() if by_store else np.zeros(len(weekly))
+        complete = weekly['Giorni'].to_numpy() >= 7
+        bounds = pd.DataFrame({'store': store[complete], 'monday': monday[complete]}).groupby('store', dropna=False)['monday']
+        first = pd.Series(store).map(bounds.min()).to_numpy()
+        last = pd.Series(store).map(bounds.max()).to_numpy()
+        keep = np.isnan(first) | ((monday >= first) & (monday <= last))
+        weekly, monday = weekly[keep], monday[keep]
+
+    iso = pd.DatetimeIndex(monday.astype('datetime64[D]')).isocalendar()
+    weekly.insert(0, 'Year Week', (iso['year'].astype(str) + iso['week'].astype(str).str.zfill(2)).to_numpy())
+    if by_store:
+        weekly.insert(0, 'Store', weekly.index.get_level_values(0).to_numpy())
+    return weekly.reset_index(drop=True)
+
+def rollup_daily(df, cols, trim=True):
+    """Aggrega un export giornaliero in righe settimanali ISO, nello stesso formato dell'export settimanale.
+
+    Tiene solo le colonne note, già numeriche (float64), e le aggrega con un solo groupby sul lunedì della
+    settimana (e sul negozio, se c'è la colonna `Store`: ogni negozio resta una riga per settimana, come
+    nell'export settimanale): somme per spesa / fatturato / resi / ordini / valori conversione, medie per CPC,
+    CPM, frequenza e tasso clienti di ritorno; l'AOV è ricalcolato come fatturato / ordini. Le settimane
+    incomplete all'inizio e alla fine dello storico (es. export fino a mercoledì) vengono scartate per non
+    falsare stagionalità e KPI. Il risultato ha la colonna `Year Week` ('YYYYWW') e `Giorni` (giorni distinti
+    presenti nella settimana).
+    """
+    day = parse_day_series(df[cols['day']]).to_numpy(dtype='datetime64[D]')
+    valid = ~np.isnat(day)
+    days = day[valid].astype(np.int64)
+    monday = days - (days + 3) % 7  # il giorno 0 (1970-01-01) è un giovedì
+
+    sum_cols, mean_cols = rollup_value_columns(cols)
+    data = {}
+    for c in sum_cols + mean_cols:
+        if c not in df.columns: continue
+        col = df[c][valid]
+        data[c] = (clean_percentage_series(col) if c == cols['ret_rate'] else clean_currency_series(col)).to_numpy(dtype=float)
+    data['_righe'] = np.ones(len(days), dtype=np.int64)
+
+    # Un solo groupby-somma; le medie sono somma / righe della settimana
+    keys = [df['Store'][valid].to_numpy(), monday] if 'Store' in df.columns else [monday]
+    sums = pd.DataFrame(data).groupby(keys, sort=True, dropna=False).sum()
+    return rollup_sums(sums, cols, week_day_mask(keys, days), trim)
+
+# Versione delle regole di pulizia: va incrementata quando clean_dataframe cambia output,
+# così le tabelle pulite salvate su disco (forecast_cache.py) vengono ricalcolate
+CLEANING_VERSION = 2
+
+def clean_dataframe(df, trim_edges=True):
+    """Pulizia e colonne derivate che dipendono solo dai dati (nessun input della sidebar).
+
+    Un export giornaliero (colonna `Day` / `Date` / `Giorno` / `Data`) viene prima aggregato per settimana
+    ISO con rollup_daily (con `trim_edges=False` le settimane incomplete ai bordi restano, con la colonna
+    `Giorni`); da lì in poi la pipeline è la stessa dell'export settimanale.
+    Restituisce il DataFrame pulito e la mappa delle colonne rilevate.
+    """
+    df = df.dropna(how='all')
+    df.columns = df.columns.str.strip()
+    cols = detect_columns(df.columns)
+    if is_daily_export(df, cols):
+        df = rollup_daily(df, cols, trim_edges)
+        cols = detect_columns(df.columns)
+    if not cols['date']:
+        raise ValueError("Manca colonna data.")
+
+    df['Data_Interna'] = parse_iso_week_series(df[cols['date']])
+    df = df.dropna(subset=['Data_Interna']).sort_values('Data_Interna')
+    df['Periodo'] = week_range_labels(df['Data_Interna'])
+
+    # === CREAZIONE COLONNE GLOBALI PER TAB 4 ===
+    df['Year'] = df['Data_Interna'].dt.year
+    df['Week'] = df['Data_Interna'].dt.isocalendar().week
+    # ==========================================================
+
+    money_cols = [cols['google'], cols['meta'], cols['sales'], cols['returns'], cols['aov'], 'Gross sales', cols['discounts'],
+                  cols['g_val'], cols['m_val'], cols['g_cpc'], cols['m_cpc'], cols['m_cpm']]
+    for c in money_cols:
+        if c in df.columns: df[c] = clean_currency_series(df[c])
+
+    if cols['g_imps'] in df.columns: df[cols['g_imps']] = pd.to_numeric(df[cols['g_imps']], errors='coerce').fillna(0)
+    if cols['m_freq'] in df.columns: df[cols['m_freq']] = pd.to_numeric(df[cols['m_freq']], errors='coerce').fillna(0)
+
+    # Pulizia specifica per l'AI
+    if cols['ret_rate'] in df.columns: df[cols['ret_rate']] = clean_percentage_series(df[cols['ret_rate']])
+    if cols['items'] in df.columns: df[cols['items']] = pd.to_numeric(df[cols['items']], errors='coerce').fillna(0)
+
+    df = df.fillna(0)
+
+    df['Fatturato_Netto'] = df[cols['sales']].clip(lower=0)
+    df['Spesa_Ads_Totale'] = df[cols['google']] + df[cols['meta']]
+    df['Tasso_Resi'] = (df[cols['returns']].abs() / df[cols['sales']].replace(0, np.nan)) * 100
+    df['Tasso_Resi'] = df['Tasso_Resi'].fillna(0)
+
+    # Calcolo CoS Storico
+    df['CoS'] = (df['Spesa_Ads_Totale'] / df['Fatturato_Netto'].replace(0, np.nan)) * 100
+    df['CoS'] = df['CoS'].fillna(0)
+
+    # Inizializzazione sicura ROAS
+    df['ROAS_Google'] = 0.0
+    df['ROAS_Meta'] = 0.0
+    if cols['g_val'] in df.columns: df['ROAS_Google'] = df[cols['g_val']] / df[cols['google']].replace(0, np.nan).fillna(0)
+    if cols['m_val'] in df.columns: df['ROAS_Meta'] = df[cols['m_val']] / df[cols['meta']].replace(0, np.nan).fillna(0)
+    return df, cols
+
+def add_operating_profit(df, cols, profit_order, be_aov):
+    """Aggiunge Profitto_Operativo: dipende dalla sidebar, quindi resta fuori dalla pulizia in cache."""
+    num_orders = df[cols['orders']] if cols['orders'] in df.columns else (df['Fatturato_Netto'] / be_aov)
+
+    # Profitto Operativo = (Numero Ordini * Profitto per Ordine) - Spesa Ads
+    df['Profitto_Operativo'] = (num_orders * profit_order) - df['Spesa_Ads_Totale']
+    return df
+
+# --- MEMORIA ---
+
+# Colonne calendario che non entrano mai in calcoli aritmetici: tipo intero minimo. Gli altri interi
+# (ordini, impression, articoli) restano almeno int32 per non andare in overflow nelle moltiplicazioni.
+SMALL_INT_COLUMNS = {'Year': np.int16, 'Week': np.int8, 'Giorni': np.int8}
+
+def optimize_dtypes(df):
+    """Copia compatta della tabella pulita, per tenerne meno in memoria per sessione.
+
+    Solo conversioni sicure: interi (e float con soli valori interi) a int32, o al tipo minimo per le colonne
+    calendario (Year -> int16, Week -> int8), altri float -> float32 (~7 cifre significative, ben sotto la
+    precisione dei dati in €), testi ripetuti (Periodo, `Year Week`, Store) categoriali quando occupano meno.
+    Data_Interna resta datetime64.
+    """
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_bool_dtype(s) or pd.api.types.is_datetime64_any_dtype(s) or isinstance(s.dtype, pd.CategoricalDtype):
+            out[c] = s
+        elif pd.api.types.is_numeric_dtype(s):
+            values = s.to_numpy(dtype=float, na_value=np.nan)
+            finite = np.isfinite(values)
+            if finite.all() and (values == np.round(values)).all():
+                ints = pd.Series(values.astype(np.int64), index=s.index)
+                small = SMALL_INT_COLUMNS.get(c)
+                if small and (ints.abs() <= np.iinfo(small).max).all():
+                    out[c] = ints.astype(small)
+                else:
+                    out[c] = ints.astype(np.int32) if (ints.abs() <= np.iinfo(np.int32).max).all() else ints
+            elif (np.abs(values[finite]) < np.finfo(np.float32).max).all():
+                out[c] = pd.Series(values.astype(np.float32), index=s.index)
+            else:
+                out[c] = s
+        elif pd.api.types.is_string_dtype(s) or s.dtype == object:
+            cat = s.astype('category')
+            out[c] = cat if cat.memory_usage(deep=True) < s.memory_usage(deep=True) else s
+        else:
+            out[c] = s
+    return pd.DataFrame(out, index=df.index)
+
+def memory_footprint(objects):
+    """Memoria occupata (deep, in byte) da ogni DataFrame / Series / array di `objects` (nome -> oggetto)."""
+    sizes = {}
+    for name, obj in objects.items():
+        if isinstance(obj, (pd.DataFrame, pd.Series)):
+            sizes[name] = int(np.sum(obj.memory_usage(deep=True)))
+        elif isinstance(obj, np.ndarray):
+            sizes[name] = obj.nbytes
+    return pd.Series(sizes, name='Byte', dtype=np.int64)
+
+# --- DATI DEMO ---
+
+def generate_demo_data(seed=None, start_date='2020-01-01', end_date='2026-05-31', freq='W', n_stores=1):
+    """Genera dati casuali ma realistici per la demo (default 2020-2026, settimanale).
+
+    Tutte le colonne sono calcolate con operazioni vettoriali, quindi il generatore regge
+    fixture da milioni di righe per i benchmark. `seed` rende i dati riproducibili (e cacheabili),
+    `freq` è 'W' (una riga per settimana, lunedì) o 'D' (una riga per giorno, con colonna `Day`),
+    `n_stores` > 1 aggiunge la colonna `Store` con un volume diverso per negozio.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start=start_date, end=end_date, freq='W-MON' if freq == 'W' else 'D')
+
+    # 1. Stagionalità Settimanale (Week 1-53) - Clonato dal CSV reale
+    # Notiamo: Q1 basso, Picco estivo (Week 26-28), Picco enorme Q4 (Black Friday Week 47-48)
+    seasonal_profile = {
+        1: 0.8, 2: 0.7, 3: 0.6, 4: 0.6, 5: 0.5, 6: 0.5, 7: 0.5, 8: 0.55, 9: 0.6, 10: 0.6,
+        11: 0.65, 12: 0.7, 13: 0.75, 14: 0.8, 15: 0.8, 16: 0.8, 17: 0.85, 18: 0.9, 19: 0.9, 20: 0.95,
+        21: 1.0, 22: 1.05, 23: 1.1, 24: 1.15, 25: 1.2, 26: 1.3, 27: 1.4, 28: 1.3, 29: 1.1, 30: 1.0,
+        31: 0.9, 32: 0.8, 33: 0.7, 34: 0.7, 35: 0.8, 36: 0.9, 37: 0.95, 38: 1.0, 39: 1.0, 40: 1.05,
+        41: 1.1, 42: 1.15, 43: 1.2, 44: 1.4, 45: 1.8, 46: 2.5, 47: 4.5, 48: 3.8, 49: 3.2, 50: 2.5,
+        51: 1.5, 52: 1.0, 53: 0.9
+    }
+
+    # 2. Trend Annuale Non-Lineare (Fattore moltiplicativo base)
+    yearly_trend = {
+        2020: 1.0,
+        2021: 1.4,  # Boom post-2020
+        2022: 1.3,  # Assestamento/Calo
+        2023: 1.5,  # Ripresa
+        2024: 1.7,  # Crescita solida
+        2025: 1.9,  # Crescita continua
+        2026: 2.1   # Proiezione
+    }
+
+    base_sales = 5000.0 if freq == 'W' else 5000.0 / 7 # Valore base settimanale (o giornaliero)
+
+    # Lookup per data distinta, poi ripetuto per ogni negozio (righe ordinate negozio -> data)
+    iso = dates.isocalendar()
+    week_d = iso['week'].to_numpy(dtype=int)
+    year_week_d = (iso['year'].astype(str) + iso['week'].astype(str).str.zfill(2)).to_numpy()
+    s_table = np.ones(54)
+    s_table[list(seasonal_profile)] = list(seasonal_profile.values())
+    y_fact_d = pd.Series(dates.year).map(yearly_trend).fillna(1.0).to_numpy()
+
+    n_dates, n = len(dates), len(dates) * n_stores
+    week = np.tile(week_d, n_stores)
+    s_fact = s_table[week]
+    store_scale = rng.lognormal(0.0, 0.5, n_stores) if n_stores > 1 else np.ones(1)
+
+    # Randomicità controllata
+    noise = rng.uniform(0.9, 1.1, n)
+
+    # Calcolo Vendite Totali
+    total_sales = base_sales * s_fact * np.tile(y_fact_d, n_stores) * np.repeat(store_scale, n_dates) * noise
+
+    # Spesa Ads (Segue le vendite ma con efficienza variabile)
+    # Quando il fatturato esplode (Black Friday), il ROAS sale ma il CPM costa di più
+    marketing_pressure = np.where(s_fact > 2.0, 0.15, 0.20) # 20% del fatturato in ads, meno nei picchi
+    total_spend = total_sales * marketing_pressure * rng.uniform(0.95, 1.05, n)
+
+    # Split Google/Meta (Google prende più brand search nei picchi)
+    google_share = np.where(s_fact > 1.5, 0.50, 0.40)
+    g_cost = total_spend * google_share
+    m_cost = total_spend * (1 - google_share)
+
+    # KPI Derivati
+    aov = 120.0 + rng.uniform(-10, 10, n)
+    orders = (total_sales / aov).astype(np.int64)
+
+    # Resi (più alti dopo i picchi)
+    return_rate = np.where(week <= 5, 0.25, 0.12) # Gennaio resi alti
+    returns = - (total_sales * return_rate * rng.uniform(0.8, 1.2, n))
+
+    discounts = - total_sales * np.where(s_fact < 2, 0.05, 0.15) # Più sconti nei picchi
+
+    # ROAS Simulato (valore conversione = quota del fatturato attribuita al canale)
+    roas_g = (total_sales * 0.6) / g_cost
+    roas_m = (total_sales * 0.5) / m_cost
+
+    ret_rate_labels = np.array([f"{v}%" for v in range(12, 28)], dtype=object)
+
+    data = {}
+    if n_stores > 1:
+        data['Store'] = np.repeat(np.array([f"store_{i + 1:03d}" for i in range(n_stores)], dtype=object), n_dates)
+    if freq != 'W':
+        data['Day'] = np.tile(dates.strftime('%Y-%m-%d').to_numpy(dtype=object), n_stores)
+    data.update({
+        'Year Week': np.tile(year_week_d, n_stores),
+        'Cost': g_cost,
+        'Amount Spent': m_cost,
+        'Total sales': total_sales,
+        'Returns': returns,
+        'Discounts': discounts,
+        'Average order value': aov,
+        'Orders': orders,
+        'Returning customer rate': ret_rate_labels[rng.integers(0, len(ret_rate_labels), n)],
+        'Conversions Value': g_cost * roas_g,
+        'Website Purchases Conversion Value': m_cost * roas_m,
+        'Avg. CPC': 0.85,
+        'CPC (All)': 0.65,
+        'CPM (Cost per 1,000 Impressions)': 12.50,
+        'Impressions': (m_cost / 12.50 * 1000).astype(np.int64),
+        'Frequency': 1.2,
+        'Items': (orders * 1.5).astype(np.int64),
+        'Gross sales': total_sales - discounts
+    })
+    return pd.DataFrame(data)
+
+# --- ELASTICITÀ E TREND ---
+
+def annual_totals(df):
+    """Spesa Ads e Fatturato Netto totali per anno (ordine crescente)."""
+    return df.groupby('Year').agg({'Spesa_Ads_Totale': 'sum', 'Fatturato_Netto': 'sum'}).sort_index()
+
+def suggest_saturation(df_annual):
+    """Elasticità ultimo anno vs precedente, limitata a 0.60-1.0 (0.85 se la spesa non è cresciuta > 5%)."""
+    suggested_saturation = 0.85
+    if len(df_annual) >= 2:
+        last_year = df_annual.index[-1]
+        prev_year = df_annual.index[-2]
+        d_spend = (df_annual.loc[last_year, 'Spesa_Ads_Totale'] - df_annual.loc[prev_year, 'Spesa_Ads_Totale']) / df_annual.loc[prev_year, 'Spesa_Ads_Totale']
+        d_rev = (df_annual.loc[last_year, 'Fatturato_Netto'] - df_annual.loc[prev_year, 'Fatturato_Netto']) / df_annual.loc[prev_year, 'Fatturato_Netto']
+        if d_spend > 0.05:
+            raw_elasticity = d_rev / d_spend
+            suggested_saturation = np.clip(raw_elasticity, 0.60, 1.0)
+    return suggested_saturation
+
+def yoy_growth(df):
+    """Trend YoY a finestra mobile: ultime 52 settimane vs le 52 precedenti."""
+    last_date = df['Data_Interna'].max()
+    start_last_year = last_date - pd.Timedelta(weeks=52)
+    start_prev_year = start_last_year - pd.Timedelta(weeks=52)
+    sales_ly = df[(df['Data_Interna'] > start_last_year) & (df['Data_Interna'] <= last_date)]['Fatturato_Netto'].sum()
+    sales_py = df[(df['Data_Interna'] > start_prev_year) & (df['Data_Interna'] <= start_last_year)]['Fatturato_Netto'].sum()
+    return (sales_ly - sales_py) / sales_py if sales_py > 0 else 0.0
+
+def historical_growth(df_annual):
+    """Crescita anno su anno del fatturato: lista di (anno, anno precedente, crescita), dal più recente."""
+    rows = []
+    years_avail = sorted(df_annual.index, reverse=True)
+    for i in range(len(years_avail) - 1):
+        curr_y = years_avail[i]
+        prev_y = years_avail[i+1]
+        val_curr = df_annual.loc[curr_y, 'Fatturato_Netto']
+        val_prev = df_annual.loc[prev_y, 'Fatturato_Netto']
+        rows.append((curr_y, prev_y, (val_curr - val_prev) / val_prev if val_prev > 0 else 0))
+    return rows
+
+# --- CUBO ELASTICITÀ (anno x settimana ISO) ---
+
+def elasticity_cube(df):
+    """Spesa Ads e fatturato in matrici (anno x settimana ISO 1-53), da calcolare una volta per dataset.
+
+    Più righe nella stessa cella (es. la settimana 1 che inizia a fine dicembre, o più negozi) vengono sommate;
+    `periods` tiene la prima etichetta Periodo della cella ('' se vuota). Tutti i confronti tra anni
+    (elasticity_pairs, weekly_elasticity, annual_elasticity_matrix) sono poi operazioni sulle matrici.
+    """
+    years = np.sort(df['Year'].unique())
+    cell = np.searchsorted(years, df['Year'].to_numpy()) * 53 + df['Week'].to_numpy(dtype=int) - 1
+    size = len(years) * 53
+    spend = np.bincount(cell, weights=df['Spesa_Ads_Totale'].to_numpy(dtype=float), minlength=size)
+    revenue = np.bincount(cell, weights=df['Fatturato_Netto'].to_numpy(dtype=float), minlength=size)
+    periods = np.full(size, '', dtype=object)
+    first = np.unique(cell, return_index=True)[1]
+    periods[cell[first]] = np.asarray(df['Periodo'], dtype=object)[first]
+    shape = (len(years), 53)
+    return {'years': years.astype(int), 'spend': spend.reshape(shape), 'revenue': revenue.reshape(shape), 'periods': periods.reshape(shape)}
+
+def _pct_delta(curr, prev):
+    """Variazione % (curr - prev) / prev, 0 dove prev <= 0."""
+    curr, prev = np.asarray(curr, dtype=float), np.asarray(prev, dtype=float)
+    return np.divide((curr - prev) * 100, prev, out=np.zeros(np.broadcast(curr, prev).shape), where=prev > 0)
+
+def _elasticity(d_rev, d_spend):
+    """Delta fatturato % / delta spesa %, 0 dove la spesa non varia."""
+    return np.divide(d_rev, d_spend, out=np.zeros(np.broadcast(d_rev, d_spend).shape), where=d_spend != 0)
+
+def elasticity_pairs(cube):
+    """Riepilogo annuale: ogni anno vs il precedente (dal più recente) con delta spesa / fatturato ed elasticità."""
+    years, spend, revenue = cube['years'], cube['spend'].sum(axis=1), cube['revenue'].sum(axis=1)
+    d_spend, d_rev = _pct_delta(spend[1:], spend[:-1]), _pct_delta(revenue[1:], revenue[:-1])
+    return pd.DataFrame({
+        'Confronto': [f"{c} vs {p}" for c, p in zip(years[1:], years[:-1])],
+        'Delta Spesa %': d_spend, 'Delta Fatturato %': d_rev, 'Elasticità': _elasticity(d_rev, d_spend),
+    }).iloc[::-1].reset_index(drop=True)
+
+def weekly_elasticity(cube, curr_year, prev_year):
+    """Confronto settimana per settimana tra due anni qualsiasi (lookup di due righe del cubo).
+
+    Solo le settimane con spesa in almeno uno dei due anni, dalla 53 alla 1.
+    """
+    years = list(cube['years'])
+    i, j = years.index(curr_year), years.index(prev_year)
+    s_curr, s_prev = cube['spend'][i], cube['spend'][j]
+    r_curr, r_prev = cube['revenue'][i], cube['revenue'][j]
+    d_spend, d_rev = _pct_delta(s_curr, s_prev), _pct_delta(r_curr, r_prev)
+    table = pd.DataFrame({
+        'Week': np.arange(1, 54), 'Periodo': cube['periods'][i],
+        'Spesa_Ads_Totale_Curr': s_curr, 'Fatturato_Netto_Curr': r_curr,
+        'Spesa_Ads_Totale_Prev': s_prev, 'Fatturato_Netto_Prev': r_prev,
+        'Delta Spesa %': d_spend, 'Delta Ricavi %': d_rev, 'Elasticità': _elasticity(d_rev, d_spend),
+    })
+    return table[(s_curr > 0) | (s_prev > 0)].iloc[::-1]
+
+def annual_elasticity_matrix(cube):
+    """Elasticità annuale per ogni coppia di anni (righe: anno corrente, colonne: anno di confronto precedente).
+
+    Broadcasting dei totali annui: O(anni²) senza ricalcoli sullo storico; NaN dove l'anno di confronto non è precedente.
+    """
+    years, spend, revenue = cube['years'], cube['spend'].sum(axis=1), cube['revenue'].sum(axis=1)
+    d_spend = _pct_delta(spend[:, None], spend[None, :])
+    d_rev = _pct_delta(revenue[:, None], revenue[None, :])
+    matrix = np.where(years[:, None] > years[None, :], _elasticity(d_rev, d_spend), np.nan)
+    return pd.DataFrame(matrix, index=pd.Index(years, name='Anno'), columns=pd.Index(years, name='Confronto'))
+
+# --- PREVISIONE ---
+
+def seasonal_table(df, cols):
+    """Media storica per settimana ISO (Week_Num) di fatturato, spesa Google/Meta e ordini."""
+    week_num = df['Week'].rename('Week_Num')  # già calcolata dalla pulizia
+    return df.groupby(week_num).agg({
+        'Fatturato_Netto': 'mean', cols['google']: 'mean', cols['meta']: 'mean', cols['orders']: 'mean'
+    }).reset_index()
+
+def forecast_dates(last_date, mesi_prev):
+    """Lunedì delle settimane future per un orizzonte di `mesi_prev` mesi."""
+    return pd.date_range(start=last_date + pd.Timedelta(weeks=1), periods=int(mesi_prev*4.34), freq='W-MON')
+
+def seasonal_base(seasonal, future_dates, col_google, col_meta):
+    """Base storica per ogni settimana futura: matrice (settimane x [fatturato, Google, Meta]).
+
+    Lookup per numero settimana ISO: le settimane assenti nello storico usano la media stagionale.
+    """
+    cols = ['Fatturato_Netto', col_google, col_meta]
+    lookup = seasonal.set_index('Week_Num')[cols].astype(float)
+    lookup = lookup.reindex(range(54)).fillna(seasonal[cols].mean())
+    weeks = future_dates.isocalendar().week.to_numpy(dtype=int)
+    return lookup.to_numpy()[weeks]
+
+def project_forecast(base, growth_rate, manual_trend, m_google, m_meta, sat_factor):
+    """Spesa Google, spesa Meta e fatturato previsti (array) dalla base stagionale di seasonal_base."""
+    # Trend applicato (Base storica + Slider)
+    base_trend = (1 + growth_rate) * (1 + manual_trend)
+    proj_sales_base = base[:, 0] * base_trend
+    proj_google_base = base[:, 1] * base_trend
+    proj_meta_base = base[:, 2] * base_trend
+
+    new_g, new_m = proj_google_base * m_google, proj_meta_base * m_meta
+    base_spend = proj_google_base + proj_meta_base
+    ratio = np.divide(new_g + new_m, base_spend, out=np.ones_like(base_spend), where=base_spend > 0)
+    return new_g, new_m, proj_sales_base * (ratio ** sat_factor)
+
+def build_forecast(seasonal, future_dates, growth_rate, manual_trend, m_google, m_meta, sat_factor, be_aov, col_google, col_meta):
+    """Costruisce l'intera tabella previsionale (df_prev) con operazioni vettoriali, senza loop per settimana."""
+    base = seasonal_base(seasonal, future_dates, col_google, col_meta)
+    new_g, new_m, f_sales = project_forecast(base, growth_rate, manual_trend, m_google, m_meta, sat_factor)
+
+    df_prev = pd.DataFrame({
+        'Data': future_dates,
+        'Periodo': week_range_labels(future_dates),
+        'Google Previsto': new_g,
+        'Meta Previsto': new_m,
+        'Fatturato Previsto': f_sales,
+        'Ordini Previsti': f_sales / be_aov
+    })
+    df_prev['Spesa Totale'] = df_prev['Google Previsto'] + df_prev['Meta Previsto']
+    df_prev['MER Previsto'] = df_prev['Fatturato Previsto'] / df_prev['Spesa Totale']
+    # Calcolo CoS Previsto
+    df_prev['CoS Previsto'] = (df_prev['Spesa Totale'] / df_prev['Fatturato Previsto'].replace(0, np.nan)) * 100
+    df_prev['CoS Previsto'] = df_prev['CoS Previsto'].fillna(0)
+    return df_prev
+
+def grid_values(start, stop, step):
+    """Valori equispaziati da `start` a `stop` inclusi (arrotondati, per etichette pulite)."""
+    return np.round(np.arange(start, stop + step / 2, step), 4)
+
+def sweep_scenarios(seasonal, future_dates, growth_rate, economics, col_google, col_meta,
+                    trends, google_scales, meta_scales, saturations):
+    """Valuta tutte le combinazioni trend x scala Google x scala Meta x saturazione in un solo calcolo.
+
+    Stesso modello di build_forecast (base stagionale x trend x `ratio ** sat_factor`), ma con le
+    griglie in broadcasting: il trend è un fattore comune, quindi si calcola una sola volta la
+    matrice (Google, Meta, Saturazione, settimane) e la si moltiplica per ogni trend.
+    Restituisce una riga per scenario con totali di periodo, MER, CoS e profitto operativo stimato.
+    """
+    trends, g_sc, m_sc, sats = (np.asarray(v, dtype=float) for v in (trends, google_scales, meta_scales, saturations))
+    base = seasonal_base(seasonal, future_dates, col_google, col_meta)
+    sales0, g0, m0 = base[:, 0], base[:, 1], base[:, 2]
+
+    # Rapporto di spesa per settimana: (Google, Meta, settimane); 1.0 dove la spesa storica è nulla
+    spend0 = g0 + m0
+    new_spend = g0 * g_sc[:, None, None] + m0 * m_sc[None, :, None]
+    ratio = np.divide(new_spend, spend0, out=np.ones_like(new_spend), where=spend0 > 0)
+
+    # Fatturato e spesa a trend unitario, poi scalati per ogni trend: (G, M, S, T)
+    rev_unit = np.einsum('gmsw,w->gms', ratio[:, :, None, :] ** sats[None, None, :, None], sales0)
+    spend_unit = new_spend.sum(axis=-1)
+    base_trend = (1 + growth_rate) * (1 + trends)
+    revenue = rev_unit[..., None] * base_trend
+    spend = np.broadcast_to(spend_unit[:, :, None, None] * base_trend, revenue.shape)
+
+    profit = revenue / economics['be_aov'] * economics['profit_order'] - spend
+    grid = np.meshgrid(g_sc, m_sc, sats, trends, indexing='ij')
+    out = pd.DataFrame({
+        'Scala Google': grid[0].ravel(), 'Scala Meta': grid[1].ravel(),
+        'Saturazione': grid[2].ravel(), 'Trend': grid[3].ravel(),
+        'Fatturato': revenue.ravel(), 'Spesa': spend.ravel(), 'Profitto': profit.ravel(),
+    })
+    out['MER'] = out['Fatturato'] / out['Spesa'].replace(0, np.nan)
+    out['CoS'] = (out['Spesa'] / out['Fatturato'].replace(0, np.nan)) * 100
+    return out
+
+# --- PREVISIONE PROBABILISTICA (MONTE CARLO) ---
+
+def forecast_uncertainty(df, df_annual, min_samples=2):
+    """Fonti di incertezza stimate dallo storico, per simulate_forecast.
+
+    - residui YoY per settimana ISO: log(fatturato anno / anno precedente) della stessa settimana, meno la
+      crescita media di quell'anno, diviso radice di 2 (differenza di due settimane rumorose). Settimane con
+      meno di `min_samples` residui usano il pool globale;
+    - deviazione standard del trend YoY a 52 settimane calcolato su ogni settimana dello storico;
+    - deviazione standard dell'elasticità fatturato/spesa tra anni consecutivi (0.1 se non stimabile).
+    """
+    iso = df['Data_Interna'].dt.isocalendar()
+    weekly = df.groupby([iso.year.to_numpy(), iso.week.to_numpy()])['Fatturato_Netto'].sum().unstack()
+    weekly = weekly.reindex(range(weekly.index.min(), weekly.index.max() + 1)).where(lambda x: x > 0)
+    log_yoy = np.log(weekly).diff().iloc[1:]
+    resid = log_yoy.sub(log_yoy.mean(axis=1), axis=0).to_numpy() / np.sqrt(2)
+    weeks = log_yoy.columns.to_numpy(dtype=int)
+
+    global_pool = resid[np.isfinite(resid)]
+    if global_pool.size == 0: global_pool = np.zeros(1)
+    samples = [resid[:, weeks == w].ravel() for w in range(54)]
+    samples = [x[np.isfinite(x)] for x in samples]
+    samples = [x if x.size >= min_samples else global_pool for x in samples]
+    counts = np.array([x.size for x in samples])
+    pool = np.zeros((54, counts.max()))
+    for w, x in enumerate(samples): pool[w, :x.size] = x
+
+    weekly_sales = df.set_index('Data_Interna')['Fatturato_Netto'].resample('W').sum()
+    rolling = weekly_sales.rolling(52).sum()
+    growth_hist = (rolling / rolling.shift(52) - 1).replace([np.inf, -np.inf], np.nan).dropna()
+    growth_sd = float(growth_hist.std()) if len(growth_hist) >= 2 else 0.05
+
+    pct = df_annual[['Spesa_Ads_Totale', 'Fatturato_Netto']].pct_change().iloc[1:]
+    elasticity = (pct['Fatturato_Netto'] / pct['Spesa_Ads_Totale'])[pct['Spesa_Ads_Totale'] > 0.05]
+    sat_sd = float(np.clip(elasticity, 0.0, 1.5).std()) if len(elasticity) >= 2 else 0.1
+
+    return {'pool': pool, 'counts': counts, 'growth_sd': np.nan_to_num(growth_sd, nan=0.05),
+            'sat_sd': np.nan_to_num(sat_sd, nan=0.1)}
+
+def simulate_forecast(seasonal, future_dates, growth_rate, manual_trend, m_google, m_meta, sat_factor, economics,
+                      col_google, col_meta, uncertainty, n_paths=10000, chunk_size=2000, seed=0,
+                      quantiles=(0.1, 0.5, 0.9)):
+    """Bande P10/P50/P90 della previsione con `n_paths` percorsi simulati (matrice percorsi x settimane).
+
+    Ogni percorso estrae una crescita ~ N(growth_rate, growth_sd), una saturazione ~ N(sat_factor, sat_sd)
+    limitata a 0.5-1.0 e, per ogni settimana, un residuo dal pool della sua settimana ISO; il resto è il
+    modello di build_forecast. La simulazione procede a blocchi di `chunk_size` percorsi: in memoria restano
+    solo le matrici float32 dei risultati, non i temporanei dell'intero calcolo.
+
+    Restituisce (bande settimanali: Data, Periodo e '<metrica> P10/P50/P90' per Fatturato, Spesa, MER e
+    Profitto; quantili dei totali sull'orizzonte, {metrica: {etichetta: valore}}).
+    """
+    rng = np.random.default_rng(seed)
+    base = seasonal_base(seasonal, future_dates, col_google, col_meta)
+    weeks = future_dates.isocalendar().week.to_numpy(dtype=int)
+    pool, counts = uncertainty['pool'][weeks], uncertainty['counts'][weeks]
+    mu = economics['profit_order'] / economics['be_aov']
+    n_weeks = len(future_dates)
+
+    base_spend = base[:, 1] + base[:, 2]
+    plan_spend = base[:, 1] * m_google + base[:, 2] * m_meta
+    ratio = np.divide(plan_spend, base_spend, out=np.ones_like(base_spend), where=base_spend > 0)
+
+    sales = np.empty((n_paths, n_weeks), dtype=np.float32)
+    spend = np.empty((n_paths, n_weeks), dtype=np.float32)
+    for start in range(0, n_paths, chunk_size):
+        n = min(chunk_size, n_paths - start)
+        growth = rng.normal(growth_rate, uncertainty['growth_sd'], n)
+        sat = np.clip(rng.normal(sat_factor, uncertainty['sat_sd'], n), 0.5, 1.0)
+        idx = (rng.random((n, n_weeks)) * counts).astype(int)
+        noise = np.exp(pool[np.arange(n_weeks), idx])
+        trend = ((1 + growth) * (1 + manual_trend))[:, None]
+        sales[start:start + n] = base[:, 0] * trend * np.power(ratio, sat[:, None]) * noise
+        spend[start:start + n] = plan_spend * trend
+
+    metrics = {
+        'Fatturato': sales, 'Spesa': spend,
+        'MER': np.divide(sales, spend, out=np.zeros_like(sales), where=spend > 0),
+        'Profitto': sales * mu - spend,
+    }
+    labels = [f"P{q * 100:.0f}" for q in quantiles]
+    bands = pd.DataFrame({'Data': future_dates, 'Periodo': week_range_labels(future_dates)})
+    for name, values in metrics.items():
+        for label, band in zip(labels, np.quantile(values, quantiles, axis=0)):
+            bands[f"{name} {label}"] = band
+
+    tot_sales, tot_spend = sales.sum(axis=1, dtype=float), spend.sum(axis=1, dtype=float)
+    totals_paths = {
+        'Fatturato': tot_sales, 'Spesa': tot_spend,
+        'MER': np.divide(tot_sales, tot_spend, out=np.zeros_like(tot_sales), where=tot_spend > 0),
+        'Profitto': tot_sales * mu - tot_spend,
+    }
+    totals = {name: dict(zip(labels, np.quantile(values, quantiles).tolist())) for name, values in totals_paths.items()}
+    return bands, totals
+
+# --- OTTIMIZZAZIONE BUDGET ---
+
+def fit_channel_response(spend, roas, default_b=0.85):
+    """Curva di risposta di un canale stimata dallo storico: ROAS = a * spesa**(b-1), cioè valore = a * spesa**b.
+
+    Regressione log-log sulle settimane con spesa e ROAS positivi; l'elasticità b è limitata a 0.05-0.95
+    (rendimenti decrescenti, ottimo finito). Con meno di 3 settimane utili si usa `default_b`.
+    """
+    spend, roas = np.asarray(spend, dtype=float), np.asarray(roas, dtype=float)
+    ok = (spend > 0) & np.isfinite(roas) & (roas > 0)
+    x, y = np.log(spend[ok]), np.log(roas[ok])
+    b = default_b
+    if ok.sum() >= 3 and np.ptp(x) > 0:
+        b = float(np.clip(np.polyfit(x, y, 1)[0] + 1, 0.05, 0.95))
+    a = float(np.exp(np.mean(y - (b - 1) * x))) if ok.any() else 0.0
+    return {'a': a, 'b': b, 'n': int(ok.sum())}
+
+def fit_response_curves(df, cols, default_b=0.85):
+    """Curve di risposta Google e Meta dalle colonne storiche ROAS_Google / ROAS_Meta."""
+    return {
+        'google': fit_channel_response(df[cols['google']], df['ROAS_Google'], default_b),
+        'meta': fit_channel_response(df[cols['meta']], df['ROAS_Meta'], default_b),
+    }
+
+def optimize_budget(seasonal, future_dates, growth_rate, manual_trend, economics, curves, col_google, col_meta,
+                    budget_cap=None, min_mer=None, m_google=1.0, m_meta=1.0, min_scale=0.5, max_scale=5.0):
+    """Spesa settimanale Google/Meta che massimizza il Profitto Operativo sull'orizzonte di previsione.
+
+    Modello di saturazione per canale: il fatturato previsto di ogni settimana (stagionalità x trend) è
+    ripartito tra i canali in proporzione al valore che le curve attribuiscono alla spesa base s0, e ogni
+    quota reagisce come (s / s0) ** b del canale. Con profitto = fatturato / AOV * profit_order - spesa
+    l'ottimo per canale e settimana ha forma chiusa s = s0 * (mu * b * v0 / (s0 * (1 + lam))) ** (1 / (1 - b)),
+    limitato a `min_scale`-`max_scale` volte s0 (il range degli slider). `lam` >= 0 si trova per bisezione
+    per rispettare il tetto di budget totale (`budget_cap`) e il MER minimo (`min_mer`, es. be_roas_val).
+
+    Restituisce (tabella settimanale ottimizzata, riepilogo con il confronto rispetto al piano
+    corrente `m_google` / `m_meta` valutato con lo stesso modello).
+    """
+    base = seasonal_base(seasonal, future_dates, col_google, col_meta)
+    base_trend = (1 + growth_rate) * (1 + manual_trend)
+    sales0 = base[:, 0] * base_trend
+    s0 = base[:, 1:] * base_trend  # (settimane, [Google, Meta])
+    mu = economics['profit_order'] / economics['be_aov']
+
+    a = np.array([curves['google']['a'], curves['meta']['a']])
+    b = np.array([curves['google']['b'], curves['meta']['b']])
+    attributed = a * np.power(s0, b)
+    total_attr = attributed.sum(axis=1, keepdims=True)
+    share = np.divide(attributed, total_attr, out=np.full_like(attributed, 0.5), where=total_attr > 0)
+    v0 = sales0[:, None] * share
+    active = s0 > 0
+
+    def evaluate(spend):
+        rel = np.divide(spend, s0, out=np.zeros_like(spend), where=active)
+        revenue = (v0 * np.power(rel, b)).sum(axis=1)
+        return revenue, revenue * mu - spend.sum(axis=1)
+
+    def spend_at(lam):
+        if mu <= 0: return s0 * min_scale
+        marginal = np.divide(mu * b * v0, s0 * (1 + lam), out=np.zeros_like(s0), where=active)
+        return s0 * np.clip(np.power(marginal, 1 / (1 - b)), min_scale, max_scale)
+
+    def feasible(spend):
+        total = spend.sum()
+        if budget_cap is not None and total > budget_cap: return False
+        if min_mer is not None and total > 0 and evaluate(spend)[0].sum() / total < min_mer: return False
+        return True
+
+    lam = 0.0
+    if not feasible(spend_at(0.0)):
+        # Più lam cresce, più la spesa scende (fino a min_scale * s0): bisezione sul primo lam ammissibile
+        lo, hi = 0.0, 1.0
+        while not feasible(spend_at(hi)) and hi < 1e12: hi *= 10
+        for _ in range(100):
+            mid = (lo + hi) / 2
+            if feasible(spend_at(mid)): hi = mid
+            else: lo = mid
+        lam = hi
+    spend = spend_at(lam)
+    revenue, profit = evaluate(spend)
+
+    plan = s0 * np.array([m_google, m_meta])
+    plan_revenue, plan_profit = evaluate(plan)
+
+    df_opt = pd.DataFrame({
+        'Data': future_dates, 'Periodo': week_range_labels(future_dates),
+        'Google Ottimale': spend[:, 0], 'Meta Ottimale': spend[:, 1], 'Spesa Totale': spend.sum(axis=1),
+        'Fatturato Previsto': revenue, 'Profitto Operativo': profit, 'Spesa Piano': plan.sum(axis=1),
+    })
+    df_opt['MER Previsto'] = df_opt['Fatturato Previsto'] / df_opt['Spesa Totale'].replace(0, np.nan)
+    summary = {
+        'lambda': lam, 'vincolo_rispettato': feasible(spend),
+        'spesa': spend.sum(), 'fatturato': revenue.sum(), 'profitto': profit.sum(),
+        'mer': revenue.sum() / spend.sum() if spend.sum() > 0 else np.nan,
+        'spesa_piano': plan.sum(), 'fatturato_piano': plan_revenue.sum(), 'profitto_piano': plan_profit.sum(),
+    }
+    return df_opt, summary
+
+def run_pipeline(df_raw, economics=None, mesi_prev=6, manual_trend=0.0, m_google=1.0, m_meta=1.0, sat_factor=None,
+                 cleaned=None):
+    """Pipeline completa senza UI: pulizia -> profitto -> elasticità / trend YoY -> previsione.
+
+    `economics` è l'output di compute_economics (default: valori della sidebar);
+    `sat_factor=None` usa la saturazione suggerita dai dati, come "Auto-Calibra".
+    Con `cleaned=(df, cols)` (es. dalla cache su disco) la pulizia viene saltata e `df_raw` è ignorato.
+    """
+    economics = economics or compute_economics(**DEFAULT_ECONOMICS)
+    df, cols = cleaned if cleaned is not None else clean_dataframe(df_raw)
+    add_operating_profit(df, cols, economics['profit_order'], economics['be_aov'])
+
+    df_annual = annual_totals(df)
+    suggested_saturation = float(suggest_saturation(df_annual))
+    growth_rate = yoy_growth(df)
+    sat_factor = suggested_saturation if sat_factor is None else sat_factor
+
+    seasonal = seasonal_table(df, cols)
+    future_dates = forecast_dates(df['Data_Interna'].max(), mesi_prev)
+    df_prev = build_forecast(seasonal, future_dates, growth_rate, manual_trend, m_google, m_meta, sat_factor,
+                             economics['be_aov'], cols['google'], cols['meta'])
+    return {
+        'df': df, 'cols': cols, 'df_annual': df_annual, 'seasonal': seasonal, 'df_prev': df_prev,
+        'growth_rate': growth_rate, 'suggested_saturation': suggested_saturation, 'sat_factor': sat_factor,
+    }
+
+# --- INSIGHT AI ---
+
+def ai_monthly_table(df, cols, by=None):
+    """Aggregato mensile (dal più recente) con MER, incidenza sconti, ROAS canali e stagionalità.
+
+    Con `by` (es. 'Store') l'aggregato è per negozio e mese, in un solo groupby: indice (negozio, mese),
+    negozi in ordine crescente e mesi dal più recente; la stagionalità è relativa alla media del negozio.
+    Senza Profitto_Operativo in `df` la tabella non dipende dalla sidebar; il profitto si può aggiungere dopo
+    con add_operating_profit sulla tabella mensile (è lineare in ordini e spesa).
+    """
+    ai_agg = {
+        'Spesa_Ads_Totale': 'sum', 'Fatturato_Netto': 'sum', 'Orders': 'sum',
+        cols['returns']: 'sum', cols['discounts']: 'sum', cols['google']: 'sum', cols['meta']: 'sum',
+        cols['g_val']: 'sum', cols['m_val']: 'sum', 'Gross sales': 'sum'
+    }
+    if 'Profitto_Operativo' in df.columns: ai_agg['Profitto_Operativo'] = 'sum'
+    for c in [cols['ret_rate'], cols['m_freq'], cols['m_cpm'], cols['g_cpc'], cols['m_cpc']]:
+        if c in df.columns: ai_agg[c] = 'mean'
+
+    month = df['Data_Interna'].dt.to_period('M').rename('Month_Date')
+    if by is None:
+        ai_df = df.groupby(month).agg(ai_agg).sort_index(ascending=False)
+    else:
+        ai_df = df.groupby([df[by], month]).agg(ai_agg).sort_index(ascending=[True, False])
+
+    ai_df['MER'] = ai_df['Fatturato_Netto'] / ai_df['Spesa_Ads_Totale'].replace(0, np.nan)
+    ai_df['Discount_Rate'] = (ai_df[cols['discounts']].abs() / ai_df['Gross sales'].replace(0, np.nan)) * 100
+    ai_df['ROAS_Google'] = ai_df[cols['g_val']] / ai_df[cols['google']].replace(0, np.nan)
+    ai_df['ROAS_Meta'] = ai_df[cols['m_val']] / ai_df[cols['meta']].replace(0, np.nan)
+
+    avg_sales = ai_df['Fatturato_Netto'].mean() if by is None else ai_df.groupby(level=by)['Fatturato_Netto'].transform('mean')
+    ai_df['Seasonality'] = ai_df['Fatturato_Netto'] / avg_sales
+    return ai_df
+
+def score_months(ai_df, be_roas_val, bench_ret=None, col_ret_rate=None, by=None):
+    """Punteggio di salute (0-100) di tutti i mesi di ai_monthly_table con operazioni per colonna.
+
+    Regole: MER >= BE ROAS +20 (altrimenti -20 e alert), tasso clienti di ritorno > 110% del benchmark +15
+    (< 80% -10 e alert), canale con ROAS migliore, fascia di stagionalità. `bench_ret=None` usa la media della
+    colonna (per negozio se `by` è un livello dell'indice). Restituisce `ai_df` con le colonne Score, Sotto BE,
+    Tags, Alerts (liste), Stagionalità e Classe (classe CSS della card).
+    """
+    mer = ai_df['MER']
+    profitable = (mer >= be_roas_val).to_numpy()
+    score = 50 + np.where(profitable, 20, -20)
+    ret_tag, ret_alert = np.full(len(ai_df), ''), np.full(len(ai_df), '')
+
+    if col_ret_rate is not None:
+        ret = ai_df[col_ret_rate]
+        if bench_ret is None:
+            bench_ret = ret.mean() if by is None else ret.groupby(level=by).transform('mean')
+        high = (ret > bench_ret * 1.1).to_numpy()
+        low = ~high & (ret < bench_ret * 0.8).to_numpy()
+        score = score + 15 * high - 10 * low
+        ret_tag = np.where(high, "Retention " + ret.map('{:.1f}'.format).to_numpy(dtype=object) + "%", '')
+        ret_alert = np.where(low, "Crollo Retention", '')
+
+    profit_tag = np.where(profitable, f"Profittevole (> {be_roas_val:.2f})", '')
+    profit_alert = np.where(profitable, '', "Sotto Break-Even (MER " + mer.map('{:.2f}'.format).to_numpy(dtype=object) + ")")
+    channel_tag = np.where(ai_df['ROAS_Google'] > ai_df['ROAS_Meta'], "Win: Google", "Win: Meta")
+
+    seasonality = ai_df['Seasonality']
+    seas_txt = np.select([seasonality > 1.2, seasonality < 0.8], ["Alta Stagionalità 🔥", "Bassa Stagionalità ❄️"], "Media")
+    color_class = np.select([score >= 70, score >= 50], ["ai-score-high", "ai-score-med"], "ai-score-low")
+
+    scored = ai_df.copy()
+    scored['Score'] = score
+    scored['Sotto BE'] = ~profitable
+    scored['Tags'] = [[t for t in row if t] for row in zip(profit_tag, ret_tag, channel_tag)]
+    scored['Alerts'] = [[a for a in row if a] for row in zip(profit_alert, ret_alert)]
+    scored['Stagionalità'] = seas_txt
+    scored['Classe'] = color_class
+    return scored
+
+def score_month(row, be_roas_val, bench_ret, col_ret_rate=None):
+    """Punteggio di un singolo mese (una riga di ai_monthly_table), con le stesse regole di score_months."""
+    res = score_months(row.to_frame().T, be_roas_val, bench_ret, col_ret_rate).iloc[0]
+    return {'score': int(res['Score']), 'tags': res['Tags'], 'alerts': res['Alerts'],
+            'seas_txt': res['Stagionalità'], 'color_class': res['Classe']}
+
+def rank_health(scored, by='Store', months=12):
+    """Classifica dei negozi per salute: media dello Score negli ultimi `months` mesi di ciascuno (dal più sano).
+
+    `scored` è l'output di score_months su ai_monthly_table(..., by=by).
+    """
+    recent = scored.groupby(level=by, group_keys=False).head(months)
+    grouped = recent.groupby(level=by)
+    ranking = pd.DataFrame({
+        'Score Medio': grouped['Score'].mean(),
+        'Ultimo Score': grouped['Score'].first(),
+        'Mesi Sotto BE': grouped['Sotto BE'].sum(),
+        'Fatturato': grouped['Fatturato_Netto'].sum(),
+        'Profitto Operativo': grouped['Profitto_Operativo'].sum(),
+        'MER': grouped['Fatturato_Netto'].sum() / grouped['Spesa_Ads_Totale'].sum().replace(0, np.nan),
+        'Mesi': grouped.size(),
+    })
+    return ranking.sort_values(['Score Medio', 'Profitto Operativo'], ascending=False).rename_axis(by).reset_index()
@@ -0,0 +1,142 @@
+"""Lettura veloce degli export CSV (Shopify / Google Ads / Meta Ads).
+
+Il separatore viene rilevato una sola volta sui primi KB del file, poi il parsing
+completo usa il motore C di pandas (o pyarrow, se installato) con dtype espliciti
+per le colonne note, invece del lento motore Python con `sep=None`.
+"""
+import csv
+import importlib.util
+import io
+
+import pandas as pd
+
+SNIFF_BYTES = 64 * 1024
+DELIMITERS = [',', ';', '\t', '|']
+
+# Colonne testuali: restano stringhe e vengono pulite a valle (parse_iso_week / clean_percentage)
+TEXT_COLUMNS = ['Year Week', 'Settimana', 'Returning customer rate']
+
+# Colonne numeriche note: float64 se il campione è già numerico, altrimenti stringa per clean_currency_us
+NUMERIC_COLUMNS = [
+    'Cost', 'Amount Spent', 'Total sales', 'Returns', 'Discounts', 'Gross sales', 'Average order value',
+    'Orders', 'Items', 'Conversions Value', 'Website Purchases Conversion Value', 'Avg. CPC', 'CPC (All)',
+    'CPM (Cost per 1,000 Impressions)', 'Impressions', 'Frequency'
+]
+
+
+def default_engine():
+    """Motore di parsing preferito: pyarrow se disponibile, altrimenti il motore C di pandas."""
+    return 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+
+
+def sniff_delimiter(sample):
+    """Rileva il separatore dalle prime righe complete del campione.
+
+    Un candidato è valido se produce lo stesso numero di campi (> 1) su tutte le righe;
+    tra i validi vince quello con più campi. Così un header come
+    `CPM (Cost per 1,000 Impressions)` non fa scambiare un file `;` per un file `,`.
+    """
+    lines = sample.splitlines()
+    if len(lines) > 1 and not sample.endswith(('\n', '\r')):
+        lines = lines[:-1]  # l'ultima riga del campione può essere troncata
+    lines = [l for l in lines[:50] if l.strip()]
+    if not lines: return ','
+
+    best, best_fields = None, 1
+    for delim in DELIMITERS:
+        counts = {len(row) for row in csv.reader(lines, delimiter=delim)}
+        if len(counts) == 1:
+            n_fields = counts.pop()
+            if n_fields > best_fields: best, best_fields = delim, n_fields
+    if best is not None: return best
+
+    # Nessun candidato coerente (es. righe con campi vuoti finali): il più frequente nell'header
+    return max(DELIMITERS, key=lambda d: lines[0].count(d))
+
+
+def _is_numeric(values):
+    try:
+        pd.to_numeric(pd.Series(values, dtype=object).replace('', None), errors='raise')
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+def infer_dtypes(sample, sep):
+    """Dtype espliciti per le colonne note presenti nell'header (chiavi = nomi grezzi, spazi inclusi)."""
+    rows = list(csv.reader(sample.splitlines()[:200], delimiter=sep))
+    if not rows: return {}, []
+    header, body = rows[0], rows[1:-1] if len(rows) > 2 else rows[1:]
+
+    dtypes, numeric = {}, []
+    for i, raw in enumerate(header):
+        name = raw.strip()
+        if name in TEXT_COLUMNS:
+            dtypes[raw] = str
+        elif name in NUMERIC_COLUMNS:
+            values = [r[i].strip() for r in body if i < len(r)]
+            if _is_numeric(values):
+                dtypes[raw] = 'float64'
+                numeric.append(raw)
+            else:
+                dtypes[raw] = str
+    return dtypes, numeric
+
+
+def _head(source):
+    """Primi KB di `source` (percorso o file-like, la posizione non cambia) come testo."""
+    if hasattr(source, 'read'):
+        pos = source.tell()
+        head = source.read(SNIFF_BYTES)
+        source.seek(pos)
+    else:
+        with open(source, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+    return head.decode('utf-8-sig', errors='replace')
+
+
+def _sniff(source):
+    """Separatore e dtype dai primi KB di `source` (percorso o file-like, la posizione non cambia)."""
+    sample = _head(source)
+    sep = sniff_delimiter(sample)
+    return (sep, *infer_dtypes(sample, sep))
+
+
+def csv_header(source):
+    """Nomi grezzi delle colonne (spazi inclusi) dalla prima riga di `source`."""
+    sample = _head(source)
+    return next(csv.reader(sample.splitlines()[:1], delimiter=sniff_delimiter(sample)), [])
+
+
+def read_csv_fast(source, engine=None):
+    """Legge un export CSV (bytes, percorso o file-like) con separatore rilevato e motore veloce.
+
+    Se una colonna ritenuta numerica dal campione contiene più avanti valori formattati
+    (es. `€ 1,234.00`), il file viene riletto trattando le colonne numeriche come stringhe.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    pos = source.tell() if hasattr(source, 'read') else None
+    sep, dtypes, numeric = _sniff(source)
+    engine = engine or default_engine()
+
+    try:
+        return pd.read_csv(source, sep=sep, engine=engine, dtype=dtypes)
+    except ValueError:
+        if not numeric: raise
+        if hasattr(source, 'seek'): source.seek(pos)
+        return pd.read_csv(source, sep=sep, engine=engine, dtype={c: str for c in dtypes})
+
+
+def read_csv_chunks(source, chunksize, as_text=False, usecols=None):
+    """Iteratore di blocchi da `chunksize` righe, con lo stesso separatore e gli stessi dtype di read_csv_fast.
+
+    Usa il motore C (pyarrow non legge a blocchi). `usecols` (nomi grezzi) limita le colonne lette.
+    Con `as_text` le colonne note sono lette come stringhe: serve se un blocco successivo contiene valori
+    formattati in una colonna ritenuta numerica dal campione (in quel caso la lettura solleva ValueError e
+    va ricominciata da capo; le righe malformate sollevano invece pandas.errors.ParserError).
+    """
+    sep, dtypes, _ = _sniff(source)
+    if as_text: dtypes = {c: str for c in dtypes}
+    if usecols is not None: dtypes = {c: t for c, t in dtypes.items() if c in usecols}
+    return pd.read_csv(source, sep=sep, engine='c', dtype=dtypes, usecols=usecols, chunksize=chunksize)
@@ -0,0 +1,132 @@
+"""Profilazione per fase di un rerun dell'app (o di uno script): tempo, righe elaborate e memoria.
+
+Le fasi sono "giri" consecutivi: ogni `lap(prof, nome)` chiude la fase iniziata al giro precedente,
+quindi lo script da misurare non va re-indentato. Con profilazione spenta `start_profile` restituisce
+None e `lap` non fa nulla.
+
+    prof = start_profile(enabled=True, use_cprofile=False)
+    df = carica(...);        lap(prof, 'Caricamento', rows=len(df))
+    df_prev = prevedi(...);  lap(prof, 'Previsione', rows=len(df_prev))
+    table = finish_profile(prof)
+
+La memoria è misurata con tracemalloc (allocazioni Python / numpy / pandas, non la RSS del processo):
+delta a fine fase e picco durante la fase. tracemalloc e cProfile rallentano il codice misurato, quindi
+i tempi assoluti con profilazione attiva sono più alti di quelli reali; le proporzioni tra fasi restano utili.
+
+tracemalloc misura l'intero processo, e in Streamlit le sessioni sono thread dello stesso processo: delta e
+picco includono le allocazioni delle altre sessioni. Avvio e arresto del tracciamento sono contati tra le
+profilazioni attive (il tracciamento si ferma solo quando l'ultima finisce), e il picco viene azzerato solo
+se la profilazione è l'unica attiva; per le fasi sovrapposte ad altre profilazioni il picco non è disponibile.
+"""
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+# tracemalloc è unico per processo: profilazioni attive (sessioni diverse) e chi ha avviato il tracciamento
+_lock = threading.Lock()
+_tracing = {'active': 0, 'started': False}
+
+
+def start_profile(enabled=True, use_cprofile=False):
+    """Inizia la profilazione di un rerun; None se disattivata."""
+    if not enabled: return None
+    with _lock:
+        if _tracing['active'] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing['started'] = True
+        _tracing['active'] += 1
+        if _tracing['active'] == 1: tracemalloc.reset_peak()
+        mem_last = tracemalloc.get_traced_memory()[0]
+    profiler = cProfile.Profile() if use_cprofile else None
+    if profiler is not None:
+        try:
+            profiler.enable()
+        except ValueError:  # un altro profiler è già attivo (es. un'altra sessione)
+            profiler = None
+    return {'stages': [], 'profiler': profiler, 'running': True, 't_last': time.perf_counter(), 'mem_last': mem_last}
+
+
+def lap(prof, name, rows=None):
+    """Chiude la fase corrente con nome `name` e `rows` righe elaborate (opzionale)."""
+    if prof is None: return
+    now = time.perf_counter()
+    with _lock:
+        current, peak = tracemalloc.get_traced_memory()
+        alone = _tracing['active'] == 1
+        prof['stages'].append({
+            'name': name, 'seconds': now - prof['t_last'], 'rows': rows,
+            'mem_delta': current - prof['mem_last'], 'mem_peak': peak - prof['mem_last'] if alone else None,
+        })
+        if alone: tracemalloc.reset_peak()
+        prof['mem_last'] = tracemalloc.get_traced_memory()[0]
+    prof['t_last'] = time.perf_counter()
+
+
+def finish_profile(prof, rest_name='Altro'):
+    """Ferma la profilazione e restituisce la tabella delle fasi (tempo, quota, righe, righe/s, memoria).
+
+    Il tempo dopo l'ultimo `lap` finisce nella fase `rest_name`. Con cProfile attivo le statistiche
+    restano in `prof['stats']` (vedi cprofile_dump / cprofile_text).
+    """
+    if prof is None: return None
+    lap(prof, rest_name)
+    if prof['profiler'] is not None:
+        prof['profiler'].disable()
+        prof['profiler'].create_stats()
+        prof['stats'] = prof['profiler'].stats
+    stop_profile(prof)
+
+    stages = pd.DataFrame(prof['stages'])
+    total = stages['seconds'].sum()
+    rows = pd.to_numeric(stages['rows'], errors='coerce')
+    return pd.DataFrame({
+        'Fase': stages['name'],
+        'Tempo (ms)': stages['seconds'] * 1000,
+        'Quota %': stages['seconds'] / total * 100 if total > 0 else 0.0,
+        'Righe': rows.astype('Int64'),
+        'Righe/s': rows / stages['seconds'].where(stages['seconds'] > 0),
+        'Memoria Δ (MB)': stages['mem_delta'] / 1024 ** 2,
+        'Picco (MB)': pd.to_numeric(stages['mem_peak'], errors='coerce').clip(lower=0) / 1024 ** 2,
+    })
+
+
+def stop_profile(prof):
+    """Rilascia il tracciamento di `prof` senza tabella (es. rerun interrotto da un'eccezione); idempotente."""
+    if prof is None: return
+    with _lock:
+        if prof.pop('running', False):
+            _tracing['active'] -= 1
+            if _tracing['active'] == 0 and _tracing['started']:
+                tracemalloc.stop()
+                _tracing['started'] = False
+
+
+# --- ESPORTAZIONE ---
+
+def profile_json(table, **meta):
+    """Tabella delle fasi in JSON, con metadati liberi (es. sorgente dati, righe, timestamp)."""
+    records = json.loads(table.to_json(orient='records'))
+    return json.dumps({**meta, 'stages': records}, indent=2, ensure_ascii=False, default=str)
+
+
+def profile_csv(table):
+    return table.to_csv(index=False)
+
+
+def cprofile_dump(prof):
+    """Statistiche cProfile nel formato di `pstats.dump_stats` (file .prof per pstats / snakeviz)."""
+    return marshal.dumps(prof['stats'])
+
+
+def cprofile_text(prof, limit=30, sort='cumulative'):
+    """Le `limit` funzioni più costose, come testo di pstats."""
+    buf = io.StringIO()
+    pstats.Stats(prof['profiler'], stream=buf).sort_stats(sort).print_stats(limit)
+    return buf.getvalue()
@@ -0,0 +1,142 @@
+"""Cache condivisa tra le sessioni del server delle tabelle pulite e dei loro aggregati.
+
+st.cache_data restituisce a ogni sessione una copia (deserializzata) del valore in cache: con più persone
+sullo stesso export il server tiene una copia dello storico pulito per sessione. Qui invece la tabella pulita
+di ogni dataset (chiave = hash del contenuto) è tenuta una volta sola nel processo, e ogni sessione ne riceve
+una copia superficiale: con il Copy-on-Write di pandas le colonne restano condivise finché nessuno le
+modifica, e una colonna aggiunta dalla sessione (es. Profitto_Operativo) occupa memoria solo in quella sessione.
+Le colonne lette dalla cache su disco in formato feather restano inoltre in memory-map.
+
+Accanto a ogni dataset si tengono gli aggregati che dipendono solo dai dati (stagionalità, totali annui,
+tabella mensile dell'Insight AI, ...), calcolati alla prima richiesta. Il primo caricamento di una chiave
+avviene una volta sola anche se più sessioni aprono lo stesso file nello stesso momento.
+
+Oltre `max_bytes` (FORECAST_SHARED_CACHE_MB, default 1 GB) vengono eliminati i dataset usati meno di recente;
+`cache_stats()` riporta voci, memoria, hit / miss ed eliminazioni.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from forecast_core import memory_footprint
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # chiave -> {'df', 'cols', 'aggregates', 'bytes'}, dal meno al più recente
+_loading = {}             # chiave -> lock del primo caricamento
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'aggregate_hits': 0, 'aggregate_misses': 0}
+
+
+def max_cache_bytes():
+    return int(float(os.environ.get('FORECAST_SHARED_CACHE_MB', DEFAULT_MAX_BYTES / 1024 ** 2)) * 1024 ** 2)
+
+
+def _nbytes(value):
+    """Memoria (deep) delle tabelle pandas contenute in `value` (anche in tuple / dict)."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(memory_footprint({'v': value}).sum())
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    return int(getattr(value, 'nbytes', 0))
+
+
+def _view(value):
+    """Copia superficiale per la sessione: modificare la copia non tocca il valore condiviso (Copy-on-Write)."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, tuple):
+        return tuple(_view(v) for v in value)
+    return value
+
+
+def _evict(keep, max_bytes):
+    """Elimina i dataset meno recenti (tranne `keep`) finché il totale supera `max_bytes`. Da chiamare con _lock."""
+    total = sum(e['bytes'] for e in _entries.values())
+    for key in list(_entries):
+        if total <= max_bytes: break
+        if key == keep: continue
+        total -= _entries.pop(key)['bytes']
+        _stats['evictions'] += 1
+
+
+def get_dataset(key, load, max_bytes=None):
+    """(df, cols) del dataset `key`; `load()` -> (df, cols) viene chiamata solo se la chiave non è in cache.
+
+    Il df restituito è una copia superficiale della tabella condivisa: aggiungere o sostituire colonne
+    non modifica le altre sessioni.
+    """
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            key_lock = _loading.setdefault(key, threading.Lock())
+        else:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+
+    if entry is None:
+        with key_lock:  # una sola sessione carica la chiave, le altre aspettano e la trovano in cache
+            with _lock:
+                entry = _entries.get(key)
+                if entry is not None:
+                    _entries.move_to_end(key)
+                    _stats['hits'] += 1
+            if entry is None:
+                try:
+                    df, cols = load()
+                    entry = {'df': df, 'cols': cols, 'aggregates': {}, 'bytes': _nbytes(df)}
+                    with _lock:
+                        _stats['misses'] += 1
+                        _entries[key] = entry
+                        _evict(key, max_cache_bytes() if max_bytes is None else max_bytes)
+                finally:
+                    with _lock:
+                        _loading.pop(key, None)  # anche se load() fallisce (es. file non valido)
+    return entry['df'].copy(deep=False), entry['cols']
+
+
+def get_aggregate(key, name, compute, max_bytes=None):
+    """Aggregato `name` del dataset `key`, calcolato da `compute()` alla prima richiesta e poi condiviso.
+
+    `name` deve includere ogni parametro da cui dipende il risultato oltre ai dati; gli aggregati di un dataset
+    non vengono eliminati finché il dataset resta in cache, quindi vanno condivisi solo valori che non dipendono
+    dalla sidebar (ciò che ne dipende si calcola a ogni rerun sull'aggregato condiviso).
+    Se il dataset è stato eliminato dalla cache l'aggregato viene calcolato senza salvarlo.
+    """
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and name in entry['aggregates']:
+            _stats['aggregate_hits'] += 1
+            return _view(entry['aggregates'][name])
+        _stats['aggregate_misses'] += 1
+
+    value = compute()
+    if entry is not None:
+        with _lock:
+            if name not in entry['aggregates']:
+                entry['aggregates'][name] = value
+                entry['bytes'] += _nbytes(value)
+            value = entry['aggregates'][name]
+            _evict(key, max_cache_bytes() if max_bytes is None else max_bytes)
+    return _view(value)
+
+
+def cache_stats():
+    """Voci, memoria e contatori della cache condivisa (dall'avvio del processo)."""
+    with _lock:
+        stats = dict(_stats)
+        stats.update(entries=len(_entries), bytes=sum(e['bytes'] for e in _entries.values()),
+                     aggregates=sum(len(e['aggregates']) for e in _entries.values()), max_bytes=max_cache_bytes())
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def clear_cache():
+    with _lock:
+        _entries.clear()
+        _stats.update(dict.fromkeys(_stats, 0))
@@ -0,0 +1,246 @@
+"""Storico persistente di un negozio, aggiornato in modo incrementale.
+
+Una cartella per negozio contiene:
+    history.csv      righe pulite (output di clean_dataframe), solo in append
+    aggregates.pkl   aggregati parziali additivi: somme / conteggi per settimana ISO, anno e mese,
+                     più il fatturato delle ultime 104 settimane per il trend YoY
+    pending.pkl      solo per export giornalieri: righe grezze dell'ultima settimana ancora incompleta,
+                     riaggregate con l'export successivo che la completa
+
+Ogni settimana si aggiunge solo l'export delle settimane nuove: la pulizia, la scrittura su disco e
+l'aggiornamento degli aggregati costano O(righe nuove). Da `aggregates.pkl` si ricostruiscono
+`seasonal`, `df_annual`, `growth_rate` e la tabella mensile dell'Insight AI con gli stessi valori
+delle funzioni di forecast_core calcolate sull'intero storico.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from forecast_core import (
+    DEFAULT_ECONOMICS, build_forecast, clean_dataframe, compute_economics, detect_columns, forecast_dates,
+    is_daily_export, parse_day_series, suggest_saturation
+)
+
+HISTORY_FILE = 'history.csv'
+AGGREGATES_FILE = 'aggregates.pkl'
+PENDING_FILE = 'pending.pkl'
+GROWTH_WINDOW = pd.Timedelta(weeks=104)
+
+
+def _sum_columns(df, cols):
+    """Colonne additive degli aggregati mensili (ai_monthly_table) presenti nei dati."""
+    keys = ['returns', 'discounts', 'google', 'meta', 'g_val', 'm_val']
+    wanted = ['Spesa_Ads_Totale', 'Fatturato_Netto', 'Orders', 'Gross sales'] + [cols[k] for k in keys]
+    return [c for c in dict.fromkeys(wanted) if c in df.columns]
+
+
+def _mean_columns(df, cols):
+    """Colonne mediate in ai_monthly_table: negli aggregati se ne tengono somma e conteggio righe."""
+    return [cols[k] for k in ['ret_rate', 'm_freq', 'm_cpm', 'g_cpc', 'm_cpc'] if cols[k] in df.columns]
+
+
+def history_aggregates(df, cols):
+    """Aggregati parziali additivi di un blocco di righe pulite."""
+    iso_week = df['Week'].to_numpy(dtype=int)
+    orders = df[cols['orders']] if cols['orders'] in df.columns else pd.Series(np.nan, index=df.index)
+    weekly = pd.DataFrame({
+        'Fatturato_Netto': df['Fatturato_Netto'], cols['google']: df[cols['google']], cols['meta']: df[cols['meta']],
+        cols['orders']: orders, '_righe': 1,
+    }, index=df.index)
+
+    monthly_cols = _sum_columns(df, cols) + _mean_columns(df, cols)
+    monthly = df[monthly_cols].assign(_righe=1, _ordini_profitto=df[cols['orders']] if cols['orders'] in df.columns else np.nan)
+    recent = df.loc[df['Data_Interna'] > df['Data_Interna'].max() - GROWTH_WINDOW]
+
+    return {
+        'cols': cols,
+        'rows': len(df),
+        'last_date': df['Data_Interna'].max(),
+        'seasonal': weekly.groupby(iso_week).sum(min_count=1),
+        'annual': df.groupby('Year')[['Spesa_Ads_Totale', 'Fatturato_Netto']].sum(),
+        'monthly': monthly.groupby(df['Data_Interna'].dt.to_period('M').rename('Month_Date')).sum(min_count=1),
+        'recent_sales': recent.groupby('Data_Interna')['Fatturato_Netto'].sum(),
+    }
+
+
+def merge_aggregates(agg, new):
+    """Somma gli aggregati di un blocco nuovo a quelli esistenti (costo proporzionale al blocco nuovo)."""
+    add = lambda a, b: a.add(b, fill_value=0).sort_index()
+    last_date = max(agg['last_date'], new['last_date'])
+    recent = pd.concat([agg['recent_sales'], new['recent_sales']])
+    recent = recent.groupby(level=0).sum()
+    return {
+        'cols': agg['cols'],
+        'rows': agg['rows'] + new['rows'],
+        'last_date': last_date,
+        'seasonal': add(agg['seasonal'], new['seasonal']),
+        'annual': add(agg['annual'], new['annual']),
+        'monthly': add(agg['monthly'], new['monthly']),
+        'recent_sales': recent[recent.index > last_date - GROWTH_WINDOW],
+    }
+
+
+# --- LETTURA DAGLI AGGREGATI (stessi risultati delle funzioni di forecast_core) ---
+
+def seasonal_from_aggregates(agg):
+    """Come seasonal_table: media per settimana ISO di fatturato, spesa Google/Meta e ordini."""
+    cols = agg['cols']
+    sums = agg['seasonal']
+    seasonal = sums[['Fatturato_Netto', cols['google'], cols['meta'], cols['orders']]].div(sums['_righe'], axis=0)
+    return seasonal.rename_axis('Week_Num').reset_index()
+
+
+def annual_from_aggregates(agg):
+    """Come annual_totals."""
+    return agg['annual'].sort_index()
+
+
+def growth_from_aggregates(agg):
+    """Come yoy_growth: ultime 52 settimane vs le 52 precedenti, dalla finestra di 104 settimane."""
+    recent, last_date = agg['recent_sales'], agg['last_date']
+    start_last_year = last_date - pd.Timedelta(weeks=52)
+    sales_ly = recent[recent.index > start_last_year].sum()
+    sales_py = recent[recent.index <= start_last_year].sum()
+    return (sales_ly - sales_py) / sales_py if sales_py > 0 else 0.0
+
+
+def monthly_from_aggregates(agg, economics):
+    """Come ai_monthly_table (con Profitto_Operativo di add_operating_profit) a partire dalle somme mensili."""
+    cols = agg['cols']
+    sums = agg['monthly'].sort_index(ascending=False)
+    mean_cols = [cols[k] for k in ['ret_rate', 'm_freq', 'm_cpm', 'g_cpc', 'm_cpc'] if cols[k] in sums.columns]
+    ai_df = sums.drop(columns=['_righe', '_ordini_profitto'])
+    ai_df[mean_cols] = sums[mean_cols].div(sums['_righe'], axis=0)
+
+    # Il profitto operativo è lineare per riga: somma ordini * profitto per ordine - somma spesa
+    orders = sums['_ordini_profitto'] if sums['_ordini_profitto'].notna().any() else sums['Fatturato_Netto'] / economics['be_aov']
+    ai_df['Profitto_Operativo'] = orders * economics['profit_order'] - sums['Spesa_Ads_Totale']
+
+    ai_df['MER'] = ai_df['Fatturato_Netto'] / ai_df['Spesa_Ads_Totale'].replace(0, np.nan)
+    ai_df['Discount_Rate'] = (ai_df[cols['discounts']].abs() / ai_df['Gross sales'].replace(0, np.nan)) * 100
+    ai_df['ROAS_Google'] = ai_df[cols['g_val']] / ai_df[cols['google']].replace(0, np.nan)
+    ai_df['ROAS_Meta'] = ai_df[cols['m_val']] / ai_df[cols['meta']].replace(0, np.nan)
+    ai_df['Seasonality'] = ai_df['Fatturato_Netto'] / ai_df['Fatturato_Netto'].mean()
+    return ai_df
+
+
+# --- PERSISTENZA ---
+
+def load_aggregates(path):
+    return pd.read_pickle(os.path.join(path, AGGREGATES_FILE))
+
+
+def load_history(path):
+    """Storico pulito completo (serve solo per grafici e tabelle di dettaglio)."""
+    return pd.read_csv(os.path.join(path, HISTORY_FILE), parse_dates=['Data_Interna'])
+
+
+def _store(df):
+    """Colonna negozio, o '' per gli storici di un solo negozio."""
+    return df['Store'] if 'Store' in df.columns else pd.Series('', index=df.index)
+
+
+def _day_keys(raw, cols):
+    """(negozio, lunedì) di ogni riga grezza di un export giornaliero, e il giorno."""
+    day = parse_day_series(raw[cols['day']])
+    monday = (day - pd.to_timedelta(day.dt.weekday, unit='D')).dt.normalize()
+    return pd.MultiIndex.from_arrays([_store(raw).to_numpy(), monday.to_numpy()]), day
+
+
+def _split_daily(df, first_batch):
+    """Righe settimanali di un export giornaliero: (da salvare, settimane ancora aperte in coda).
+
+    Le settimane incomplete in coda (dopo l'ultima completa del negozio) restano in attesa dei giorni
+    mancanti; quelle in testa sono scartate solo al primo caricamento, come fa rollup_daily sullo storico intero.
+    """
+    store = _store(df)
+    complete = df['Data_Interna'].where(df['Giorni'] >= 7)
+    first = complete.groupby(store).transform('min')
+    last = complete.groupby(store).transform('max')
+    open_tail = last.isna() | (df['Data_Interna'] > last)
+    leading = first_batch & first.notna() & (df['Data_Interna'] < first)
+    return ~open_tail & ~leading, open_tail
+
+
+def append_history(path, df_raw):
+    """Aggiunge allo storico persistente in `path` le settimane nuove di un export (crea lo storico se manca).
+
+    Le righe con data già presente (<= ultima settimana salvata) vengono scartate. Per gli export giornalieri
+    l'ultima settimana incompleta non viene persa: i suoi giorni restano in `pending.pkl` e vengono riaggregati
+    con l'export successivo. Restituisce un report con righe aggiunte / scartate / in attesa, ultima settimana
+    e tempo impiegato.
+    """
+    t0 = time.perf_counter()
+    os.makedirs(path, exist_ok=True)
+    history_path, agg_path = os.path.join(path, HISTORY_FILE), os.path.join(path, AGGREGATES_FILE)
+    pending_path = os.path.join(path, PENDING_FILE)
+    agg = load_aggregates(path) if os.path.exists(agg_path) else None
+
+    raw = df_raw.dropna(how='all').rename(columns=str.strip)
+    raw_cols = detect_columns(raw.columns)
+    daily = is_daily_export(raw, raw_cols)
+    if daily and os.path.exists(pending_path):
+        # I giorni già in attesa si uniscono all'export; a parità di giorno vale quello nuovo
+        raw = pd.concat([pd.read_pickle(pending_path), raw], ignore_index=True)
+        keys, day = _day_keys(raw, raw_cols)
+        raw = raw[~pd.DataFrame({'k': keys, 'd': day.to_numpy()}).duplicated(keep='last').to_numpy()]
+
+    df, cols = clean_dataframe(raw, trim_edges=not daily)
+    keep = pd.Series(True, index=df.index)
+    open_tail = pd.Series(False, index=df.index)
+    if daily:
+        keep, open_tail = _split_daily(df, first_batch=agg is None)
+    if agg is not None:
+        keep &= df['Data_Interna'] > agg['last_date']
+        columns = pd.read_csv(history_path, nrows=0).columns
+        new_rows = df[keep].reindex(columns=columns)
+        cols = agg['cols']
+    else:
+        new_rows = df[keep]
+
+    if daily:
+        tail = df[open_tail]
+        waiting = pd.MultiIndex.from_arrays([_store(tail).to_numpy(), tail['Data_Interna'].to_numpy()])
+        pending = raw[_day_keys(raw, raw_cols)[0].isin(waiting)]
+        if len(pending): pd.to_pickle(pending, pending_path)
+        elif os.path.exists(pending_path): os.remove(pending_path)
+
+    skipped = len(df) - len(new_rows) - int(open_tail.sum())
+    if len(new_rows):
+        new_agg = history_aggregates(new_rows, cols)
+        agg = new_agg if agg is None else merge_aggregates(agg, new_agg)
+        new_rows.to_csv(history_path, mode='a', header=not os.path.exists(history_path), index=False)
+        pd.to_pickle(agg, agg_path)
+
+    return {
+        'Righe Aggiunte': len(new_rows), 'Righe Scartate': skipped, 'Righe In Attesa': int(open_tail.sum()),
+        'Righe Totali': agg['rows'] if agg else 0, 'Ultima Settimana': agg['last_date'] if agg else None,
+        'Tempo (s)': time.perf_counter() - t0,
+    }
+
+
+def forecast_from_store(path, economics=None, mesi_prev=6, manual_trend=0.0, m_google=1.0, m_meta=1.0, sat_factor=None):
+    """Come run_pipeline, ma dai soli aggregati persistiti: non rilegge né ripulisce lo storico.
+
+    Restituisce lo stesso dizionario di run_pipeline con `df` = None (lo storico completo si carica
+    con load_history solo se serve) e `ai_df` già calcolata.
+    """
+    economics = economics or compute_economics(**DEFAULT_ECONOMICS)
+    agg = load_aggregates(path)
+    cols = agg['cols']
+    df_annual = annual_from_aggregates(agg)
+    suggested_saturation = float(suggest_saturation(df_annual))
+    growth_rate = growth_from_aggregates(agg)
+    sat_factor = suggested_saturation if sat_factor is None else sat_factor
+
+    seasonal = seasonal_from_aggregates(agg)
+    future_dates = forecast_dates(agg['last_date'], mesi_prev)
+    df_prev = build_forecast(seasonal, future_dates, growth_rate, manual_trend, m_google, m_meta, sat_factor,
+                             economics['be_aov'], cols['google'], cols['meta'])
+    return {
+        'df': None, 'cols': cols, 'df_annual': df_annual, 'seasonal': seasonal, 'df_prev': df_prev,
+        'growth_rate': growth_rate, 'suggested_saturation': suggested_saturation, 'sat_factor': sat_factor,
+        'ai_df': monthly_from_aggregates(agg, economics),
+    }
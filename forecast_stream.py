@@ -0,0 +1,121 @@
+"""Lettura a blocchi degli export molto grandi (giornalieri / per SKU), con memoria limitata.
+
+read_csv_fast + clean_dataframe tengono in memoria l'intero export e ne fanno più copie complete durante la
+pulizia: con export da diversi GB la memoria del container non basta. Qui il CSV viene letto a blocchi di
+`chunksize` righe; ogni blocco è pulito con le stesse regole (clean_currency_series, clean_percentage_series,
+parse_iso_week_series / parse_day_series) e ridotto subito a somme per settimana ISO (e per negozio, se c'è
+la colonna `Store`), sommate a quelle dei blocchi precedenti. Il picco di memoria dipende dalla dimensione del
+blocco e dal numero di settimane (per negozio), non dalle righe del file: i giorni presenti in ogni settimana
+sono tenuti come bitmask di 7 bit (week_day_mask) unite con OR tra i blocchi.
+
+Alla fine le somme diventano una riga per negozio e settimana con rollup_sums, come in rollup_daily (medie per
+CPC, CPM, frequenza e tasso clienti di ritorno, AOV ricalcolato come fatturato / ordini, settimane parziali ai
+bordi scartate per gli export giornalieri) e passano da clean_dataframe come un normale export settimanale.
+Differenze rispetto alla lettura completa: restano solo le colonne note, e un export settimanale con più righe
+per settimana (es. una per SKU) è ridotto a una riga per settimana.
+"""
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from forecast_core import (
+    clean_currency_series, clean_dataframe, clean_percentage_series, detect_columns, parse_day_series,
+    mask_days, parse_iso_week_series, rollup_sums, rollup_value_columns, week_day_mask
+)
+from forecast_io import csv_header, read_csv_chunks
+
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def _clean_column(col, c, cols):
+    if c == cols['ret_rate']: return clean_percentage_series(col)
+    if c in (cols['g_imps'], cols['m_freq'], cols['items']): return pd.to_numeric(col, errors='coerce').fillna(0)
+    return clean_currency_series(col)
+
+
+def chunk_partials(chunk, cols):
+    """Somme e giorni presenti (week_day_mask) per (negozio,) lunedì della settimana ISO di un blocco, più le settimane distinte."""
+    chunk = chunk.dropna(how='all')
+    if cols['day']:
+        day = parse_day_series(chunk[cols['day']]).to_numpy(dtype='datetime64[D]')
+    else:
+        day = parse_iso_week_series(chunk[cols['date']]).to_numpy(dtype='datetime64[D]')
+    valid = ~np.isnat(day)
+    days = day[valid].astype(np.int64)
+    monday = days - (days + 3) % 7  # il giorno 0 (1970-01-01) è un giovedì
+
+    sum_cols, mean_cols = rollup_value_columns(cols)
+    data = {c: _clean_column(chunk[c][valid], c, cols).to_numpy(dtype=float)
+            for c in sum_cols + mean_cols if c in chunk.columns}
+    data['_righe'] = np.ones(len(days), dtype=np.int64)
+    keys = [chunk['Store'][valid].to_numpy(), monday] if 'Store' in chunk.columns else [monday]
+    sums = pd.DataFrame(data).groupby(keys, sort=False, dropna=False).sum()
+    weeks = np.unique(chunk[cols['date']].dropna().to_numpy(dtype=str)) if cols['day'] and cols['date'] else None
+    return sums, week_day_mask(keys, days), weeks
+
+
+def stream_clean(source, chunksize=DEFAULT_CHUNKSIZE, progress=None):
+    """Come clean_dataframe(read_csv_fast(source)), leggendo a blocchi e riducendo subito a settimane.
+
+    `source` è un percorso, dei byte o un file-like posizionabile. `progress(frazione, righe)` viene chiamata
+    dopo ogni blocco con la frazione del file già letta. Restituisce (df, cols) come clean_dataframe.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    f = source if hasattr(source, 'read') else open(source, 'rb')
+    try:
+        start = f.tell()
+        size = f.seek(0, os.SEEK_END) - start
+        f.seek(start)
+        header = csv_header(f)
+        cols = detect_columns([c.strip() for c in header])
+        if not cols['date'] and not cols['day']:
+            raise ValueError("Manca colonna data.")
+        # Si leggono solo le colonne che entrano nelle somme settimanali
+        sum_cols, mean_cols = rollup_value_columns(cols)
+        wanted = {'Store', cols['date'], cols['day'], *sum_cols, *mean_cols}
+        usecols = [c for c in header if c.strip() in wanted]
+
+        result = _fold_chunks(f, cols, usecols, chunksize, False, size, start, progress)
+        if result is None:
+            f.seek(start)  # valori formattati in una colonna ritenuta numerica: si ricomincia come testo
+            result = _fold_chunks(f, cols, usecols, chunksize, True, size, start, progress)
+        return result
+    finally:
+        if f is not source: f.close()
+
+
+def _fold_chunks(f, cols, usecols, chunksize, as_text, size, start, progress):
+    """Somma i blocchi e restituisce (df, cols); None se un valore non entra nei dtype numerici del campione."""
+    sums, mask, weeks, n_rows = None, None, None, 0
+    reader = read_csv_chunks(f, chunksize, as_text=as_text, usecols=usecols)
+    while True:
+        try:
+            chunk = next(reader)
+        except StopIteration:
+            break
+        except pd.errors.ParserError:
+            raise
+        except ValueError:
+            if as_text: raise
+            return None
+        chunk.columns = chunk.columns.str.strip()
+        part, part_mask, part_weeks = chunk_partials(chunk, cols)
+        sums = part if sums is None else sums.add(part, fill_value=0)
+        if mask is None:
+            mask = part_mask
+        else:
+            mask, part_mask = mask.align(part_mask, fill_value=0)
+            mask = pd.Series(mask.to_numpy(dtype=np.uint8) | part_mask.to_numpy(dtype=np.uint8), index=mask.index)
+        if part_weeks is not None: weeks = part_weeks if weeks is None else np.union1d(weeks, part_weeks)
+        n_rows += len(chunk)
+        if progress: progress(min((f.tell() - start) / size, 1.0) if size else 1.0, n_rows)
+
+    if sums is None:
+        raise ValueError("File vuoto.")
+    # Stesso criterio di is_daily_export: più giorni distinti che settimane
+    n_days = mask_days(mask.groupby(level=-1).agg(np.bitwise_or.reduce)).sum()
+    daily = bool(cols['day']) and (weeks is None or n_days > len(weeks))
+    return clean_dataframe(rollup_sums(sums, cols, mask if daily else None))